@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark the Foreman client against an in-process stub server
+
+Measures throughput and latency of the client without a Foreman server or
+network access. Results can be saved as JSON and compared with a previous run
+to catch performance regressions.
+
+"""
+import sys, getopt
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from foreman.foreman import Foreman, map_concurrent
+from foreman.testing import StubForeman
+
+BENCHMARKS = ['get_resources', 'search_resource', 'get_resource_by_name', 'power', 'backup']
+
+
+def show_help():
+    """Print on screen how to use this script.
+    """
+    print('run_benchmarks.py [-n <hosts>] [-l <latency>] [-j <concurrency>] [-k <operations>] [-P <per_page>]'
+          ' [-b <benchmark,...>] [-o <result_file>] [-c <baseline_file>] [-t <tolerance>]')
+    print('benchmarks: ' + ', '.join(BENCHMARKS))
+
+
+def percentile(values, percent):
+    """Return the percentile of a list of values
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100.0 * (len(values) - 1))))]
+
+
+def measure(name, func, items, concurrency, stub, count_items=None):
+    """Call func for every item and measure throughput and latency
+
+    Args:
+      name (str): Name of the benchmark
+      func (def): Function to call with one item, may return the number of items processed
+      items (list): Items to call func with
+      concurrency (int): Number of calls at the same time
+      stub (StubForeman): Stub server to count requests on
+      count_items (bool): Report items processed per second instead of calls per second
+    Returns:
+      dict
+    """
+    def timed(item):
+        start = time.time()
+        result = func(item)
+        return time.time() - start, result
+
+    requests = stub.requests
+    start = time.time()
+    results = list(map_concurrent(timed, items, concurrency=concurrency, ordered=False))
+    seconds = time.time() - start
+    latencies = [latency for latency, _ in results]
+    operations = sum(result for _, result in results) if count_items else len(results)
+    return {'benchmark': name,
+            'operations': operations,
+            'seconds': seconds,
+            'per_second': operations / seconds if seconds else 0.0,
+            'requests': stub.requests - requests,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': max(latencies) if latencies else 0.0}
+
+
+def run_benchmarks(stub, benchmarks, concurrency, operations, per_page):
+    """Run the benchmarks against a started stub
+
+    Returns:
+      list of dict
+    """
+    def create_foreman(**kwargs):
+        return Foreman(stub.host, str(stub.port), 'admin', 'secret', protocol='http',
+                       pool_maxsize=max(concurrency, 10), **kwargs)
+
+    rnd = random.Random(1)
+    hosts = stub.data['hosts']
+    sample = rnd.sample(hosts, min(operations, len(hosts)))
+    results = []
+
+    if 'get_resources' in benchmarks:
+        foreman = create_foreman()
+        for page_concurrency in sorted(set([1, concurrency])):
+            results.append(measure('get_resources hosts (concurrency %d)' % page_concurrency,
+                                   lambda _: len(foreman.get_resources(resource_type='hosts', per_page=per_page,
+                                                                       concurrency=page_concurrency)),
+                                   [None], concurrency=1, stub=stub, count_items=True))
+        foreman.close()
+
+    if 'search_resource' in benchmarks:
+        foreman = create_foreman()
+        results.append(measure('search_resource hosts by name',
+                               lambda host: foreman.search_resource(resource_type='hosts',
+                                                                    search_data={'name': host['name']}),
+                               sample, concurrency=concurrency, stub=stub))
+        results.append(measure('search_resource hosts by hostgroup',
+                               lambda host: foreman.search_resource(resource_type='hosts',
+                                                                    search_data={'hostgroup_id': host['hostgroup_id']},
+                                                                    per_page=per_page),
+                               sample[:max(len(sample) // 10, 1)], concurrency=concurrency, stub=stub))
+        foreman.close()
+
+    if 'get_resource_by_name' in benchmarks:
+        for name_cache_size in [0, len(sample)]:
+            foreman = create_foreman(name_cache_size=name_cache_size)
+            label = 'get_resource hosts by name (%s)' % ('name cache' if name_cache_size else 'no cache')
+            results.append(measure(label,
+                                   lambda host: foreman.get_resource(resource_type='hosts',
+                                                                     data={'name': host['name']}),
+                                   sample, concurrency=concurrency, stub=stub))
+            if name_cache_size:
+                results.append(measure(label + ' warm',
+                                       lambda host: foreman.get_resource(resource_type='hosts',
+                                                                         data={'name': host['name']}),
+                                       sample, concurrency=concurrency, stub=stub))
+            foreman.close()
+
+    if 'power' in benchmarks:
+        foreman = create_foreman()
+        host_ids = [host['id'] for host in sample]
+        results.append(measure('set_hosts_power state',
+                               lambda _: len(foreman.get_hosts_power(host_ids=host_ids, concurrency=concurrency)),
+                               [None], concurrency=1, stub=stub, count_items=True))
+        results.append(measure('set_host_power start (single calls)',
+                               lambda host_id: foreman.set_host_power(host_id=host_id, action='start'),
+                               host_ids, concurrency=concurrency, stub=stub))
+        foreman.close()
+
+    if 'backup' in benchmarks:
+        from foreman.backup import ForemanBackup
+        for output_format in ['files', 'ndjson']:
+            backup_root = tempfile.mkdtemp(prefix='foreman-benchmark-')
+            try:
+                backup = ForemanBackup(stub.host, str(stub.port), 'admin', 'secret',
+                                       concurrency=concurrency, resource_concurrency=2,
+                                       output_format=output_format, progress_interval=0,
+                                       output=io.StringIO() if sys.version_info[0] > 2 else io.BytesIO(),
+                                       protocol='http')
+
+                def run_backup(_):
+                    errors = backup.run(backup_root=backup_root)
+                    if errors:
+                        raise RuntimeError('Backup failed: %s' % errors[0])
+                    return sum(len(items) for items in stub.data.values())
+
+                results.append(measure('ForemanBackup.run (%s)' % output_format, run_backup, [None],
+                                       concurrency=1, stub=stub, count_items=True))
+            finally:
+                shutil.rmtree(backup_root, ignore_errors=True)
+
+    return results
+
+
+def print_results(results):
+    """Print results as table
+    """
+    print('%-45s %9s %9s %11s %9s %8s %8s %8s' % ('benchmark', 'ops', 'seconds', 'ops/s', 'requests',
+                                                  'p50 ms', 'p95 ms', 'p99 ms'))
+    for result in results:
+        print('%-45s %9d %9.3f %11.1f %9d %8.2f %8.2f %8.2f' % (result['benchmark'], result['operations'],
+                                                                result['seconds'], result['per_second'],
+                                                                result['requests'], result['p50'] * 1000,
+                                                                result['p95'] * 1000, result['p99'] * 1000))
+
+
+def compare_results(results, baseline, tolerance):
+    """Print benchmarks slower than the baseline
+
+    Returns:
+      list of names of the benchmarks which regressed
+    """
+    baseline = dict((result['benchmark'], result) for result in baseline)
+    regressions = []
+    for result in results:
+        previous = baseline.get(result['benchmark'])
+        if not previous or not previous['per_second']:
+            continue
+        change = result['per_second'] / previous['per_second'] - 1
+        if change < -tolerance:
+            regressions.append(result['benchmark'])
+            print('REGRESSION %s: %.1f ops/s, baseline %.1f ops/s (%+.0f%%)' % (result['benchmark'],
+                                                                             result['per_second'],
+                                                                             previous['per_second'],
+                                                                             change * 100))
+    return regressions
+
+
+def main(argv):
+    """ Main
+
+    Start the stub server and run the benchmarks
+    """
+    hosts = 10000
+    latency = 0.001
+    concurrency = 10
+    operations = 1000
+    per_page = 100
+    benchmarks = BENCHMARKS
+    result_file = None
+    baseline_file = None
+    tolerance = 0.2
+
+    try:
+        opts, args = getopt.getopt(argv,
+                                   "b:c:hj:k:l:n:o:P:t:",
+                                   ["benchmarks=", "compare=", "concurrency=", "operations=", "latency=",
+                                    "hosts=", "output=", "per-page=", "tolerance="])
+    except getopt.GetoptError:
+        show_help()
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ('-b', '--benchmarks'):
+            benchmarks = arg.split(',')
+        elif opt in ('-c', '--compare'):
+            baseline_file = arg
+        elif opt == '-h':
+            show_help()
+            sys.exit()
+        elif opt in ('-j', '--concurrency'):
+            concurrency = int(arg)
+        elif opt in ('-k', '--operations'):
+            operations = int(arg)
+        elif opt in ('-l', '--latency'):
+            latency = float(arg)
+        elif opt in ('-n', '--hosts'):
+            hosts = int(arg)
+        elif opt in ('-o', '--output'):
+            result_file = arg
+        elif opt in ('-P', '--per-page'):
+            per_page = int(arg)
+        elif opt in ('-t', '--tolerance'):
+            tolerance = float(arg)
+
+    unknown = [benchmark for benchmark in benchmarks if benchmark not in BENCHMARKS]
+    if unknown:
+        print('Unknown benchmark: ' + ', '.join(unknown))
+        show_help()
+        sys.exit(2)
+
+    start = time.time()
+    stub = StubForeman(hosts=hosts, latency=latency)
+    print('Stub Foreman with %d hosts, %.1f ms latency, generated in %.1f s'
+          % (hosts, latency * 1000, time.time() - start))
+    with stub:
+        results = run_benchmarks(stub=stub, benchmarks=benchmarks, concurrency=concurrency,
+                                 operations=operations, per_page=per_page)
+    print_results(results)
+
+    if result_file:
+        with open(result_file, 'w') as output:
+            json.dump({'hosts': hosts, 'latency': latency, 'concurrency': concurrency,
+                       'results': results}, output, indent=1, sort_keys=True)
+
+    if baseline_file:
+        with open(baseline_file, 'r') as baseline:
+            if compare_results(results, json.load(baseline).get('results', []), tolerance):
+                sys.exit(1)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1 +1,11 @@
-from .foreman import Foreman
\ No newline at end of file
+import sys
+
+from .foreman import Foreman
+from .metrics import MetricsCollector
+from .records import Record, RecordFactory
+from .retry import RetryPolicy
+from .search import Condition, SearchQuery
+from .throttle import RequestGovernor
+
+if sys.version_info >= (3, 6):
+    from .async_foreman import AsyncForeman
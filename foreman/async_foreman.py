@@ -0,0 +1,557 @@
+'''
+Asynchronous Foreman client for asyncio applications.
+
+Requires Python 3.6+ (asynchronous generators and comprehensions) and aiohttp.
+'''
+
+import asyncio
+import json
+import ssl
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .foreman import ForemanBase, ForemanError, FOREMAN_REQUEST_HEADERS, FOREMAN_PER_PAGE, \
+    FOREMAN_POOL_MAXSIZE, FOREMAN_CONCURRENCY, FOREMAN_NAME_CACHE_TTL, FOREMAN_MAX_SEARCH_LENGTH
+from .compute import ComputeAttributeMatrix
+from .throttle import clock
+
+
+class _GovernorLimit(object):
+    """Asynchronous counterpart of RequestGovernor.limit
+
+    Waits for the rate tokens and in flight slots of a request without
+    blocking the event loop, so one governor can be shared with Foreman
+    objects used by other threads.
+    """
+    def __init__(self, governor, method):
+        self.governor = governor
+        self.method = method
+
+    async def __aenter__(self):
+        start = clock()
+        delay = self.governor.reserve(self.method)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.governor.acquire(self.method, start=start, blocking=False):
+            return
+        # Wake up each time a slot is freed, by this loop or any other thread
+        loop = asyncio.get_event_loop()
+        released = asyncio.Event()
+
+        def notify():
+            loop.call_soon_threadsafe(released.set)
+
+        self.governor.add_listener(notify)
+        try:
+            while True:
+                released.clear()
+                if self.governor.acquire(self.method, start=start, blocking=False):
+                    return
+                await released.wait()
+        finally:
+            self.governor.remove_listener(notify)
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.governor.release(self.method)
+
+
+class AsyncForeman(ForemanBase):
+    """AsyncForeman Class
+
+    Communicate with Foreman via API v2 from an asyncio event loop.
+
+    The resource methods of Foreman (get_*, set_*/create_*, delete_*,
+    get_resource, search_resource, put_resource, the power helpers) are
+    available with the same arguments but return awaitables.
+    get_resources(stream=True) and iter_resources return asynchronous
+    generators.
+
+    Requests share one aiohttp connection pool. The number of requests in
+    flight at the same time is limited by max_concurrency. There is no
+    response cache, response_cache_stats always returns None.
+    """
+    def __init__(self, hostname, port, username, password,
+                 pool_maxsize=FOREMAN_POOL_MAXSIZE,
+                 max_concurrency=FOREMAN_POOL_MAXSIZE,
+                 keep_alive=True,
+                 verify=False,
+                 cert=None,
+                 name_cache_size=0,
+                 name_cache_ttl=FOREMAN_NAME_CACHE_TTL,
+                 retry_policy=None,
+                 governor=None,
+                 hooks=None,
+                 protocol='https',
+                 json_backend=None):
+        """Init
+
+        Args:
+          hostname (str): Foreman host name
+          port (str): Foreman HTTPS port
+          username (str): Username to authenticate with
+          password (str): Password to authenticate with
+          pool_maxsize (int): Maximum number of connections kept open to Foreman
+          max_concurrency (int): Maximum number of requests in flight at the same time
+          keep_alive (bool): Reuse connections between requests
+          verify (bool or str): Verify the server certificate. A path to a CA bundle
+                                can be passed to verify against a private CA.
+          cert (str or tuple): Client certificate file or tuple of (cert, key) files
+          name_cache_size (int): Number of name to id resolutions to cache, 0 disables the cache
+          name_cache_ttl (int): Seconds a cached name to id resolution is valid
+          retry_policy (RetryPolicy): Retry transient failures, see Foreman
+          governor (RequestGovernor): Limit request rate and requests in flight, see Foreman.
+                                      Can be shared with Foreman objects.
+          hooks (dict): Event name -> function or list of functions, see Foreman.add_hook
+          protocol (str): https or http
+          json_backend (str): orjson, ujson, simplejson or json. Defaults to the
+                              fastest one installed.
+        """
+        if aiohttp is None:
+            raise ImportError('AsyncForeman requires aiohttp')
+        ForemanBase.__init__(self, hostname, port,
+                             name_cache_size=name_cache_size,
+                             name_cache_ttl=name_cache_ttl,
+                             retry_policy=retry_policy,
+                             governor=governor,
+                             hooks=hooks,
+                             protocol=protocol,
+                             json_backend=json_backend)
+        self.__auth = aiohttp.BasicAuth(username, password)
+        self._pool_maxsize = pool_maxsize
+        self._max_concurrency = max_concurrency
+        self._keep_alive = keep_alive
+        self._ssl = self._create_ssl_context(verify=verify, cert=cert)
+        self._session = None
+        self._semaphore = None
+
+    def __enter__(self):
+        raise TypeError('Use "async with" with AsyncForeman')
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def _create_ssl_context(self, verify, cert):
+        """Create the SSL context used by the connection pool
+
+        Args:
+          verify (bool or str): Verify server certificate or path to CA bundle
+          cert (str or tuple): Client certificate
+        Returns:
+          ssl.SSLContext or False
+        """
+        if not verify and not cert:
+            return False
+        if isinstance(verify, str):
+            context = ssl.create_default_context(cafile=verify)
+        else:
+            context = ssl.create_default_context()
+        if not verify:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        if cert:
+            if isinstance(cert, str):
+                context.load_cert_chain(cert)
+            else:
+                context.load_cert_chain(*cert)
+        return context
+
+    def _get_session(self):
+        """Return the aiohttp session, create it inside the running event loop if needed
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self._pool_maxsize,
+                                             ssl=self._ssl,
+                                             force_close=not self._keep_alive)
+            self._session = aiohttp.ClientSession(connector=connector, auth=self.__auth)
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        return self._session
+
+    async def close(self):
+        """Close all pooled connections
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self, method, url, **kwargs):
+        """Send a request through the pooled session
+
+        Every attempt waits for the governor. Connection errors and transient
+        status codes are retried as defined by the retry policy. The
+        concurrency slot is released while waiting.
+
+        Args:
+          method (str): HTTP verb
+          url (str): URL to request
+          kwargs: Passed to aiohttp.ClientSession.request
+        Returns:
+          tuple of status code, URL and body
+        """
+        session = self._get_session()
+        attempt = 0
+        while True:
+            info = None
+            if self._has_hooks():
+                info = self._create_request_info(method=method, url=url, attempt=attempt, body=kwargs.get('data'))
+                self._call_hooks('before_request', info)
+            try:
+                async with self._semaphore, _GovernorLimit(self.governor, method):
+                    start = clock()
+                    async with session.request(method=method, url=url, **kwargs) as req:
+                        body = await req.text()
+                        status, req_url, retry_after = req.status, str(req.url), req.headers.get('Retry-After')
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if info is not None:
+                    info.update(elapsed=clock() - start, error=e)
+                    self._call_hooks('on_error', info)
+                if not self.retry_policy.is_retryable(method=method, attempt=attempt):
+                    if attempt:
+                        self._count_retry(attempt=attempt, failed=True)
+                    raise
+                delay = self.retry_policy.get_delay(attempt=attempt)
+            else:
+                if info is not None:
+                    info.update(elapsed=clock() - start, status_code=status, bytes_received=len(body.encode('utf-8')))
+                    self._call_hooks('after_response', info)
+                    if status >= 400:
+                        self._call_hooks('on_error', info)
+                if not self.retry_policy.is_retryable(method=method, attempt=attempt, status_code=status):
+                    if attempt and status in self.retry_policy.status_codes:
+                        self._count_retry(attempt=attempt, failed=True)
+                    return status, req_url, body
+                delay = self.retry_policy.get_delay(attempt=attempt, retry_after=retry_after)
+            if info is not None:
+                info['delay'] = delay
+                self._call_hooks('on_retry', info)
+            self._count_retry(attempt=attempt)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def _handle_response(self, status, url, body, status_codes):
+        """Decode a response or raise ForemanError
+
+        Args:
+          status (int): HTTP status code
+          url (str): URL of the request
+          body (str): Response body
+          status_codes (list): Status codes treated as success
+        Returns:
+          Dict
+        """
+        if status in status_codes:
+            return self._loads(body)
+        raise ForemanError.from_response(url=url, status_code=status, body=body)
+
+    async def _get_request(self, url, data=None):
+        params = None
+        if data:
+            params = dict((key, str(value)) for key, value in data.items())
+        status, url, body = await self._request('GET', url=url, params=params)
+        return self._handle_response(status=status, url=url, body=body, status_codes=[200])
+
+    async def _post_request(self, url, data):
+        status, url, body = await self._request('POST',
+                                                url=url,
+                                                data=json.dumps(data),
+                                                headers=FOREMAN_REQUEST_HEADERS)
+        return self._handle_response(status=status, url=url, body=body, status_codes=[200, 201])
+
+    async def _put_request(self, url, data):
+        status, url, body = await self._request('PUT',
+                                                url=url,
+                                                data=json.dumps(data),
+                                                headers=FOREMAN_REQUEST_HEADERS)
+        return self._handle_response(status=status, url=url, body=body, status_codes=[200])
+
+    async def _delete_request(self, url):
+        status, url, body = await self._request('DELETE',
+                                                url=url,
+                                                headers=FOREMAN_REQUEST_HEADERS)
+        return self._handle_response(status=status, url=url, body=body, status_codes=[200])
+
+    async def iter_resources(self, resource_type, per_page=FOREMAN_PER_PAGE, search=None, concurrency=1, ordered=True,
+                             order=None, fields=None, records=False, thin=False):
+        """ Iterate asynchronously over all resources of the defined resource type
+
+        See Foreman.iter_resources. If concurrency is greater than 1 the remaining
+        pages are requested in windows of concurrency pages at the same time.
+
+        Args:
+           resource_type (str): Type of resources to get
+           per_page (int): Number of resources to request per page
+           search (str, dict, Condition or SearchQuery): Search query to filter the resources
+           concurrency (int): Number of pages to fetch at the same time
+           ordered (bool): Yield pages in order if fetched concurrently
+           order (str): Field to order by, optionally followed by ASC or DESC
+           fields (list): Keep only these keys of each resource
+           records (bool or RecordFactory): Yield compact read-only Records instead of dicts
+           thin (bool): Only return id and name of the resources
+        Returns:
+           asynchronous generator of dict or Record
+        """
+        url = self._get_resource_url(resource_type=resource_type)
+        search, per_page, order = self._get_search(search=search, per_page=per_page, order=order)
+        convert = self._get_converter(fields=fields, records=records)
+        request_result = await self._get_page(url=url, page=1, per_page=per_page, search=search, order=order,
+                                              thin=thin)
+        results = request_result.get('results') or []
+        for item in self._convert_results(results, convert):
+            yield item
+
+        page_size = int(request_result.get('per_page') or per_page or len(results))
+        total = request_result.get('subtotal', request_result.get('total'))
+        if not results or len(results) < page_size or total is None:
+            return
+
+        pages = list(range(2, (int(total) + page_size - 1) // page_size + 1))
+        window = max(concurrency, 1)
+        for start in range(0, len(pages), window):
+            requests = [self._get_page(url=url, page=page, per_page=page_size, search=search, order=order,
+                                       thin=thin)
+                        for page in pages[start:start + window]]
+            if ordered:
+                for page_result in await asyncio.gather(*requests):
+                    for item in self._convert_results(page_result.get('results') or [], convert):
+                        yield item
+            else:
+                for request in asyncio.as_completed(requests):
+                    page_result = await request
+                    for item in self._convert_results(page_result.get('results') or [], convert):
+                        yield item
+
+    def get_resources(self, resource_type, stream=False, per_page=FOREMAN_PER_PAGE, search=None,
+                      concurrency=1, ordered=True, order=None, fields=None, records=False, thin=False):
+        """ Return all resources of the defined resource type
+
+        Args:
+           resource_type (str): Type of resources to get
+           stream (bool): Return an asynchronous generator instead of an awaitable list
+           per_page (int): Number of resources to request per page
+           search (str, dict, Condition or SearchQuery): Search query to filter the resources
+           concurrency (int): Number of pages to fetch at the same time
+           ordered (bool): Keep the order of pages if fetched concurrently
+           order (str): Field to order by, optionally followed by ASC or DESC
+           fields (list): Keep only these keys of each resource
+           records (bool or RecordFactory): Return compact read-only Records instead of dicts
+           thin (bool): Only return id and name of the resources
+        Returns:
+           awaitable list or asynchronous generator of dict or Record
+        """
+        resources = self.iter_resources(resource_type=resource_type, per_page=per_page, search=search,
+                                        concurrency=concurrency, ordered=ordered, order=order,
+                                        fields=fields, records=records, thin=thin)
+        if stream:
+            return resources
+        return _collect(resources)
+
+    async def get_resource(self, resource_type, resource_id=None, data=None):
+        """ Get information about a resource
+
+        See Foreman.get_resource.
+        """
+        resource_id, cached, search = self._get_known_id(resource_type=resource_type, data=data)
+        if search:
+            resource = await self.search_resource(resource_type=resource_type, search_data=data)
+            resource_id = self._get_found_id(resource_type=resource_type, data=data, resource=resource)
+        if not resource_id:
+            return None
+
+        try:
+            resource = await self._get_request(url=self._get_resource_url(resource_type=resource_type,
+                                                                          resource_id=resource_id))
+        except ForemanError as e:
+            if not cached or e.status_code != 404:
+                raise
+            resource = None
+        if cached and self._is_stale(data=data, resource=resource):
+            self._name_cache.invalidate(resource_type, name=data.get('name'))
+            return await self.get_resource(resource_type=resource_type, data=data)
+        return resource
+
+    async def put_resource(self, resource_type, resource_id, data, component=None, minimal=False, current=None):
+        """ Execute a put request to update a resource
+
+        See Foreman.put_resource.
+        """
+        if minimal and not component:
+            if current is None:
+                current = await self.get_resource(resource_type=resource_type, data={'id': resource_id})
+            data = self._get_changed_data(resource_type=resource_type, resource_id=resource_id, data=data,
+                                          current=current)
+            if data is None:
+                return current
+        return await self._put_request(url=self._get_put_url(resource_type=resource_type,
+                                                             resource_id=resource_id,
+                                                             component=component),
+                                       data=data)
+
+    async def search_resource(self, resource_type, search_data=None, order=None, per_page=None):
+        """ Search resources
+
+        See Foreman.search_resource.
+        """
+        data = self._get_search_params(search_data=search_data, order=order, per_page=per_page)
+        return self._get_search_result(await self._get_request(url=self._get_resource_url(resource_type=resource_type),
+                                                               data=data))
+
+    async def search_resources(self, resource_type, key, values, max_search_length=FOREMAN_MAX_SEARCH_LENGTH,
+                               concurrency=FOREMAN_CONCURRENCY):
+        """ Search many resources by the values of one field
+
+        See Foreman.search_resources.
+        """
+        values = list(set(values))
+        value_map = self._get_value_map(values)
+        searches = self._get_batch_searches(key=key, values=values, max_search_length=max_search_length)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def search(batch):
+            async with semaphore:
+                return await self.get_resources(resource_type=resource_type,
+                                                per_page=max(FOREMAN_PER_PAGE, batch[1]),
+                                                search=batch[0])
+
+        resources = {}
+        for results in await asyncio.gather(*[search(batch) for batch in searches]):
+            self._add_search_results(resource_type=resource_type, key=key, value_map=value_map,
+                                     results=results, resources=resources)
+        return resources
+
+    async def get_compute_attributes(self, data):
+        """
+        Return the compute attributes of all compute profiles assigned to a compute resource
+
+        See Foreman.get_compute_attributes.
+        """
+        compute_resource = await self.get_compute_resource(data={'name': data.get('compute_resource')})
+        if compute_resource:
+            return compute_resource.get('compute_attributes')
+        return None
+
+    async def get_compute_attribute(self, data):
+        """
+        Return the compute attributes of a compute profile assigned to a compute resource.
+
+        See Foreman.get_compute_attribute.
+        """
+        compute_attributes, compute_profile = await asyncio.gather(
+            self.get_compute_attributes(data=data),
+            self.get_compute_profile(data={'name': data.get('compute_profile')}))
+
+        return [item for item in compute_attributes
+                if item.get('compute_profile_id') == compute_profile.get('id')]
+
+    async def get_compute_attribute_matrix(self, concurrency=FOREMAN_CONCURRENCY):
+        """
+        Return the compute attributes of all compute resources and compute profiles
+
+        See Foreman.get_compute_attribute_matrix.
+        """
+        compute_resources, compute_profiles = await asyncio.gather(self.get_compute_resources(),
+                                                                   self.get_compute_profiles())
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def get_attributes(compute_resource):
+            async with semaphore:
+                details = await self.get_compute_resource(data={'id': compute_resource.get('id')}) or {}
+            return details.get('compute_attributes') or []
+
+        compute_attributes = []
+        for attributes in await asyncio.gather(*[get_attributes(item) for item in compute_resources]):
+            compute_attributes.extend(attributes)
+
+        return ComputeAttributeMatrix(compute_resources=compute_resources,
+                                      compute_profiles=compute_profiles,
+                                      compute_attributes=compute_attributes)
+
+    async def reconcile_compute_attributes(self, desired, dry_run=False, concurrency=FOREMAN_CONCURRENCY,
+                                           matrix=None):
+        """ Create or update the compute attributes of many compute resource and compute profile pairs
+
+        See Foreman.reconcile_compute_attributes.
+        """
+        if matrix is None:
+            matrix = await self.get_compute_attribute_matrix(concurrency=concurrency)
+        reports = self._plan_compute_attributes(desired=desired, matrix=matrix, dry_run=dry_run)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def apply_change(report):
+            async with semaphore:
+                try:
+                    report['result'] = await self._apply_compute_attribute(report)
+                except ForemanError as e:
+                    report['error'] = e.message
+
+        await asyncio.gather(*[apply_change(report) for report in reports if 'data' in report])
+        return reports
+
+    async def resolve_host_references(self, hosts, concurrency=FOREMAN_CONCURRENCY):
+        """ Resolve the names of the references of many hosts into ids
+
+        See Foreman.resolve_host_references.
+        """
+        names = self._get_host_reference_names(hosts)
+
+        async def resolve(search, values):
+            resource_type, key = search
+            return search, await self.search_resources(resource_type=resource_type, key=key, values=values,
+                                                       concurrency=concurrency)
+
+        found = dict(await asyncio.gather(*[resolve(search, values) for search, values in names.items()]))
+        return self._get_host_reference_ids(hosts=hosts, found=found)
+
+    async def create_hosts(self, hosts, concurrency=FOREMAN_CONCURRENCY):
+        """ Create many hosts at the same time
+
+        See Foreman.create_hosts.
+        """
+        ids = await self.resolve_host_references(hosts=hosts, concurrency=concurrency)
+        reports = self._plan_hosts(hosts=hosts, ids=ids)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def create(report):
+            async with semaphore:
+                try:
+                    report['result'] = await self.create_host(data=report.pop('data'))
+                except ForemanError as e:
+                    report['error'] = e.message
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    report['error'] = str(e) or type(e).__name__
+
+        await asyncio.gather(*[create(report) for report in reports if 'data' in report])
+        return reports
+
+    async def set_hosts_power(self, action, host_ids=None, search=None, concurrency=FOREMAN_CONCURRENCY):
+        """ Execute a power action on many hosts at the same time
+
+        See Foreman.set_hosts_power. Failed connections are returned as
+        aiohttp.ClientError or asyncio.TimeoutError.
+        """
+        if host_ids is None:
+            if not search:
+                raise ValueError('Either host_ids or search must be specified')
+            host_ids = [host.get('id') async for host in self.iter_resources(resource_type='hosts', search=search)]
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def set_power(host_id):
+            async with semaphore:
+                try:
+                    return host_id, await self.set_host_power(host_id=host_id, action=action)
+                except (ForemanError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    return host_id, e
+
+        return dict(await asyncio.gather(*[set_power(host_id) for host_id in host_ids]))
+
+
+async def _collect(resources):
+    return [item async for item in resources]
@@ -0,0 +1,480 @@
+'''
+Backup Foreman configuration to YAML files
+'''
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import tarfile
+import threading
+import time
+import yaml
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeDumper
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from .foreman import Foreman, map_concurrent, FOREMAN_POOL_MAXSIZE
+from .utils import ErrorSummary, replace_file
+
+FOREMAN_BACKUP_RESOURCES = ['architectures',
+                            'common_parameters',
+                            'compute_resources',
+                            'compute_profiles',
+                            'config_templates',
+                            'domains',
+                            'environments',
+                            'hosts',
+                            'hostgroups',
+                            'locations',
+                            'media',
+                            # 'organizations',
+                            'operatingsystems',
+                            'smart_proxies',
+                            'subnets']
+FOREMAN_BACKUP_PROGRESS_INTERVAL = 100
+FOREMAN_BACKUP_MANIFEST = '.manifest.json'
+FOREMAN_BACKUP_FORMATS = ['files', 'ndjson', 'yaml', 'tar']
+FOREMAN_BACKUP_ARCHIVE = 'foreman-backup'
+
+
+def dump_yaml(item):
+    """Serialize an item to YAML, use the C implementation of PyYAML if available
+
+    Args:
+      item (dict): Item to serialize
+    Returns:
+      str
+    """
+    return yaml.dump(item, Dumper=SafeDumper, default_flow_style=False)
+
+
+def open_compressed(path, compression=None):
+    """Open a file for binary writing, optionally compressed
+
+    The extension of the compression (.gz or .zst) is appended to path.
+
+    Args:
+      path (str): Path of the file
+      compression (str): None, gzip or zstd
+    Returns:
+      file object
+    """
+    if compression == 'gzip':
+        return gzip.open(path + '.gz', 'wb')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError('zstd compression requires zstandard')
+        return zstandard.ZstdCompressor().stream_writer(open(path + '.zst', 'wb'))
+    if compression:
+        raise ValueError('Unknown compression: ' + compression)
+    return open(path, 'wb')
+
+
+class StreamSink(object):
+    """StreamSink Class
+
+    Write all items of a resource type into one file <resource>.ndjson or
+    <resource>.yaml (a stream of YAML documents). Items are written as soon as
+    they are fetched, so memory usage does not grow with the number of items.
+    """
+    def __init__(self, backup_root, output_format, compression=None):
+        self.backup_root = backup_root
+        self.output_format = output_format
+        self.compression = compression
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def begin(self, resource):
+        path = os.path.join(self.backup_root, resource + '.' + self.output_format)
+        backup_file = open_compressed(path, compression=self.compression)
+        with self._lock:
+            self._files[resource] = backup_file
+
+    def write(self, resource, item):
+        if self.output_format == 'ndjson':
+            content = json.dumps(item, sort_keys=True) + '\n'
+        else:
+            content = '---\n' + dump_yaml(item)
+        self._files[resource].write(content.encode('utf-8'))
+
+    def end(self, resource):
+        with self._lock:
+            backup_file = self._files.pop(resource)
+        backup_file.close()
+
+    def close(self):
+        with self._lock:
+            files = list(self._files.values())
+            self._files.clear()
+        for backup_file in files:
+            backup_file.close()
+
+
+class TarSink(object):
+    """TarSink Class
+
+    Write all items into one tar archive containing <resource>/<name>.yaml members.
+    The archive is written as a stream, optionally compressed.
+    """
+    def __init__(self, backup_root, compression=None):
+        self._file = open_compressed(os.path.join(backup_root, FOREMAN_BACKUP_ARCHIVE + '.tar'),
+                                     compression=compression)
+        self._tar = tarfile.open(fileobj=self._file, mode='w|')
+        self._lock = threading.Lock()
+
+    def begin(self, resource):
+        pass
+
+    def write(self, resource, item):
+        content = dump_yaml(item).encode('utf-8')
+        info = tarfile.TarInfo(name=resource + '/' + item.get('name').replace('/', '_') + '.yaml')
+        info.size = len(content)
+        info.mtime = time.time()
+        with self._lock:
+            self._tar.addfile(info, io.BytesIO(content))
+
+    def end(self, resource):
+        pass
+
+    def close(self):
+        with self._lock:
+            self._tar.close()
+            self._file.close()
+
+
+class ForemanBackup(ErrorSummary):
+    """ForemanBackup Class
+
+    Backup Foreman resources as YAML files.
+
+    The details of the items of a resource type are fetched by a pool of
+    concurrency worker threads and resource_concurrency resource types are
+    backed up at the same time. Items which fail are collected in errors and
+    do not stop the backup.
+
+    Each resource directory contains a manifest with the id, updated_at and a
+    content hash of every item. In incremental mode only items whose
+    updated_at changed are fetched, files are only rewritten if their content
+    changed and files of items which no longer exist are removed. Full
+    backups write the manifest as well, so an incremental backup can follow.
+
+    Instead of one file per item (output_format files) all items of a
+    resource type can be streamed into one NDJSON or YAML stream file, or all
+    items into one tar archive. These formats can be compressed with gzip or
+    zstd and do not support incremental backups.
+    """
+    def __init__(self, hostname, port, username, password, cache_dir=None,
+                 concurrency=1, resource_concurrency=1, incremental=False,
+                 output_format='files', compression=None,
+                 progress_interval=FOREMAN_BACKUP_PROGRESS_INTERVAL, output=None, **kwargs):
+        """Init
+
+        Args:
+          hostname (str): Foreman host name
+          port (str): Foreman HTTPS port
+          username (str): Username to authenticate with
+          password (str): Password to authenticate with
+          cache_dir (str): Directory to cache GET responses in
+          concurrency (int): Number of items fetched at the same time per resource type
+          resource_concurrency (int): Number of resource types backed up at the same time
+          incremental (bool): Only fetch and write items which changed since the last backup
+          output_format (str): files, ndjson, yaml or tar
+          compression (str): None, gzip or zstd. Not supported by output_format files.
+          progress_interval (int): Report progress every progress_interval items
+          output (file): Stream to write progress and the error summary to, defaults to sys.stdout
+          kwargs: Passed to Foreman (e.g. protocol, retry_policy, governor)
+        """
+        self.concurrency = concurrency
+        self.resource_concurrency = resource_concurrency
+        if output_format not in FOREMAN_BACKUP_FORMATS:
+            raise ValueError('Unknown output format: ' + output_format)
+        if output_format != 'files' and incremental:
+            raise ValueError('Incremental backups require output format files')
+        if output_format == 'files' and compression:
+            raise ValueError('Compression requires output format ndjson, yaml or tar')
+        self.incremental = incremental
+        self.output_format = output_format
+        self.compression = compression
+        self._sink = None
+        self.progress_interval = progress_interval
+        self.output = output
+        self.errors = []
+        self._lock = threading.Lock()
+        # Each resource type fetches listing pages and item details at the same time
+        self.foreman = Foreman(hostname, port, username, password,
+                               cache_dir=cache_dir,
+                               pool_maxsize=max(FOREMAN_POOL_MAXSIZE, 2 * concurrency * resource_concurrency),
+                               **kwargs)
+
+    def _load_manifest(self, backup_dir):
+        """Load the manifest of a resource directory
+
+        Args:
+          backup_dir (str): Resource directory
+        Returns:
+          dict: id -> updated_at, file and sha1 of the content
+        """
+        try:
+            with open(os.path.join(backup_dir, FOREMAN_BACKUP_MANIFEST), 'r') as manifest_file:
+                return json.load(manifest_file)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _save_manifest(self, backup_dir, manifest):
+        """Save the manifest of a resource directory
+
+        Args:
+          backup_dir (str): Resource directory
+          manifest (dict): Manifest to save
+        """
+        manifest_path = os.path.join(backup_dir, FOREMAN_BACKUP_MANIFEST)
+        with open(manifest_path + '.tmp', 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+        replace_file(manifest_path + '.tmp', manifest_path)
+
+    def _is_unchanged(self, backup_dir, resource_item, entry):
+        """Check if an item has not been updated since the last backup
+
+        Args:
+          backup_dir (str): Resource directory
+          resource_item (dict): Item of the resource listing
+          entry (dict): Manifest entry of the item
+        Returns:
+          bool
+        """
+        return bool(entry and resource_item.get('updated_at') and
+                    entry.get('updated_at') == resource_item.get('updated_at') and
+                    os.path.exists(os.path.join(backup_dir, entry.get('file'))))
+
+    def _write_item(self, backup_dir, item, entry):
+        """Write an item into its YAML file
+
+        The file is only written if its content changed since the last backup.
+
+        Args:
+          backup_dir (str): Resource directory
+          item (dict): Item to write
+          entry (dict): Manifest entry of the last backup of the item
+        Returns:
+          dict: New manifest entry
+        """
+        file_name = item.get('name').replace('/', '_') + '.yaml'
+        content = dump_yaml(item)
+        content_hash = hashlib.sha1(content.encode('utf-8')).hexdigest()
+        backup_file = os.path.join(backup_dir, file_name)
+
+        if (not self.incremental or not entry or entry.get('sha1') != content_hash or
+                entry.get('file') != file_name or not os.path.exists(backup_file)):
+            with open(backup_file, 'w') as backup_file:
+                backup_file.write(content)
+        if entry and entry.get('file') != file_name and os.path.exists(os.path.join(backup_dir, entry.get('file'))):
+            os.remove(os.path.join(backup_dir, entry.get('file')))
+
+        return {'updated_at': item.get('updated_at'), 'file': file_name, 'sha1': content_hash}
+
+    def _prune(self, backup_dir, manifest, item_ids):
+        """Remove the files of items which no longer exist in Foreman
+
+        Args:
+          backup_dir (str): Resource directory
+          manifest (dict): Manifest of the resource directory
+          item_ids (set): Ids (as str) of the items of the resource listing
+        Returns:
+          int: Number of removed items
+        """
+        pruned = 0
+        for item_id in list(manifest.keys()):
+            if item_id in item_ids:
+                continue
+            backup_file = os.path.join(backup_dir, manifest.pop(item_id).get('file'))
+            if os.path.exists(backup_file):
+                os.remove(backup_file)
+            pruned += 1
+        return pruned
+
+    def _create_sink(self, backup_root):
+        """Create the sink for output formats which write into one file
+
+        Args:
+          backup_root (str): Directory where to create the backup
+        Returns:
+          StreamSink or TarSink
+        """
+        if not os.path.exists(backup_root):
+            os.makedirs(backup_root)
+        if self.output_format == 'tar':
+            return TarSink(backup_root=backup_root, compression=self.compression)
+        return StreamSink(backup_root=backup_root, output_format=self.output_format,
+                          compression=self.compression)
+
+    def backup(self, backup_dir, resource, resource_function=None):
+        """Backup Foreman resource as YAML file into a directory.
+
+        A new directory named <resource> will be created inside <backup_dir>. Each
+        resource fetched by <resource_function> will be saved in an own YAML file
+        called <resource_name>.yaml in <backup_dir>/<resource>.
+
+        With the output formats ndjson, yaml and tar the items are streamed into
+        a single file inside <backup_dir> instead (see StreamSink and TarSink).
+
+        Args:
+          backup_dir (str): Directory where to create the backup files
+          resource (str): Name of the resource to backup (e.g. 'architectures')
+          resource_function (iterable): Resources to backup. If None all resources
+                                        of the resource type are listed page by page.
+        """
+        self._report("Backup: " + resource)
+
+        sink = self._sink
+        if self.output_format != 'files' and sink is None:
+            sink = self._create_sink(backup_root=backup_dir)
+        backup_dir = os.path.join(backup_dir, resource)
+
+        if self.output_format == 'files' and not os.path.exists(backup_dir):
+            os.makedirs(backup_dir)
+
+        try:
+            if resource_function is None:
+                resource_function = self.foreman.iter_resources(resource_type=resource,
+                                                                concurrency=self.concurrency)
+            # The items are consumed while the listing is fetched, nothing holds the whole listing
+            if self.output_format == 'files':
+                self._backup_files(backup_dir=backup_dir, resource=resource, resource_items=resource_function)
+            else:
+                self._backup_sink(sink=sink, resource=resource, resource_items=resource_function)
+        except Exception as e:
+            self._add_error(resource=resource, item=None, error=e)
+        finally:
+            if sink is not self._sink:
+                sink.close()
+
+    def _fetch_items(self, resource, resource_items, ordered=False):
+        """Fetch the details of items concurrently
+
+        Args:
+          resource (str): Name of the resource
+          resource_items (iterable): Items of the resource listing
+          ordered (bool): Yield the items in the order of the listing
+        Returns:
+          generator of tuples (listing item, detail item or None if failed)
+        """
+        def fetch(resource_item):
+            try:
+                return resource_item, self.foreman.get_resource(resource_type=resource,
+                                                                data={'id': resource_item.get('id')})
+            except Exception as e:
+                self._add_error(resource=resource, item=resource_item, error=e)
+                return resource_item, None
+
+        done = 0
+        for resource_item, item in map_concurrent(fetch, resource_items,
+                                                  concurrency=self.concurrency, ordered=ordered):
+            yield resource_item, item
+            done += 1
+            if self.progress_interval and done % self.progress_interval == 0:
+                self._report("Backup: %s %d" % (resource, done))
+
+    def _backup_files(self, backup_dir, resource, resource_items):
+        """Backup items into one YAML file per item
+
+        Args:
+          backup_dir (str): Resource directory
+          resource (str): Name of the resource
+          resource_items (iterable): Items of the resource listing
+        """
+        manifest = self._load_manifest(backup_dir)
+        item_ids = set()
+        counts = {'fetched': 0, 'unchanged': 0}
+
+        def fetch_items():
+            for resource_item in resource_items:
+                item_id = str(resource_item.get('id'))
+                item_ids.add(item_id)
+                if self.incremental and self._is_unchanged(backup_dir=backup_dir,
+                                                           resource_item=resource_item,
+                                                           entry=manifest.get(item_id)):
+                    counts['unchanged'] += 1
+                    continue
+                counts['fetched'] += 1
+                yield resource_item
+
+        for resource_item, item in self._fetch_items(resource=resource, resource_items=fetch_items()):
+            if item:
+                item_id = str(resource_item.get('id'))
+                try:
+                    manifest[item_id] = self._write_item(backup_dir=backup_dir,
+                                                         item=item,
+                                                         entry=manifest.get(item_id))
+                except Exception as e:
+                    self._add_error(resource=resource, item=resource_item, error=e)
+
+        pruned = 0
+        if self.incremental:
+            pruned = self._prune(backup_dir=backup_dir, manifest=manifest, item_ids=item_ids)
+        # Also written by full backups, so the next incremental backup can start from them
+        self._save_manifest(backup_dir=backup_dir, manifest=manifest)
+
+        self._report("Backup: %s %d done (%d unchanged, %d removed)" %
+                     (resource, counts['fetched'], counts['unchanged'], pruned))
+
+    def _backup_sink(self, sink, resource, resource_items):
+        """Stream items into a sink
+
+        Args:
+          sink (StreamSink or TarSink): Sink to write to
+          resource (str): Name of the resource
+          resource_items (iterable): Items of the resource listing
+        """
+        sink.begin(resource)
+        done = 0
+        try:
+            # Keep the order of the listing, so the stream does not depend on concurrency
+            for resource_item, item in self._fetch_items(resource=resource, resource_items=resource_items,
+                                                         ordered=True):
+                done += 1
+                if item:
+                    try:
+                        sink.write(resource, item)
+                    except Exception as e:
+                        self._add_error(resource=resource, item=resource_item, error=e)
+        finally:
+            sink.end(resource)
+
+        self._report("Backup: %s %d done" % (resource, done))
+
+    def run(self, backup_root='.', resources=None):
+        """Backup all resource types
+
+        Args:
+          backup_root (str): Directory where to create the backup
+          resources (list): Resource types to backup, defaults to FOREMAN_BACKUP_RESOURCES
+        Returns:
+          list of errors
+        """
+        self.errors = []
+        if self.output_format != 'files':
+            self._sink = self._create_sink(backup_root=backup_root)
+
+        def backup_resource(resource):
+            self.backup(backup_dir=backup_root, resource=resource)
+
+        try:
+            for _ in map_concurrent(backup_resource, resources or FOREMAN_BACKUP_RESOURCES,
+                                    concurrency=self.resource_concurrency, ordered=False):
+                pass
+        finally:
+            if self._sink is not None:
+                self._sink.close()
+                self._sink = None
+
+        self.print_summary()
+        return self.errors
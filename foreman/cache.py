@@ -0,0 +1,307 @@
+'''
+Caches used by the Foreman client
+'''
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    from urllib import urlencode
+except ImportError:
+    from urllib.parse import urlencode
+
+from .utils import replace_file
+
+
+class NameCache(object):
+    """NameCache Class
+
+    Bounded cache to resolve resource names to ids per resource type.
+
+    Entries expire after ttl seconds. If the cache is full the least recently
+    used entry is evicted. The names are also indexed by id, so invalidating
+    a resource by id does not scan the cache. The cache can be shared by
+    several threads.
+    """
+    def __init__(self, max_size, ttl=None):
+        """Init
+
+        Args:
+          max_size (int): Maximum number of names to keep
+          ttl (int): Seconds after which an entry expires, None to keep entries until evicted
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._keys_by_id = {}
+        self._lock = threading.Lock()
+
+    def _remove(self, key):
+        """Remove an entry and its id index, the lock must be held"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            id_key = (key[0], str(entry[0]))
+            keys = self._keys_by_id.get(id_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_id[id_key]
+        return entry
+
+    def get(self, resource_type, name):
+        """Return the cached id of a resource or None
+
+        Args:
+          resource_type (str): Resource type
+          name (str): Name of the resource
+        Returns:
+          id of the resource or None
+        """
+        key = (resource_type, name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[1] is not None and entry[1] < time.time()):
+                self._remove(key)
+                self.misses += 1
+                return None
+            # Re-insert to mark the entry as most recently used
+            del self._entries[key]
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def set(self, resource_type, name, resource_id):
+        """Cache the id of a resource
+
+        Args:
+          resource_type (str): Resource type
+          name (str): Name of the resource
+          resource_id: Id of the resource
+        """
+        expires = None
+        if self.ttl:
+            expires = time.time() + self.ttl
+        key = (resource_type, name)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (resource_id, expires)
+            self._keys_by_id.setdefault((resource_type, str(resource_id)), set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, resource_type, name=None, resource_id=None):
+        """Remove a resource from the cache
+
+        Args:
+          resource_type (str): Resource type
+          name (str): Name of the resource
+          resource_id: Id of the resource
+        """
+        with self._lock:
+            if name is not None:
+                self._remove((resource_type, name))
+            if resource_id is not None:
+                for key in list(self._keys_by_id.get((resource_type, str(resource_id)), [])):
+                    self._remove(key)
+
+    def clear(self):
+        """Remove all entries
+        """
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_id.clear()
+
+    def stats(self):
+        """Return hit and miss counters
+
+        Returns:
+          dict
+        """
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'size': len(self._entries),
+                    'max_size': self.max_size}
+
+
+class ResponseCache(object):
+    """ResponseCache Class
+
+    Persistent cache of GET responses in a directory.
+
+    Every response which contains an ETag or Last-Modified header is stored
+    together with these validators in one file per URL and query. The
+    validators are sent with the next request of the same URL, so the server
+    can answer with 304 Not Modified and the cached body is reused.
+
+    If the size of all files exceeds max_size the least recently used files
+    are removed. The directory can be shared by several processes.
+    """
+    def __init__(self, directory, max_size, namespace=''):
+        """Init
+
+        Args:
+          directory (str): Directory to store the responses in
+          max_size (int): Maximum size of all cached responses in bytes
+          namespace (str): Separates the responses of different servers or users
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        self._lock = threading.Lock()
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    def _get_path(self, url, params=None):
+        """Return the file name of a cached response
+
+        Args:
+          url (str): URL of the request
+          params (dict): Query parameters of the request
+        Returns:
+          str
+        """
+        key = self.namespace + ' ' + url
+        if params:
+            key = key + '?' + urlencode(sorted(params.items()))
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, url, params=None):
+        """Return a cached response
+
+        Args:
+          url (str): URL of the request
+          params (dict): Query parameters of the request
+        Returns:
+          dict containing etag, last_modified and body or None
+        """
+        path = self._get_path(url=url, params=params)
+        try:
+            with open(path, 'rb') as cache_file:
+                meta = json.loads(cache_file.readline().decode('utf-8'))
+                meta['body'] = cache_file.read().decode('utf-8')
+        except (IOError, OSError, ValueError):
+            return None
+        try:
+            # Mark the file as recently used
+            os.utime(path, None)
+        except OSError:
+            pass
+        return meta
+
+    def set(self, url, params, body, etag=None, last_modified=None):
+        """Store a response
+
+        Args:
+          url (str): URL of the request
+          params (dict): Query parameters of the request
+          body (str): Response body
+          etag (str): ETag header of the response
+          last_modified (str): Last-Modified header of the response
+        """
+        path = self._get_path(url=url, params=params)
+        meta = json.dumps({'url': url, 'etag': etag, 'last_modified': last_modified})
+        content = meta.encode('utf-8') + b'\n' + body.encode('utf-8')
+
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as cache_file:
+                cache_file.write(content)
+            try:
+                replaced_size = os.path.getsize(path)
+            except OSError:
+                replaced_size = 0
+            replace_file(temp_path, path)
+        except (IOError, OSError):
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._get_size()
+            else:
+                self._size += len(content) - replaced_size
+            if self._size > self.max_size:
+                self._evict()
+
+    def _get_files(self):
+        """Return path, size and modification time of all cached responses
+        """
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _get_size(self):
+        return sum(size for mtime, size, path in self._get_files())
+
+    def _evict(self):
+        """Remove least recently used responses until the cache fits into max_size
+        """
+        files = sorted(self._get_files())
+        size = sum(size for mtime, size, path in files)
+        for mtime, file_size, path in files:
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= file_size
+        self._size = size
+
+    def count(self, hit):
+        """Count a revalidated (hit) or downloaded (miss) response
+
+        Args:
+          hit (bool): True if the cached body was reused
+        """
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def clear(self):
+        """Remove all cached responses
+        """
+        with self._lock:
+            for mtime, size, path in self._get_files():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._size = 0
+
+    def stats(self):
+        """Return hit and miss counters
+
+        Returns:
+          dict
+        """
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'size': self._size if self._size is not None else self._get_size(),
+                    'max_size': self.max_size}
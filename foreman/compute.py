@@ -0,0 +1,147 @@
+'''
+Compute attributes of compute resource and compute profile pairs
+'''
+
+
+def is_same_value(current, desired):
+    """Compare a value stored by Foreman with a desired value
+
+    Foreman stores most vm_attrs values as strings, so 1, '1' and True are
+    considered the same. Dictionaries and lists are compared recursively, only
+    the keys of desired dictionaries are compared because Foreman adds its own
+    keys (e.g. to the entries of volumes_attributes).
+
+    Args:
+      current: Value stored by Foreman
+      desired: Desired value
+    Returns:
+      bool
+    """
+    if isinstance(desired, dict):
+        if not isinstance(current, dict):
+            return False
+        return all(is_same_value(current.get(key), desired.get(key)) for key in desired)
+    if isinstance(desired, (list, tuple)):
+        if not isinstance(current, (list, tuple)) or len(current) != len(desired):
+            return False
+        return all(is_same_value(item, desired[index]) for index, item in enumerate(current))
+    if current == desired:
+        return True
+    if isinstance(desired, bool):
+        return str(current).lower() in (['1', 'true'] if desired else ['0', 'false', '', 'none'])
+    if desired is None or current is None:
+        return desired in [None, ''] and current in [None, '']
+    return str(current) == str(desired)
+
+
+def diff_vm_attrs(current, desired):
+    """Return the vm_attrs which differ
+
+    Only keys contained in desired are compared.
+
+    Args:
+      current (dict): vm_attrs stored by Foreman
+      desired (dict): Desired vm_attrs
+    Returns:
+      dict: key -> tuple of current and desired value
+    """
+    current = current or {}
+    return dict((key, (current.get(key), value)) for key, value in desired.items()
+                if not is_same_value(current.get(key), value))
+
+
+class ComputeAttributeMatrix(object):
+    """ComputeAttributeMatrix Class
+
+    Index of the compute attributes of all compute resources and compute
+    profiles. The attributes are indexed by (compute_resource_id,
+    compute_profile_id) so lookups are answered without further requests.
+    Compute resources and compute profiles can be passed by id or by name.
+    """
+    def __init__(self, compute_resources, compute_profiles, compute_attributes):
+        """Init
+
+        Args:
+          compute_resources (list): Compute resources
+          compute_profiles (list): Compute profiles
+          compute_attributes (list): Compute attributes, each containing
+                                     compute_resource_id and compute_profile_id
+        """
+        self.compute_resources = dict((item.get('id'), item) for item in compute_resources)
+        self.compute_profiles = dict((item.get('id'), item) for item in compute_profiles)
+        self._compute_resource_ids = dict((item.get('name'), item.get('id')) for item in compute_resources)
+        self._compute_profile_ids = dict((item.get('name'), item.get('id')) for item in compute_profiles)
+        self._attributes = {}
+        for attribute in compute_attributes:
+            self._attributes[(attribute.get('compute_resource_id'), attribute.get('compute_profile_id'))] = attribute
+
+    def __len__(self):
+        return len(self._attributes)
+
+    def get_compute_resource_id(self, compute_resource):
+        """Return the id of a compute resource given by id or name
+
+        Returns:
+          id or None if the compute resource does not exist
+        """
+        if compute_resource in self.compute_resources:
+            return compute_resource
+        return self._compute_resource_ids.get(compute_resource)
+
+    def get_compute_profile_id(self, compute_profile):
+        """Return the id of a compute profile given by id or name
+
+        Returns:
+          id or None if the compute profile does not exist
+        """
+        if compute_profile in self.compute_profiles:
+            return compute_profile
+        return self._compute_profile_ids.get(compute_profile)
+
+    def get(self, compute_resource, compute_profile):
+        """Return the compute attribute of a compute resource and compute profile
+
+        Args:
+          compute_resource: Id or name of the compute resource
+          compute_profile: Id or name of the compute profile
+        Returns:
+          dict or None
+        """
+        return self._attributes.get((self.get_compute_resource_id(compute_resource),
+                                     self.get_compute_profile_id(compute_profile)))
+
+    def get_compute_attributes(self, compute_resource=None, compute_profile=None):
+        """Return all compute attributes of a compute resource and/or a compute profile
+
+        Args:
+          compute_resource: Id or name of the compute resource, None for all
+          compute_profile: Id or name of the compute profile, None for all
+        Returns:
+          list of dict
+        """
+        compute_resource_id = self.get_compute_resource_id(compute_resource)
+        compute_profile_id = self.get_compute_profile_id(compute_profile)
+        return [attribute for key, attribute in sorted(self._attributes.items(), key=lambda entry: str(entry[0]))
+                if (compute_resource is None or key[0] == compute_resource_id) and
+                (compute_profile is None or key[1] == compute_profile_id)]
+
+    def pairs(self):
+        """Iterate over all compute resource and compute profile pairs
+
+        Returns:
+          generator of tuples (compute resource, compute profile, compute attribute or None)
+        """
+        for compute_resource_id in sorted(self.compute_resources):
+            for compute_profile_id in sorted(self.compute_profiles):
+                yield (self.compute_resources[compute_resource_id],
+                       self.compute_profiles[compute_profile_id],
+                       self._attributes.get((compute_resource_id, compute_profile_id)))
+
+    def missing(self):
+        """Return all pairs of compute resource and compute profile without compute attributes
+
+        Returns:
+          list of tuples (compute resource, compute profile)
+        """
+        return [(compute_resource, compute_profile)
+                for compute_resource, compute_profile, attribute in self.pairs() if attribute is None]
@@ -0,0 +1,208 @@
+'''
+Decode JSON responses of the Foreman API
+'''
+
+import codecs
+import json
+
+FOREMAN_JSON_BACKENDS = ['orjson', 'ujson', 'simplejson', 'json']
+FOREMAN_STREAM_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = ' \t\n\r'
+_DELIMITERS = _WHITESPACE + ',:]}'
+_INCOMPLETE = object()
+
+
+def _json_loads(data):
+    if isinstance(data, bytes) and not isinstance(data, str):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+def get_loads(backend=None):
+    """Return the loads function of a JSON backend
+
+    Args:
+      backend (str): One of FOREMAN_JSON_BACKENDS, None picks the first one installed
+    Returns:
+      function decoding str or UTF-8 encoded bytes
+    """
+    if backend is not None and backend not in FOREMAN_JSON_BACKENDS:
+        raise ValueError('Unknown JSON backend: ' + backend)
+    for name in [backend] if backend else FOREMAN_JSON_BACKENDS:
+        if name == 'json':
+            return _json_loads
+        try:
+            return __import__(name).loads
+        except ImportError:
+            if backend:
+                raise
+    return _json_loads
+
+
+class JSONStreamDecoder(object):
+    """JSONStreamDecoder Class
+
+    Decode a JSON object incrementally while it is received. The items of the
+    array member key (results of a Foreman collection) are returned by feed as
+    soon as they are complete, so neither the whole body nor the whole list
+    is held in memory. All other members are collected in meta.
+
+        decoder = JSONStreamDecoder()
+        for chunk in chunks:
+            for item in decoder.feed(chunk):
+                ...
+        decoder.close()
+    """
+    def __init__(self, key='results'):
+        """Init
+
+        Args:
+          key (str): Member whose array items are returned by feed
+        """
+        self.key = key
+        self.meta = {}
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._state = 'start'
+        self._member = None
+        self._min_size = 0
+
+    @property
+    def done(self):
+        return self._state == 'done'
+
+    def feed(self, data, final=False):
+        """Add received data
+
+        Args:
+          data (bytes): Next chunk of the body
+          final (bool): data is the last chunk
+        Returns:
+          list of the items completed by this chunk
+        """
+        text = self._text_decoder.decode(data, final)
+        if self._pos:
+            self._buffer = self._buffer[self._pos:] + text
+            self._pos = 0
+        else:
+            self._buffer += text
+
+        items = []
+        # Parsing an incomplete value again is only worth it once twice the data arrived
+        if final or len(self._buffer) >= self._min_size:
+            self._min_size = 0
+            while self._step(items, final):
+                pass
+        if final and self._state != 'done':
+            raise ValueError('Incomplete JSON document')
+        return items
+
+    def close(self):
+        """Signal the end of the body
+
+        Returns:
+          list of the remaining items
+        """
+        return self.feed(b'', final=True)
+
+    def _next_char(self):
+        buffer = self._buffer
+        pos = self._pos
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        self._pos = pos
+        if pos < len(buffer):
+            return buffer[pos]
+        return None
+
+    def _expect(self, char, expected):
+        if char not in expected:
+            raise ValueError('Expected %s at position %d, found %r' % (' or '.join(expected), self._pos, char))
+        self._pos += 1
+        return char
+
+    def _read_value(self, final):
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except ValueError:
+            if final:
+                raise
+            self._min_size = (len(self._buffer) - self._pos) * 2
+            return _INCOMPLETE
+        # A number or literal is only complete once a delimiter follows, 1. or 1e
+        # at the end of a chunk decodes as 1 but continues in the next chunk
+        if not final and self._buffer[end - 1] not in '"]}' and \
+                (end == len(self._buffer) or self._buffer[end] not in _DELIMITERS):
+            return _INCOMPLETE
+        self._pos = end
+        return value
+
+    def _step(self, items, final):
+        """Consume the next token
+
+        Returns:
+          bool: False if more data is needed
+        """
+        char = self._next_char()
+        if char is None:
+            return False
+        state = self._state
+
+        if state == 'start':
+            self._expect(char, '{')
+            self._state = 'first_member'
+        elif state == 'first_member':
+            if char == '}':
+                self._pos += 1
+                self._state = 'done'
+            else:
+                self._state = 'member'
+        elif state == 'member':
+            if char != '"':
+                self._expect(char, '"')
+            member = self._read_value(final)
+            if member is _INCOMPLETE:
+                return False
+            self._member = member
+            self._state = 'colon'
+        elif state == 'colon':
+            self._expect(char, ':')
+            self._state = 'value'
+        elif state == 'value':
+            if self._member == self.key and char == '[':
+                self._pos += 1
+                self._state = 'first_item'
+            else:
+                value = self._read_value(final)
+                if value is _INCOMPLETE:
+                    return False
+                self.meta[self._member] = value
+                self._state = 'member_end'
+        elif state == 'first_item':
+            if char == ']':
+                self._pos += 1
+                self._state = 'member_end'
+            else:
+                self._state = 'item'
+        elif state == 'item':
+            item = self._read_value(final)
+            if item is _INCOMPLETE:
+                return False
+            items.append(item)
+            self._state = 'item_end'
+        elif state == 'item_end':
+            if self._expect(char, ',]') == ',':
+                self._state = 'item'
+            else:
+                self._state = 'member_end'
+        elif state == 'member_end':
+            if self._expect(char, ',}') == ',':
+                self._state = 'member'
+            else:
+                self._state = 'done'
+        else:
+            raise ValueError('Extra data at position %d' % self._pos)
+        return True
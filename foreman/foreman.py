@@ -4,13 +4,141 @@ Created on 04.03.2015
 @author: tkrah
 '''
 
+import collections
+import itertools
 import json
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
 import requests
+try:
+    from urllib import quote
+except ImportError:
+    from urllib.parse import quote
+from requests.adapters import HTTPAdapter
+from .cache import NameCache, ResponseCache
+from .compute import ComputeAttributeMatrix, diff_vm_attrs, is_same_value
+from .decoder import JSONStreamDecoder, FOREMAN_STREAM_CHUNK_SIZE, get_loads
+from .records import RecordFactory, project
+from .retry import RetryPolicy
+from .search import SearchQuery, build_search, quote_value, to_text
+from .throttle import RequestGovernor, clock
 # from requests.auth import HTTPBasicAuth
 requests.packages.urllib3.disable_warnings()
 
 FOREMAN_REQUEST_HEADERS = {'content-type': 'application/json', 'accept': 'application/json'}
 FOREMAN_API_VERSION = 'v2'
+FOREMAN_POOL_CONNECTIONS = 10
+FOREMAN_POOL_MAXSIZE = 10
+FOREMAN_PER_PAGE = 100
+FOREMAN_CONCURRENCY = 10
+FOREMAN_NAME_CACHE_TTL = 300
+FOREMAN_CACHE_MAX_SIZE = 100 * 1024 * 1024
+FOREMAN_MAX_SEARCH_LENGTH = 2000
+FOREMAN_HOOK_EVENTS = ['before_request', 'after_response', 'on_error', 'on_retry']
+
+# References of a host which can be passed by name as <reference>_name, the
+# resource type and the field the name is searched in
+FOREMAN_HOST_REFERENCES = {'architecture': ('architectures', 'name'),
+                           'compute_profile': ('compute_profiles', 'name'),
+                           'compute_resource': ('compute_resources', 'name'),
+                           'domain': ('domains', 'name'),
+                           'environment': ('environments', 'name'),
+                           'hostgroup': ('hostgroups', 'title'),
+                           'location': ('locations', 'title'),
+                           'medium': ('media', 'name'),
+                           'operatingsystem': ('operatingsystems', 'title'),
+                           'organization': ('organizations', 'title'),
+                           'ptable': ('ptables', 'name'),
+                           'puppet_ca_proxy': ('smart_proxies', 'name'),
+                           'puppet_proxy': ('smart_proxies', 'name'),
+                           'subnet': ('subnets', 'name')}
+
+# Resource types and the name of a single resource used in POST/PUT requests
+FOREMAN_RESOURCES = {'architectures': 'architecture',
+                     'common_parameters': 'common_parameter',
+                     'compute_profiles': 'compute_profile',
+                     'compute_resources': 'compute_resource',
+                     'config_templates': 'config_template',
+                     'domains': 'domain',
+                     'environments': 'environment',
+                     'hosts': 'host',
+                     'hostgroups': 'hostgroup',
+                     'locations': 'location',
+                     'media': 'medium',
+                     'organizations': 'organization',
+                     'operatingsystems': 'operatingsystem',
+                     'ptables': 'ptable',
+                     'smart_proxies': 'smart_proxy',
+                     'subnets': 'subnet'}
+
+def map_concurrent(func, items, concurrency, ordered=True):
+    """Call func for each item using a pool of worker threads
+
+    Results are yielded as soon as they are available. Exceptions raised by
+    func are raised again while iterating over the results. At most
+    concurrency items are in progress or waiting to be consumed, so the
+    results do not pile up in memory if the consumer is slower than func.
+    Items are taken from the iterable only when a worker is free, so it can
+    be a generator streaming a large collection.
+
+    Args:
+      func (def): Function to call with one item
+      items (iterable): Items to process
+      concurrency (int): Maximum number of worker threads
+      ordered (bool): Yield results in the order of items instead of completion order
+    Returns:
+      generator
+    """
+    remaining = iter(items)
+    if concurrency <= 1:
+        for item in remaining:
+            yield func(item)
+        return
+
+    first = list(itertools.islice(remaining, concurrency))
+    if len(first) <= 1:
+        for item in first:
+            yield func(item)
+        return
+
+    workers = len(first)
+    pool = ThreadPool(processes=workers)
+    remaining = itertools.chain(first, remaining)
+    pending = collections.deque()
+    done = Queue()
+
+    def call(item):
+        try:
+            result = True, func(item)
+        except Exception as e:
+            result = False, e
+        done.put(result)
+
+    def submit():
+        for item in remaining:
+            pending.append(pool.apply_async(func if ordered else call, (item,)))
+            return
+
+    try:
+        for _ in range(workers):
+            submit()
+        while pending:
+            if ordered:
+                result = pending.popleft().get()
+            else:
+                pending.popleft()
+                success, result = done.get()
+                if not success:
+                    raise result
+            submit()
+            yield result
+    finally:
+        pool.terminate()
 
 class ForemanError(Exception):
     """ForemanError Class
@@ -24,19 +152,227 @@ class ForemanError(Exception):
         self.request = request
         super(ForemanError, self).__init__()
 
-class Foreman:
-    """Foreman Class
+    @classmethod
+    def from_response(cls, url, status_code, body, reason=None):
+        """Create a ForemanError from the body of a failed request
 
-    Communicate with Foreman via API v2
+        Foreman usually answers with a JSON error, but proxies in front of it
+        return HTML pages e.g. for 502 or 503. Those are passed on as message.
 
+        Args:
+          url (str): URL of the request
+          status_code (int): HTTP status code
+          body (str): Response body
+          reason (str): HTTP reason phrase
+        Returns:
+          ForemanError
+        """
+        try:
+            request = json.loads(body)
+        except ValueError:
+            request = body
+
+        request_error = request.get('error') if isinstance(request, dict) else None
+        if isinstance(request_error, dict):
+            if 'message' in request_error:
+                message = request_error.get('message')
+            elif 'full_messages' in request_error:
+                message = ', '.join(request_error.get('full_messages'))
+            else:
+                message = request_error
+        elif request_error:
+            message = request_error
+        else:
+            message = reason or (body or '').strip()[:200]
+        return cls(url=url, request=request, status_code=status_code, message=message)
+
+class ForemanBase(object):
+    """ForemanBase Class
+
+    State and logic shared by Foreman and AsyncForeman which does not send
+    requests itself: URL building, searches, caches, retry counters, the
+    request governor and hooks.
+
+    Subclasses implement the transport (_request, _get_request, _post_request,
+    _put_request, _delete_request) and the methods which need the result of
+    one request to send the next one (get_resource, search_resource,
+    put_resource, iter_resources, get_resources, ...). The resource methods
+    defined here (get_*, set_*, create_*, delete_*) only pass their arguments
+    on and return what the subclass returns, e.g. awaitables on AsyncForeman.
     """
-    def __init__(self, hostname, port, username, password):
+    def __init__(self, hostname, port,
+                 name_cache_size=0,
+                 name_cache_ttl=FOREMAN_NAME_CACHE_TTL,
+                 retry_policy=None,
+                 governor=None,
+                 hooks=None,
+                 protocol='https',
+                 json_backend=None):
         """Init
+
+        Args:
+          hostname (str): Foreman host name
+          port (str): Foreman HTTPS port
+          name_cache_size (int): Number of name to id resolutions to cache, 0 disables the cache
+          name_cache_ttl (int): Seconds a cached name to id resolution is valid
+          retry_policy (RetryPolicy): Retry transient failures, defaults to RetryPolicy()
+          governor (RequestGovernor): Limit request rate and requests in flight, defaults to no limits
+          hooks (dict): Event name -> function or list of functions, see add_hook
+          protocol (str): https or http
+          json_backend (str): orjson, ujson, simplejson or json. Defaults to the
+                              fastest one installed.
         """
-        self.__auth = (username, password)
         self.hostname = hostname
         self.port = port
-        self.url = 'https://' + self.hostname + ':' + self.port + '/api/' + FOREMAN_API_VERSION
+        self.url = protocol + '://' + self.hostname + ':' + self.port + '/api/' + FOREMAN_API_VERSION
+        self._name_cache = None
+        if name_cache_size:
+            self._name_cache = NameCache(max_size=name_cache_size, ttl=name_cache_ttl)
+        self._response_cache = None
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self._retry_lock = threading.Lock()
+        self._retry_stats = {'retries': 0, 'retried_requests': 0, 'failed_requests': 0}
+        self.governor = governor if governor is not None else RequestGovernor()
+        self._init_hooks(hooks)
+        self._loads = get_loads(json_backend)
+
+    def name_cache_stats(self):
+        """Return hit and miss counters of the name to id cache
+
+        Returns:
+          dict or None if the cache is disabled
+        """
+        if self._name_cache is None:
+            return None
+        return self._name_cache.stats()
+
+    def response_cache_stats(self):
+        """Return hit and miss counters of the response cache
+
+        Returns:
+          dict or None if the cache is disabled
+        """
+        if self._response_cache is None:
+            return None
+        return self._response_cache.stats()
+
+    def retry_stats(self):
+        """Return retry counters
+
+        Returns:
+          dict: retries (number of retries sent), retried_requests (requests
+                retried at least once) and failed_requests (retried requests
+                which still failed after the last attempt)
+        """
+        with self._retry_lock:
+            return dict(self._retry_stats)
+
+    def throttle_stats(self):
+        """Return counters of the request governor
+
+        Returns:
+          dict
+        """
+        return self.governor.stats()
+
+    def _init_hooks(self, hooks):
+        """Register the hooks passed to the constructor
+
+        Args:
+          hooks (dict): Event name -> function or list of functions
+        """
+        self._hooks_lock = threading.Lock()
+        self._hooks = dict((event, []) for event in FOREMAN_HOOK_EVENTS)
+        for event, event_hooks in (hooks or {}).items():
+            if callable(event_hooks):
+                event_hooks = [event_hooks]
+            for hook in event_hooks:
+                self.add_hook(event, hook)
+
+    def add_hook(self, event, hook):
+        """Register a function called on a request event
+
+        Events:
+          before_request: Before every attempt of a request
+          after_response: After every response, including error responses
+          on_error: After a connection error or a response with status code >= 400
+          on_retry: Before waiting for the next attempt
+
+        The hook is called with a dict describing the attempt: method, url,
+        resource_type, attempt and bytes_sent. after_response and on_error add
+        elapsed (seconds), status_code (None after a connection error),
+        bytes_received and error (the exception raised, if any). on_retry adds
+        delay (seconds to wait).
+
+        Args:
+          event (str): One of FOREMAN_HOOK_EVENTS
+          hook (def): Function taking the dict
+        """
+        if event not in FOREMAN_HOOK_EVENTS:
+            raise ValueError('Unknown hook event: ' + event)
+        with self._hooks_lock:
+            self._hooks[event] = self._hooks[event] + [hook]
+
+    def remove_hook(self, event, hook):
+        """Unregister a function added with add_hook
+
+        Args:
+          event (str): One of FOREMAN_HOOK_EVENTS
+          hook (def): Function to remove
+        """
+        with self._hooks_lock:
+            self._hooks[event] = [registered for registered in self._hooks.get(event, []) if registered != hook]
+
+    def _has_hooks(self):
+        return any(self._hooks.values())
+
+    def _call_hooks(self, event, info):
+        for hook in self._hooks[event]:
+            hook(info)
+
+    def _create_request_info(self, method, url, attempt, body=None):
+        """Create the dict passed to hooks
+
+        Args:
+          method (str): HTTP verb
+          url (str): URL of the request
+          attempt (int): Number of retries done so far
+          body (str): Request body
+        Returns:
+          dict
+        """
+        resource_type = url[len(self.url):] if url.startswith(self.url) else url
+        resource_type = resource_type.split('?')[0].strip('/').split('/')[0]
+        if body is None:
+            bytes_sent = 0
+        elif isinstance(body, bytes):
+            bytes_sent = len(body)
+        else:
+            bytes_sent = len(body.encode('utf-8'))
+        return {'method': method.upper(),
+                'url': url,
+                'resource_type': resource_type,
+                'attempt': attempt,
+                'bytes_sent': bytes_sent,
+                'bytes_received': 0,
+                'status_code': None,
+                'elapsed': None,
+                'error': None}
+
+    def _count_retry(self, attempt, failed=False):
+        """Update the retry counters
+
+        Args:
+          attempt (int): Number of retries done so far
+          failed (bool): The request failed after its last retry
+        """
+        with self._retry_lock:
+            if failed:
+                self._retry_stats['failed_requests'] += 1
+                return
+            self._retry_stats['retries'] += 1
+            if attempt == 0:
+                self._retry_stats['retried_requests'] += 1
 
     def _get_resource_url(self, resource_type, resource_id=None, component=None, component_id=None):
         """Create API URL path
@@ -56,142 +392,163 @@ class Foreman:
                     url = url + '/' + str(component_id)
         return url
 
-    def _get_request(self, url, data=None):
-        """Execute a GET request agains Foreman API
+    def _get_page_params(self, page, per_page=None, search=None, order=None, thin=False):
+        data = {'page': page}
+        if per_page:
+            data['per_page'] = per_page
+        if search:
+            data['search'] = search
+        if order:
+            data['order'] = order
+        if thin:
+            data['thin'] = 'true'
+        return data
+
+    def _get_page(self, url, page, per_page=None, search=None, order=None, thin=False):
+        """ Request one page of a collection
 
         Args:
-          resource_type (str): Name of resource to get
-          component (str): Name of resource components to get
-          component_id (str): Name of resource component to get
-          data (dict): Dictionary to specify detailed data
+           url (str): URL of the collection
+           page (int): Number of the page to get
+           per_page (int): Number of resources per page
+           search (str): Search query to filter the resources
+           order (str): Field to order by, optionally followed by ASC or DESC
+           thin (bool): Only return id and name of the resources
         Returns:
-          Dict
+           dict
         """
-        req = requests.get(url=url,
-                           data=data,
-                           auth=self.__auth,
-                           verify=False)
-        if req.status_code == 200:
-            return json.loads(req.text)
-
-        raise ForemanError(url=req.url,
-                           status_code=req.status_code,
-                           message=req.json().get('error').get('message'),
-                           request=req.json())
+        return self._get_request(url=url, data=self._get_page_params(page=page, per_page=per_page,
+                                                                     search=search, order=order, thin=thin))
 
-    def _post_request(self, url, data):
-        """Execute a POST request agains Foreman API
+    def _get_search(self, search, per_page=None, order=None):
+        """ Resolve a search definition into search string, page size and order
 
         Args:
-          resource_type (str): Name of resource type to post
-          component (str): Name of resource to post
-          data (dict): Dictionary containing component details
+           search (str, dict, Condition or SearchQuery): Search definition
+           per_page (int): Default number of resources per page
+           order (str): Default order
         Returns:
-          Dict
+           tuple of search, per_page and order
         """
-        req = requests.post(url=url,
-                            data=json.dumps(data),
-                            headers=FOREMAN_REQUEST_HEADERS,
-                            auth=self.__auth,
-                            verify=False)
-        if req.status_code in [200, 201]:
-            return json.loads(req.text)
+        if isinstance(search, SearchQuery):
+            per_page = search.per_page or per_page
+            order = search.order or order
+        if search is not None:
+            search = build_search(search)
+        return search, per_page, order
 
-        request_error = req.json().get('error')
+    def _get_converter(self, fields=None, records=False):
+        """Return the function converting the items of a collection
 
-        if request_error.has_key('message'):
-            error_message = request_error.get('message')
-        elif request_error.has_key('full_messages'):
-            error_message = ', '.join(request_error.get('full_messages'))
-        else:
-            error_message = request_error
+        Args:
+          fields (list): Keep only these keys, also if records is a RecordFactory
+          records (bool or RecordFactory): Convert into Records
+        Returns:
+          function or None if the items are kept as they are
+        """
+        if isinstance(records, RecordFactory):
+            if fields is not None:
+                return lambda item: records(project(item, fields))
+            return records
+        if records:
+            return RecordFactory(fields=fields)
+        if fields is not None:
+            return lambda item: project(item, fields)
+        return None
 
-        raise ForemanError(url=req.url,
-                           status_code=req.status_code,
-                           message=error_message,
-                           request=req.json())
+    def _convert_results(self, results, convert):
+        if convert is None:
+            return results
+        return (convert(item) for item in results)
 
-    def _put_request(self, url, data):
-        """Execute a PUT request agains Foreman API
+    def _get_known_id(self, resource_type, data):
+        """ Return the id of a resource if it is known without a search
 
         Args:
-          resource_type (str): Name of resource type to post
-          resource_id (str): Resource identified
-          data (dict): Dictionary of details
+           resource_type (str): Resource type
+           data (dict): Must contain either id or name
         Returns:
-          Dict
+           tuple of the id (None if unknown), whether the id was taken from
+           the name cache and whether a search by name is needed
         """
-        req = requests.put(url=url,
-                           data=json.dumps(data),
-                           headers=FOREMAN_REQUEST_HEADERS,
-                           auth=self.__auth,
-                           verify=False)
-        if req.status_code == 200:
-            return json.loads(req.text)
-        raise ForemanError(url=req.url,
-                           status_code=req.status_code,
-                           message=req.json().get('error').get('message'),
-                           request=req.json())
-
-    def _delete_request(self, url):
-        """Execute a DELETE request agains Foreman API
+        if 'id' in data:
+            return data.get('id'), False, False
+        if 'name' not in data:
+            return None, False, False
+        if self._name_cache is not None and len(data) == 1:
+            resource_id = self._name_cache.get(resource_type, data.get('name'))
+            if resource_id is not None:
+                return resource_id, True, False
+        return None, False, True
+
+    def _lookup_resource(self, resource_type, data):
+        """ Find a resource for the get_<resource> helpers
+
+        Without the name cache the resource is searched (see search_resource).
+        With the name cache a search by name only is passed to get_resource,
+        which reuses the id of a previous search and returns the full resource.
 
         Args:
-          resource_type (str): Name of resource type to post
-          resource_id (str): Resource identified
+           resource_type (str): Resource type
+           data (dict, Condition, SearchQuery or str): Search definition
         Returns:
-          Dict
+           Result of search_resource or get_resource, an awaitable for AsyncForeman
         """
-        req = requests.delete(url=url,
-                              headers=FOREMAN_REQUEST_HEADERS,
-                              auth=self.__auth,
-                              verify=False)
-        if req.status_code == 200:
-            return json.loads(req.text)
-        raise ForemanError(url=req.url,
-                           status_code=req.status_code,
-                           message=req.json().get('error').get('message'),
-                           request=req.json())
+        if self._name_cache is not None and isinstance(data, dict) and list(data) == ['name']:
+            return self.get_resource(resource_type=resource_type, data=data)
+        return self.search_resource(resource_type=resource_type, search_data=data)
 
-    def get_resources(self, resource_type):
-        """ Return a list of all resources of the defined resource type
+    def _is_stale(self, data, resource):
+        """ Check if a resource fetched by a cached id no longer has the cached name
 
         Args:
-           resource_type: Type of reesources to get
+           data (dict): Data of get_resource containing the name
+           resource (dict): Resource fetched by the cached id, None if it was not found
         Returns:
-           list of dict
+           bool
         """
-        request_result = self._get_request(url=self._get_resource_url(resource_type=resource_type))
-        return request_result.get('results')
+        return resource is None or resource.get('name') != data.get('name')
 
-    def get_resource(self, resource_type, resource_id=None, data=None):
-        """ Get information about a resource
-
-        If data contains id the resource will be get directly from the API.
-        If id is not specified but name the resource will be searched within the database.
-        If found the id of the research will be used. If not found None will be returned.
+    def _get_found_id(self, resource_type, data, resource):
+        """ Return the id of the resource found by name, remember it in the name cache
 
         Args:
            resource_type (str): Resource type
-           data (dict): Must contain either id or name
+           data (dict): Search data of get_resource
+           resource (dict or list): Result of search_resource
         Returns:
-           dict
+           id or None if no single resource was found
         """
+        if not resource or 'id' not in resource:
+            return None
+        if self._name_cache is not None and len(data) == 1:
+            self._name_cache.set(resource_type, data.get('name'), resource.get('id'))
+        return resource.get('id')
 
-        resource_id = None
-
-        if data.has_key('id'):
-            resource_id = data.get('id')
-        elif data.has_key('name'):
-            resource = self.search_resource(resource_type=resource_type, search_data=data)
-            if resource and resource.has_key('id'):
-                resource_id = resource.get('id')
+    def _get_search_params(self, search_data=None, order=None, per_page=None):
+        """ Return the query parameters of search_resource
 
-        if resource_id:
-            return self._get_request(url=self._get_resource_url(resource_type=resource_type,
-                                                                resource_id=resource_id))
-        else:
-            return None
+        Args:
+           search_data (dict, Condition, SearchQuery or str): Search definition
+           order (str): Field to order by
+           per_page (int): Number of resources to return
+        Returns:
+           dict
+        """
+        search, per_page, order = self._get_search(search=search_data, per_page=per_page, order=order)
+        data = {'search': search}
+        if per_page:
+            data['per_page'] = per_page
+        if order:
+            data['order'] = order
+        return data
+
+    def _get_search_result(self, results):
+        # A single match is returned as resource, otherwise the list of matches
+        result = results.get('results')
+        if len(result) == 1:
+            return result[0]
+        return result
 
     def post_resource(self, resource_type, resource, data, additional_data=None):
         """ Execute a post request
@@ -227,41 +584,115 @@ class Foreman:
         return self._post_request(url=url,
                                   data=resource_data)
 
-    def put_resource(self, resource_type, resource_id, data, component=None):
-        return self._put_request(url=self._get_resource_url(resource_type=resource_type,
-                                                            resource_id=resource_id,
-                                                            component=component),
-                                 data=data)
+    def _get_changed_data(self, resource_type, resource_id, data, current):
+        """ Remove the fields of update data which already have the desired value
+
+        Fields of {<resource>: fields} are compared, other keys are kept. Fields
+        missing in current are always kept. If the current resource was not
+        found (current is None) a ForemanError with status code 404 is raised.
+
+        Args:
+           resource_type (str): Resource type
+           resource_id (int): Id of the resource
+           data (dict): Update data, either {<resource>: fields} or fields
+           current (dict or Record): Current resource
+        Returns:
+           dict: Data containing only the changed fields or None if nothing changed
+        """
+        resource = FOREMAN_RESOURCES.get(resource_type)
+        if current is None:
+            raise ForemanError(url=self._get_resource_url(resource_type=resource_type, resource_id=resource_id),
+                               request=data,
+                               status_code=404,
+                               message='Resource %s not found by id \'%s\'' % (resource, resource_id))
+        wrapped = resource in data and isinstance(data.get(resource), dict)
+        fields = data.get(resource) if wrapped else data
+        changed = dict((field, value) for field, value in fields.items()
+                       if field not in current or not is_same_value(current.get(field), value))
+        if not changed:
+            return None
+        if not wrapped:
+            return changed
+        changed_data = dict(data)
+        changed_data[resource] = changed
+        return changed_data
+
+    def _get_put_url(self, resource_type, resource_id, component=None):
+        """ Return the URL to update a resource, forget its cached name
+
+        Args:
+           resource_type (str): Resource type
+           resource_id (int): Id of the resource
+           component (str): Sub-resource to update, e.g. power
+        Returns:
+           str
+        """
+        if self._name_cache is not None and not component:
+            self._name_cache.invalidate(resource_type, resource_id=resource_id)
+        return self._get_resource_url(resource_type=resource_type, resource_id=resource_id, component=component)
 
     def delete_resource(self, resource_type, data):
         resource_id = str(data.get('id'))
+        if self._name_cache is not None:
+            self._name_cache.invalidate(resource_type, resource_id=resource_id)
         return self._delete_request(url=self._get_resource_url(resource_type=resource_type,
                                                                resource_id=resource_id))
 
-    def search_resource(self, resource_type, search_data=None):
-        data = {}
-        data['search'] = ''
+    def _get_batch_searches(self, key, values, max_search_length=FOREMAN_MAX_SEARCH_LENGTH):
+        """ Split values into searches of the form 'key ^ ("value1", "value2")'
 
-        for key in search_data:
-            if data['search']:
-                data['search'] = data['search'] + ' AND '
-            data['search'] = data['search'] + key + ' == '
+        Each search is limited to max_search_length characters after UTF-8 and URL encoding.
 
-            if isinstance(search_data[key], int):
-                data['search'] = data['search'] + str(search_data[key])
-            elif isinstance(search_data[key], str):
-                data['search'] = data['search'] + '"' + search_data[key] + '"'
+        Args:
+           key (str): Field to search in
+           values (list): Values to search for
+           max_search_length (int): Maximum length of one URL encoded search
+        Returns:
+           list of tuples (search, number of values)
+        """
+        searches = []
+        terms = []
+        for value in values:
+            term = quote_value(value)
+            search = key + ' ^ (' + ', '.join(terms + [term]) + ')'
+            if terms and len(quote(search.encode('utf-8'))) > max_search_length:
+                searches.append((key + ' ^ (' + ', '.join(terms) + ')', len(terms)))
+                terms = []
+            terms.append(term)
+        if terms:
+            searches.append((key + ' ^ (' + ', '.join(terms) + ')', len(terms)))
+        return searches
+
+    def _get_value_map(self, values):
+        """ Map the text of values to the values, found resources are matched by it
 
-        results = self._get_request(url=self._get_resource_url(resource_type=resource_type), data=data)
-        result = results.get('results')
+        Args:
+           values (list): Values to search for
+        Returns:
+           dict
+        """
+        return dict((to_text(value), value) for value in values)
 
-        if len(result) == 1:
-            return result[0]
+    def _add_search_results(self, resource_type, key, value_map, results, resources):
+        """ Add the results of one search of search_resources to the found resources
 
-        return result
+        Args:
+           resource_type (str): Resource type
+           key (str): Field searched in
+           value_map (dict): Text of value -> value searched for, see _get_value_map
+           results (list): Resources found by the search
+           resources (dict): Found resource per value, updated in place
+        """
+        for resource in results:
+            value = value_map.get(to_text(resource.get(key)))
+            if value is None or value in resources:
+                continue
+            resources[value] = resource
+            if key == 'name' and self._name_cache is not None and 'id' in resource:
+                self._name_cache.set(resource_type, value, resource.get('id'))
 
-    def get_architectures(self):
-        return self.get_resources(resource_type='architectures')
+    def get_architectures(self, **kwargs):
+        return self.get_resources(resource_type='architectures', **kwargs)
 
     def get_architecture(self, data):
         return self.get_resource(resource_type='architectures', data=data)
@@ -275,8 +706,8 @@ class Foreman:
     def delete_architecture(self, data):
         return self.delete_resource(resource_type='architectures', data=data)
 
-    def get_common_parameters(self):
-        return self.get_resources(resource_type='common_parameters')
+    def get_common_parameters(self, **kwargs):
+        return self.get_resources(resource_type='common_parameters', **kwargs)
 
     def get_common_parameter(self, data):
         return self.get_resource(resource_type='common_parameters', data=data)
@@ -290,37 +721,6 @@ class Foreman:
     def delete_common_parameter(self, data):
         return self.delete_resource(resource_type='common_parameters', data=data)
 
-    def get_compute_attributes(self, data):
-        """
-        Return the compute attributes of all compute profiles assigned to a compute resource
-
-        Args:
-           data(dict): Must contain the name of the compute resource in compute_resource.
-
-        Returns:
-           dict
-        """
-        compute_resource = self.get_compute_resource(data={'name': data.get('compute_resource')})
-        if compute_resource:
-            return compute_resource.get('compute_attributes')
-        return None
-
-    def get_compute_attribute(self, data):
-        """
-        Return the compute attributes of a compute profile assigned to a compute resource.
-
-        Args:
-           data (dict): Must contain the name of the compute profile in compute_profile
-                        as well as the name of the compute_resource in compute_resource.
-
-        Returns:
-           dict
-        """
-        compute_attributes = self.get_compute_attributes(data=data)
-        compute_profile = self.get_compute_profile(data={'name': data.get('compute_profile')})
-
-        return filter(lambda item: item.get('compute_profile_id') == compute_profile.get('id'), compute_attributes)
-
     def create_compute_attribute(self, data):
         """ Create compute attributes for a compute profile in a compute resource
 
@@ -343,8 +743,64 @@ class Foreman:
                                  resource_id=data.get('id'),
                                  data={'vm_attrs': data.get('vm_attrs')})
 
-    def get_compute_profiles(self):
-        return self.get_resources(resource_type='compute_profiles')
+    def _plan_compute_attributes(self, desired, matrix, dry_run=False):
+        """ Compare desired compute attributes with the current ones
+
+        See reconcile_compute_attributes.
+
+        Args:
+           desired (list): Dicts containing compute_resource, compute_profile and vm_attrs
+           matrix (ComputeAttributeMatrix): Current compute attributes
+           dry_run (bool): Do not add the data to send to the reports
+        Returns:
+           list of dict: One report per desired pair, reports of changes to send contain their data
+        """
+        reports = []
+        for item in desired:
+            report = {'compute_resource': item.get('compute_resource'),
+                      'compute_profile': item.get('compute_profile'),
+                      'changes': {}}
+            reports.append(report)
+            compute_resource_id = matrix.get_compute_resource_id(item.get('compute_resource'))
+            compute_profile_id = matrix.get_compute_profile_id(item.get('compute_profile'))
+            if compute_resource_id is None or compute_profile_id is None:
+                report['action'] = 'error'
+                report['error'] = 'Unknown compute resource or compute profile'
+                continue
+
+            current = matrix.get(compute_resource_id, compute_profile_id)
+            vm_attrs = item.get('vm_attrs') or {}
+            if current is None:
+                report['action'] = 'create'
+                report['changes'] = dict((key, (None, value)) for key, value in vm_attrs.items())
+                report['data'] = {'compute_resource_id': compute_resource_id,
+                                  'compute_profile_id': compute_profile_id,
+                                  'vm_attrs': vm_attrs}
+                continue
+
+            report['changes'] = diff_vm_attrs(current.get('vm_attrs'), vm_attrs)
+            if not report['changes']:
+                report['action'] = 'unchanged'
+                continue
+            report['action'] = 'update'
+            merged = dict(current.get('vm_attrs') or {})
+            merged.update(vm_attrs)
+            report['data'] = {'id': current.get('id'), 'vm_attrs': merged}
+
+        if dry_run:
+            for report in reports:
+                report.pop('data', None)
+        return reports
+
+    def _apply_compute_attribute(self, report):
+        """Return the request creating or updating the compute attribute of a report"""
+        data = report.pop('data')
+        if report['action'] == 'create':
+            return self.create_compute_attribute(data=data)
+        return self.update_compute_attribute(data=data)
+
+    def get_compute_profiles(self, **kwargs):
+        return self.get_resources(resource_type='compute_profiles', **kwargs)
 
     def get_compute_profile(self, data):
         return self.get_resource(resource_type='compute_profiles', data=data)
@@ -358,8 +814,8 @@ class Foreman:
     def delete_compute_profile(self, data):
         return self.delete_resource(resource_type='compute_profiles', data=data)
 
-    def get_compute_resources(self):
-        return self.get_resources(resource_type='compute_resources')
+    def get_compute_resources(self, **kwargs):
+        return self.get_resources(resource_type='compute_resources', **kwargs)
 
     def get_compute_resource(self, data):
         return self.get_resource(resource_type='compute_resources', data=data)
@@ -373,8 +829,8 @@ class Foreman:
     def delete_compute_resource(self, data):
         return self.delete_resource(resource_type='compute_resources', data=data)
 
-    def get_config_templates(self):
-        return self.get_resources(resource_type='config_templates')
+    def get_config_templates(self, **kwargs):
+        return self.get_resources(resource_type='config_templates', **kwargs)
 
     def get_config_template(self, data):
         return self.get_resource(resource_type='config_templates', data=data)
@@ -391,11 +847,11 @@ class Foreman:
 #    def get_compute_resource_images(self, name):
 #        return self.get_compute_resource(name=name, component='images').get('results')
 
-    def get_domains(self):
-        return self.get_resources(resource_type='domains')
+    def get_domains(self, **kwargs):
+        return self.get_resources(resource_type='domains', **kwargs)
 
     def get_domain(self, data):
-        return self.search_resource(resource_type='domains', search_data=data)
+        return self._lookup_resource(resource_type='domains', data=data)
 
     def set_domain(self, data):
         return self.post_resource(resource_type='domains', resource='domain', data=data)
@@ -406,11 +862,11 @@ class Foreman:
     def delete_domain(self, data):
         return self.delete_resource(resource_type='domains', data=data)
 
-    def get_environments(self):
-        return self.get_resources(resource_type='environments')
+    def get_environments(self, **kwargs):
+        return self.get_resources(resource_type='environments', **kwargs)
 
     def get_environment(self, data):
-        return self.search_resource(resource_type='environments', search_data=data)
+        return self._lookup_resource(resource_type='environments', data=data)
 
     def set_environment(self, data):
         return self.post_resource(resource_type='environments', resource='environment', data=data)
@@ -421,11 +877,11 @@ class Foreman:
     def delete_environment(self, data):
         return self.delete_resource(resource_type='environments', data=data)
 
-    def get_hosts(self):
-        return self.get_resources(resource_type='hosts')
+    def get_hosts(self, **kwargs):
+        return self.get_resources(resource_type='hosts', **kwargs)
 
     def get_host(self, data):
-        return self.search_resource(resource_type='hosts', search_data=data)
+        return self._lookup_resource(resource_type='hosts', data=data)
 
     def set_host(self, data):
         return self.post_resource(resource_type='hosts', resource='host', data=data)
@@ -436,6 +892,70 @@ class Foreman:
     def delete_host(self, data):
         return self.delete_resource(resource_type='hosts', data=data)
 
+    def _get_host_reference_names(self, hosts):
+        """ Return the names of the references to resolve for resolve_host_references
+
+        Args:
+           hosts (list): Dicts describing the hosts
+        Returns:
+           dict: (resource type, search key) -> set of names
+        """
+        names = {}
+        for host in hosts:
+            for reference in FOREMAN_HOST_REFERENCES:
+                name = host.get(reference + '_name')
+                if name is not None and host.get(reference + '_id') is None:
+                    names.setdefault(FOREMAN_HOST_REFERENCES[reference], set()).add(name)
+        return names
+
+    def _get_host_reference_ids(self, hosts, found):
+        """ Map the references of hosts to the ids of the resources found
+
+        Args:
+           hosts (list): Dicts describing the hosts
+           found (dict): (resource type, search key) -> result of search_resources
+        Returns:
+           dict: (reference, name) -> id
+        """
+        ids = {}
+        for host in hosts:
+            for reference, search in FOREMAN_HOST_REFERENCES.items():
+                name = host.get(reference + '_name')
+                resource = found.get(search, {}).get(name)
+                if resource is not None:
+                    ids[(reference, name)] = resource.get('id')
+        return ids
+
+    def _plan_hosts(self, hosts, ids):
+        """ Create the reports of create_hosts
+
+        Args:
+           hosts (list): Dicts describing the hosts
+           ids (dict): Result of resolve_host_references
+        Returns:
+           list of dict: One report per host, the data to post or the error
+        """
+        reports = []
+        for host in hosts:
+            report = {'name': host.get('name')}
+            reports.append(report)
+            data = {}
+            missing = []
+            for key, value in host.items():
+                reference = key[:-len('_name')] if key.endswith('_name') else None
+                if reference not in FOREMAN_HOST_REFERENCES:
+                    data[key] = value
+                elif host.get(reference + '_id') is None and value is not None:
+                    if (reference, value) in ids:
+                        data[reference + '_id'] = ids[(reference, value)]
+                    else:
+                        missing.append('%s %s' % (reference, value))
+            if missing:
+                report['error'] = 'Unknown ' + ', '.join(sorted(missing))
+            else:
+                report['data'] = data
+        return reports
+
     def get_host_power(self, host_id):
         return self.put_resource(resource_type='hosts',
                                  resource_id=host_id,
@@ -469,11 +989,23 @@ class Foreman:
                                  component='power',
                                  data={'power_action': action, 'host': {}})
 
-    def get_hostgroups(self):
-        return self.get_resources(resource_type='hostgroups')
+    def get_hosts_power(self, host_ids=None, search=None, concurrency=FOREMAN_CONCURRENCY):
+        return self.set_hosts_power(action='state', host_ids=host_ids, search=search, concurrency=concurrency)
+
+    def poweron_hosts(self, host_ids=None, search=None, concurrency=FOREMAN_CONCURRENCY):
+        return self.set_hosts_power(action='start', host_ids=host_ids, search=search, concurrency=concurrency)
+
+    def poweroff_hosts(self, host_ids=None, search=None, concurrency=FOREMAN_CONCURRENCY):
+        return self.set_hosts_power(action='stop', host_ids=host_ids, search=search, concurrency=concurrency)
+
+    def reboot_hosts(self, host_ids=None, search=None, concurrency=FOREMAN_CONCURRENCY):
+        return self.set_hosts_power(action='reboot', host_ids=host_ids, search=search, concurrency=concurrency)
+
+    def get_hostgroups(self, **kwargs):
+        return self.get_resources(resource_type='hostgroups', **kwargs)
 
     def get_hostgroup(self, data):
-        return self.search_resource(resource_type='hostgroups', search_data=data)
+        return self._lookup_resource(resource_type='hostgroups', data=data)
 
     def set_hostgroup(self, data):
         return self.post_resource(resource_type='hostgroups', resource='hostgroup', data=data)
@@ -484,11 +1016,11 @@ class Foreman:
     def delete_hostgroup(self, data):
         return self.delete_resource(resource_type='hostgroups', data=data)
 
-    def get_locations(self):
-        return self.get_resources(resource_type='locations')
+    def get_locations(self, **kwargs):
+        return self.get_resources(resource_type='locations', **kwargs)
 
     def get_location(self, data):
-        return self.search_resource(resource_type='locations', search_data=data)
+        return self._lookup_resource(resource_type='locations', data=data)
 
     def set_location(self, data):
         return self.post_resource(resource_type='locations', resource='location', data=data)
@@ -499,11 +1031,11 @@ class Foreman:
     def delete_location(self, data):
         return self.delete_resource(resource_type='locations', data=data)
 
-    def get_media(self):
-        return self.get_resources(resource_type='media')
+    def get_media(self, **kwargs):
+        return self.get_resources(resource_type='media', **kwargs)
 
     def get_medium(self, data):
-        return self.search_resource(resource_type='media', search_data=data)
+        return self._lookup_resource(resource_type='media', data=data)
 
     def set_medium(self, data):
         return self.post_resource(resource_type='media', resource='medium', data=data)
@@ -514,11 +1046,11 @@ class Foreman:
     def delete_medium(self, data):
         return self.delete_resource(resource_type='media', data=data)
 
-    def get_organizations(self):
-        return self.get_resources(resource_type='organizations')
+    def get_organizations(self, **kwargs):
+        return self.get_resources(resource_type='organizations', **kwargs)
 
     def get_organization(self, data):
-        return self.search_resource(resource_type='organizations', search_data=data)
+        return self._lookup_resource(resource_type='organizations', data=data)
 
     def set_organization(self, data):
         return self.post_resource(resource_type='organizations', resource='organization', data=data)
@@ -529,11 +1061,11 @@ class Foreman:
     def delete_organization(self, data):
         return self.delete_resource(resource_type='organizations', data=data)
 
-    def get_operatingsystems(self):
-        return self.get_resources(resource_type='operatingsystems')
+    def get_operatingsystems(self, **kwargs):
+        return self.get_resources(resource_type='operatingsystems', **kwargs)
 
     def get_operatingsystem(self, data):
-        return self.search_resource(resource_type='operatingsystems', search_data=data)
+        return self._lookup_resource(resource_type='operatingsystems', data=data)
 
     def set_operatingsystem(self, data):
         return self.post_resource(resource_type='operatingsystems', resource='operatingsystem', data=data)
@@ -544,11 +1076,11 @@ class Foreman:
     def delete_operatingsystem(self, data):
         return self.delete_resource(resource_type='operatingsystems', data=data)
 
-    def get_partition_tables(self):
-        return self.get_resources(resource_type='ptables')
+    def get_partition_tables(self, **kwargs):
+        return self.get_resources(resource_type='ptables', **kwargs)
 
     def get_partition_table(self, data):
-        return self.search_resource(resource_type='ptables', search_data=data)
+        return self._lookup_resource(resource_type='ptables', data=data)
 
     def set_partition_table(self, data):
         return self.post_resource(resource_type='ptables', resource='ptable', data=data)
@@ -559,11 +1091,11 @@ class Foreman:
     def delete_partition_table(self, data):
         return self.delete_resource(resource_type='ptables', data=data)
 
-    def get_smart_proxies(self):
-        return self.get_resources(resource_type='smart_proxies')
+    def get_smart_proxies(self, **kwargs):
+        return self.get_resources(resource_type='smart_proxies', **kwargs)
 
     def get_smart_proxy(self, data):
-        return self.search_resource(resource_type='smart_proxies', search_data=data)
+        return self._lookup_resource(resource_type='smart_proxies', data=data)
 
     def set_smart_proxy(self, data):
         return self.post_resource(resource_type='smart_proxies', resource='smart_proxy', data=data)
@@ -574,11 +1106,11 @@ class Foreman:
     def delete_smart_proxy(self, data):
         return self.delete_resource(resource_type='smart_proxies', data=data)
 
-    def get_subnets(self):
-        return self.get_resources(resource_type='subnets')
+    def get_subnets(self, **kwargs):
+        return self.get_resources(resource_type='subnets', **kwargs)
 
     def get_subnet(self, data):
-        return self.search_resource(resource_type='subnets', search_data=data)
+        return self._lookup_resource(resource_type='subnets', data=data)
 
     def set_subnet(self, data):
         return self.post_resource(resource_type='subnets', resource='subnet', data=data)
@@ -588,3 +1120,742 @@ class Foreman:
 
     def delete_subnet(self, data):
         return self.delete_resource(resource_type='subnets', data=data)
+
+class Foreman(ForemanBase):
+    """Foreman Class
+
+    Communicate with Foreman via API v2
+
+    All requests are sent through one persistent HTTP session. Its connection
+    pool keeps TCP/TLS connections to Foreman alive between calls, so a single
+    Foreman object can be shared by several worker threads.
+    """
+    def __init__(self, hostname, port, username, password,
+                 pool_connections=FOREMAN_POOL_CONNECTIONS,
+                 pool_maxsize=FOREMAN_POOL_MAXSIZE,
+                 pool_block=False,
+                 keep_alive=True,
+                 verify=False,
+                 cert=None,
+                 name_cache_size=0,
+                 name_cache_ttl=FOREMAN_NAME_CACHE_TTL,
+                 cache_dir=None,
+                 cache_max_size=FOREMAN_CACHE_MAX_SIZE,
+                 retry_policy=None,
+                 governor=None,
+                 hooks=None,
+                 protocol='https',
+                 json_backend=None,
+                 stream_decode=False):
+        """Init
+
+        Args:
+          hostname (str): Foreman host name
+          port (str): Foreman HTTPS port
+          username (str): Username to authenticate with
+          password (str): Password to authenticate with
+          pool_connections (int): Number of connection pools (one per host) to cache
+          pool_maxsize (int): Maximum number of connections kept open per host.
+                              Should be at least the number of threads sharing this object.
+          pool_block (bool): Block and wait for a free connection instead of opening
+                             an additional one if the pool is exhausted
+          keep_alive (bool): Reuse connections between requests
+          verify (bool or str): Verify the server certificate. A path to a CA bundle
+                                can be passed to verify against a private CA.
+          cert (str or tuple): Client certificate file or tuple of (cert, key) files
+          name_cache_size (int): Number of name to id resolutions to cache, 0 disables the cache
+          name_cache_ttl (int): Seconds a cached name to id resolution is valid
+          cache_dir (str): Directory to cache GET responses in. Cached responses are
+                           revalidated with ETag/If-Modified-Since. None disables the cache.
+          cache_max_size (int): Maximum size of the response cache in bytes
+          retry_policy (RetryPolicy): Retry transient failures, defaults to RetryPolicy()
+                                      which retries GET requests. RetryPolicy(max_retries=0)
+                                      disables retries.
+          governor (RequestGovernor): Limit request rate and requests in flight. One
+                                      governor can be shared by several Foreman objects.
+                                      Defaults to no limits.
+          hooks (dict): Event name -> function or list of functions, see add_hook
+          protocol (str): https or http
+          json_backend (str): orjson, ujson, simplejson or json. Defaults to the
+                              fastest one installed.
+          stream_decode (bool): Decode the results of collection pages while they are
+                                received instead of loading the whole body first.
+                                The pages are decoded with the json module instead
+                                of json_backend. Not used if the response cache is
+                                enabled.
+        """
+        ForemanBase.__init__(self, hostname, port,
+                             name_cache_size=name_cache_size,
+                             name_cache_ttl=name_cache_ttl,
+                             retry_policy=retry_policy,
+                             governor=governor,
+                             hooks=hooks,
+                             protocol=protocol,
+                             json_backend=json_backend)
+        self.__auth = (username, password)
+        self._session = self._create_session(pool_connections=pool_connections,
+                                             pool_maxsize=pool_maxsize,
+                                             pool_block=pool_block,
+                                             keep_alive=keep_alive,
+                                             verify=verify,
+                                             cert=cert)
+        if cache_dir:
+            self._response_cache = ResponseCache(directory=cache_dir,
+                                                 max_size=cache_max_size,
+                                                 namespace=username + '@' + self.url)
+        self.stream_decode = stream_decode
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _create_session(self, pool_connections, pool_maxsize, pool_block, keep_alive, verify, cert):
+        """Create the HTTP session shared by all requests
+
+        Args:
+          pool_connections (int): Number of connection pools to cache
+          pool_maxsize (int): Maximum number of connections per pool
+          pool_block (bool): Block if no free connection is available
+          keep_alive (bool): Reuse connections between requests
+          verify (bool or str): Verify server certificate or path to CA bundle
+          cert (str or tuple): Client certificate
+        Returns:
+          requests.Session
+        """
+        session = requests.Session()
+        session.auth = self.__auth
+        session.verify = verify
+        session.cert = cert
+        if not keep_alive:
+            session.headers['Connection'] = 'close'
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize,
+                              pool_block=pool_block)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def close(self):
+        """Close all pooled connections
+        """
+        self._session.close()
+
+    def _request(self, method, url, **kwargs):
+        """Send a request through the pooled session
+
+        Every attempt waits for the governor. Connection errors and transient
+        status codes are retried as defined by the retry policy. The governor
+        slot is held until the response headers are received. The body of a
+        streamed response is read after returning without holding a slot, so
+        requests made while it is consumed are not blocked by it.
+
+        Args:
+          method (str): HTTP verb
+          url (str): URL to request
+          kwargs: Passed to requests.Session.request
+        Returns:
+          requests.Response
+        """
+        attempt = 0
+        while True:
+            info = None
+            if self._has_hooks():
+                info = self._create_request_info(method=method, url=url, attempt=attempt, body=kwargs.get('data'))
+                self._call_hooks('before_request', info)
+            self.governor.wait(method)
+            try:
+                start = clock()
+                req = self._session.request(method=method, url=url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.governor.release(method)
+                if info is not None:
+                    info.update(elapsed=clock() - start, error=e)
+                    self._call_hooks('on_error', info)
+                if not self.retry_policy.is_retryable(method=method, attempt=attempt):
+                    if attempt:
+                        self._count_retry(attempt=attempt, failed=True)
+                    raise
+                delay = self.retry_policy.get_delay(attempt=attempt)
+            except Exception:
+                self.governor.release(method)
+                raise
+            else:
+                self.governor.release(method)
+                if info is not None:
+                    if kwargs.get('stream'):
+                        bytes_received = int(req.headers.get('Content-Length') or 0)
+                    else:
+                        bytes_received = len(req.content)
+                    info.update(elapsed=clock() - start, status_code=req.status_code, bytes_received=bytes_received)
+                    self._call_hooks('after_response', info)
+                    if req.status_code >= 400:
+                        self._call_hooks('on_error', info)
+                if not self.retry_policy.is_retryable(method=method, attempt=attempt, status_code=req.status_code):
+                    if attempt and req.status_code in self.retry_policy.status_codes:
+                        self._count_retry(attempt=attempt, failed=True)
+                    return req
+                delay = self.retry_policy.get_delay(attempt=attempt, retry_after=req.headers.get('Retry-After'))
+                req.close()
+            if info is not None:
+                info['delay'] = delay
+                self._call_hooks('on_retry', info)
+            self._count_retry(attempt=attempt)
+            attempt += 1
+            time.sleep(delay)
+
+    def _get_request(self, url, data=None):
+        """Execute a GET request agains Foreman API
+
+        If the response cache is enabled the validators of a cached response are
+        sent along. If Foreman answers with 304 Not Modified the cached body is used.
+
+        Args:
+          url (str): URL to request
+          data (dict): Dictionary to specify detailed data (e.g. search, page, per_page).
+                       Passed as query parameters.
+        Returns:
+          Dict
+        """
+        cached = None
+        headers = {}
+        if self._response_cache is not None:
+            cached = self._response_cache.get(url=url, params=data)
+            if cached:
+                if cached.get('etag'):
+                    headers['If-None-Match'] = cached.get('etag')
+                if cached.get('last_modified'):
+                    headers['If-Modified-Since'] = cached.get('last_modified')
+
+        req = self._request('GET',
+                            url=url,
+                            params=data,
+                            headers=headers)
+        if req.status_code == 304 and cached:
+            self._response_cache.count(hit=True)
+            return self._loads(cached.get('body'))
+        if req.status_code == 200:
+            if self._response_cache is not None:
+                self._response_cache.count(hit=False)
+                etag = req.headers.get('ETag')
+                last_modified = req.headers.get('Last-Modified')
+                if (etag or last_modified) and 'no-store' not in req.headers.get('Cache-Control', ''):
+                    self._response_cache.set(url=url, params=data, body=req.text,
+                                             etag=etag, last_modified=last_modified)
+            return self._loads(req.content)
+
+        raise ForemanError.from_response(url=req.url, status_code=req.status_code, body=req.text, reason=req.reason)
+
+    def _post_request(self, url, data):
+        """Execute a POST request agains Foreman API
+
+        Args:
+          resource_type (str): Name of resource type to post
+          component (str): Name of resource to post
+          data (dict): Dictionary containing component details
+        Returns:
+          Dict
+        """
+        req = self._request('POST',
+                            url=url,
+                            data=json.dumps(data),
+                            headers=FOREMAN_REQUEST_HEADERS)
+        if req.status_code in [200, 201]:
+            return self._loads(req.content)
+
+        raise ForemanError.from_response(url=req.url, status_code=req.status_code, body=req.text, reason=req.reason)
+
+    def _put_request(self, url, data):
+        """Execute a PUT request agains Foreman API
+
+        Args:
+          resource_type (str): Name of resource type to post
+          resource_id (str): Resource identified
+          data (dict): Dictionary of details
+        Returns:
+          Dict
+        """
+        req = self._request('PUT',
+                            url=url,
+                            data=json.dumps(data),
+                            headers=FOREMAN_REQUEST_HEADERS)
+        if req.status_code == 200:
+            return self._loads(req.content)
+        raise ForemanError.from_response(url=req.url, status_code=req.status_code, body=req.text, reason=req.reason)
+
+    def _delete_request(self, url):
+        """Execute a DELETE request agains Foreman API
+
+        Args:
+          resource_type (str): Name of resource type to post
+          resource_id (str): Resource identified
+        Returns:
+          Dict
+        """
+        req = self._request('DELETE',
+                            url=url,
+                            headers=FOREMAN_REQUEST_HEADERS)
+        if req.status_code == 200:
+            return self._loads(req.content)
+        raise ForemanError.from_response(url=req.url, status_code=req.status_code, body=req.text, reason=req.reason)
+
+    def _use_stream_decode(self):
+        # Cached responses have to be stored as a whole
+        return self.stream_decode and self._response_cache is None
+
+    def _iter_page(self, url, page, per_page=None, search=None, order=None, thin=False, meta=None):
+        """ Request one page of a collection and decode its results while they are received
+
+        Every result is yielded as soon as it is decoded. The governor slot of the
+        request is free once the headers are received (see _request), so
+        requests made while iterating do not wait for the rest of the body.
+        The results are decoded with the C scanner of the json module, the
+        json_backend is only used for whole bodies.
+
+        Args:
+           url (str): URL of the collection
+           page (int): Number of the page to get
+           per_page (int): Number of resources per page
+           search (str): Search query to filter the resources
+           order (str): Field to order by, optionally followed by ASC or DESC
+           thin (bool): Only return id and name of the resources
+           meta (dict): Filled with the other members of the page (total, subtotal,
+                        per_page, ...) once all results are consumed
+        Returns:
+           generator of dict
+        """
+        req = self._request('GET',
+                            url=url,
+                            params=self._get_page_params(page=page, per_page=per_page, search=search, order=order,
+                                                         thin=thin),
+                            stream=True)
+        try:
+            if req.status_code != 200:
+                raise ForemanError.from_response(url=req.url, status_code=req.status_code, body=req.text,
+                                                 reason=req.reason)
+            decoder = JSONStreamDecoder(key='results')
+            for chunk in req.iter_content(chunk_size=FOREMAN_STREAM_CHUNK_SIZE):
+                for item in decoder.feed(chunk):
+                    yield item
+            for item in decoder.close():
+                yield item
+            if meta is not None:
+                meta.update(decoder.meta)
+        finally:
+            req.close()
+
+    def iter_resources(self, resource_type, per_page=FOREMAN_PER_PAGE, search=None, concurrency=1, ordered=True,
+                       order=None, fields=None, records=False, thin=False):
+        """ Iterate over all resources of the defined resource type
+
+        Foreman returns collections in pages. The pages are requested one after
+        another while the items are consumed, so only one page is held in memory.
+
+        If concurrency is greater than 1 the first page is used to calculate the
+        number of pages and the remaining pages are fetched by a pool of worker
+        threads. The pool size of the session should be at least concurrency.
+
+        Args:
+           resource_type (str): Type of resources to get
+           per_page (int): Number of resources to request per page
+           search (str, dict, Condition or SearchQuery): Search query to filter the resources
+           concurrency (int): Number of pages to fetch at the same time
+           ordered (bool): Yield pages in order if fetched concurrently
+           order (str): Field to order by, optionally followed by ASC or DESC
+           fields (list): Keep only these keys of each resource
+           records (bool or RecordFactory): Yield compact read-only Records instead of dicts
+           thin (bool): Only return id and name of the resources, which Foreman
+                        lists much faster than the full records
+        Returns:
+           generator of dict or Record
+        """
+        url = self._get_resource_url(resource_type=resource_type)
+        search, per_page, order = self._get_search(search=search, per_page=per_page, order=order)
+        convert = self._get_converter(fields=fields, records=records)
+        streaming = self._use_stream_decode()
+        page = 1
+        while True:
+            if streaming:
+                request_result = {}
+                count = 0
+                for item in self._convert_results(self._iter_page(url=url, page=page, per_page=per_page, search=search,
+                                                                  order=order, thin=thin, meta=request_result),
+                                                  convert):
+                    count += 1
+                    yield item
+            else:
+                request_result = self._get_page(url=url, page=page, per_page=per_page, search=search, order=order,
+                                                thin=thin)
+                results = request_result.get('results') or []
+                count = len(results)
+                for item in self._convert_results(results, convert):
+                    yield item
+
+            page_size = int(request_result.get('per_page') or per_page or count)
+            total = request_result.get('subtotal', request_result.get('total'))
+            if not count or count < page_size or total is None or page * page_size >= int(total):
+                break
+
+            if concurrency > 1:
+                pages = range(page + 1, (int(total) + page_size - 1) // page_size + 1)
+
+                def fetch(page_number):
+                    if streaming:
+                        results = self._iter_page(url=url, page=page_number, per_page=page_size,
+                                                  search=search, order=order, thin=thin)
+                    else:
+                        results = self._get_page(url=url, page=page_number, per_page=page_size,
+                                                 search=search, order=order, thin=thin).get('results') or []
+                    return list(self._convert_results(results, convert))
+
+                for results in map_concurrent(fetch, pages, concurrency=concurrency, ordered=ordered):
+                    for item in results:
+                        yield item
+                break
+            page += 1
+
+    def get_resources(self, resource_type, stream=False, per_page=FOREMAN_PER_PAGE, search=None,
+                      concurrency=1, ordered=True, order=None, fields=None, records=False, thin=False):
+        """ Return all resources of the defined resource type
+
+        All pages of the collection are fetched. If stream is True a generator is
+        returned which fetches the pages lazily (see iter_resources).
+
+        For large result sets fields and records reduce the memory used: fields
+        drops all other keys, records returns Records which share their keys
+        and repeated string values instead of dicts (see foreman.records).
+
+        Args:
+           resource_type (str): Type of resources to get
+           stream (bool): Return a generator instead of a list
+           per_page (int): Number of resources to request per page
+           search (str, dict, Condition or SearchQuery): Search query to filter the resources
+           concurrency (int): Number of pages to fetch at the same time
+           ordered (bool): Keep the order of pages if fetched concurrently
+           order (str): Field to order by, optionally followed by ASC or DESC
+           fields (list): Keep only these keys of each resource
+           records (bool or RecordFactory): Return compact read-only Records instead of dicts
+           thin (bool): Only return id and name of the resources
+        Returns:
+           list or generator of dict or Record
+        """
+        resources = self.iter_resources(resource_type=resource_type, per_page=per_page, search=search,
+                                        concurrency=concurrency, ordered=ordered, order=order,
+                                        fields=fields, records=records, thin=thin)
+        if stream:
+            return resources
+        return list(resources)
+
+    def get_resource(self, resource_type, resource_id=None, data=None):
+        """ Get information about a resource
+
+        If data contains id the resource will be get directly from the API.
+        If id is not specified but name the resource will be searched within the database.
+        If found the id of the research will be used. If not found None will be returned.
+
+        If the name cache is enabled and data contains only the name, the id of
+        a previous search is reused and the search is skipped. If the resource
+        was deleted or renamed since, the name is searched again.
+
+        Args:
+           resource_type (str): Resource type
+           data (dict): Must contain either id or name
+        Returns:
+           dict
+        """
+
+        resource_id, cached, search = self._get_known_id(resource_type=resource_type, data=data)
+        if search:
+            resource = self.search_resource(resource_type=resource_type, search_data=data)
+            resource_id = self._get_found_id(resource_type=resource_type, data=data, resource=resource)
+        if not resource_id:
+            return None
+
+        try:
+            resource = self._get_request(url=self._get_resource_url(resource_type=resource_type,
+                                                                    resource_id=resource_id))
+        except ForemanError as e:
+            if not cached or e.status_code != 404:
+                raise
+            resource = None
+        if cached and self._is_stale(data=data, resource=resource):
+            # Resource was deleted or renamed since it was cached
+            self._name_cache.invalidate(resource_type, name=data.get('name'))
+            return self.get_resource(resource_type=resource_type, data=data)
+        return resource
+
+    def put_resource(self, resource_type, resource_id, data, component=None, minimal=False, current=None):
+        """ Execute a put request to update a resource
+
+        With minimal the fields are compared with the current resource first
+        and only the changed ones are sent. If nothing changed no request is
+        sent and the current resource is returned.
+
+        Args:
+           resource_type (str): Resource type
+           resource_id (int): Id of the resource
+           data (dict): Update data, usually {<resource>: fields}
+           component (str): Sub-resource to update, e.g. power
+           minimal (bool): Send only the fields which differ from the current resource
+           current (dict or Record): Current resource to compare with, fetched if not set
+        Returns:
+           dict
+        """
+        if minimal and not component:
+            if current is None:
+                current = self.get_resource(resource_type=resource_type, data={'id': resource_id})
+            data = self._get_changed_data(resource_type=resource_type, resource_id=resource_id, data=data,
+                                          current=current)
+            if data is None:
+                return current
+        return self._put_request(url=self._get_put_url(resource_type=resource_type,
+                                                       resource_id=resource_id,
+                                                       component=component),
+                                 data=data)
+
+    def search_resource(self, resource_type, search_data=None, order=None, per_page=None):
+        """ Search resources
+
+        The search is executed by Foreman. If exactly one resource matches it is
+        returned, otherwise the list of matching resources of the first page.
+
+        Args:
+           resource_type (str): Resource type
+           search_data (dict, Condition, SearchQuery or str): Search definition.
+               All key/value pairs of a dict have to match, see foreman.search.
+           order (str): Field to order by, optionally followed by ASC or DESC
+           per_page (int): Number of resources to return
+        Returns:
+           dict or list of dict
+        """
+        data = self._get_search_params(search_data=search_data, order=order, per_page=per_page)
+        return self._get_search_result(self._get_request(url=self._get_resource_url(resource_type=resource_type),
+                                                         data=data))
+
+    def search_resources(self, resource_type, key, values, max_search_length=FOREMAN_MAX_SEARCH_LENGTH,
+                         concurrency=FOREMAN_CONCURRENCY):
+        """ Search many resources by the values of one field
+
+        Instead of one search per value the values are combined into
+        'key ^ (value1, value2, ...)' searches which stay below max_search_length.
+        The searches are executed concurrently.
+
+        Args:
+           resource_type (str): Resource type
+           key (str): Field to search in (e.g. name)
+           values (list): Values to search for
+           max_search_length (int): Maximum length of one URL encoded search
+           concurrency (int): Number of searches executed at the same time
+        Returns:
+           dict: Found resource per value. Values which were not found are missing.
+        """
+        values = list(set(values))
+        value_map = self._get_value_map(values)
+        searches = self._get_batch_searches(key=key, values=values, max_search_length=max_search_length)
+
+        def search(batch):
+            return list(self.iter_resources(resource_type=resource_type,
+                                            per_page=max(FOREMAN_PER_PAGE, batch[1]),
+                                            search=batch[0]))
+
+        resources = {}
+        for results in map_concurrent(search, searches, concurrency=concurrency, ordered=False):
+            self._add_search_results(resource_type=resource_type, key=key, value_map=value_map,
+                                     results=results, resources=resources)
+        return resources
+
+    def get_compute_attributes(self, data):
+        """
+        Return the compute attributes of all compute profiles assigned to a compute resource
+
+        Args:
+           data(dict): Must contain the name of the compute resource in compute_resource.
+
+        Returns:
+           dict
+        """
+        compute_resource = self.get_compute_resource(data={'name': data.get('compute_resource')})
+        if compute_resource:
+            return compute_resource.get('compute_attributes')
+        return None
+
+    def get_compute_attribute(self, data):
+        """
+        Return the compute attributes of a compute profile assigned to a compute resource.
+
+        Args:
+           data (dict): Must contain the name of the compute profile in compute_profile
+                        as well as the name of the compute_resource in compute_resource.
+
+        Returns:
+           dict
+        """
+        compute_attributes = self.get_compute_attributes(data=data)
+        compute_profile = self.get_compute_profile(data={'name': data.get('compute_profile')})
+
+        return [item for item in compute_attributes
+                if item.get('compute_profile_id') == compute_profile.get('id')]
+
+    def get_compute_attribute_matrix(self, concurrency=FOREMAN_CONCURRENCY):
+        """
+        Return the compute attributes of all compute resources and compute profiles
+
+        All compute resources and compute profiles are listed once and the details
+        of the compute resources are fetched concurrently. Lookups on the returned
+        ComputeAttributeMatrix do not need any further requests.
+
+        Args:
+           concurrency (int): Number of compute resources fetched at the same time
+
+        Returns:
+           ComputeAttributeMatrix
+        """
+        compute_resources = self.get_compute_resources()
+        compute_profiles = self.get_compute_profiles()
+
+        def get_attributes(compute_resource):
+            details = self.get_compute_resource(data={'id': compute_resource.get('id')}) or {}
+            return details.get('compute_attributes') or []
+
+        compute_attributes = []
+        for attributes in map_concurrent(get_attributes, compute_resources, concurrency=concurrency):
+            compute_attributes.extend(attributes)
+
+        return ComputeAttributeMatrix(compute_resources=compute_resources,
+                                      compute_profiles=compute_profiles,
+                                      compute_attributes=compute_attributes)
+
+    def reconcile_compute_attributes(self, desired, dry_run=False, concurrency=FOREMAN_CONCURRENCY, matrix=None):
+        """ Create or update the compute attributes of many compute resource and compute profile pairs
+
+        The current compute attributes are fetched once (see get_compute_attribute_matrix).
+        Only pairs whose vm_attrs differ are updated, missing pairs are created.
+        The changes are sent concurrently. Keys of vm_attrs which are not part of
+        the desired vm_attrs are kept.
+
+        Args:
+           desired (list): Dicts containing compute_resource and compute_profile (id or name)
+                           as well as the desired vm_attrs
+           dry_run (bool): Only report the changes, do not send them
+           concurrency (int): Number of changes sent at the same time
+           matrix (ComputeAttributeMatrix): Current compute attributes, fetched if not passed
+        Returns:
+           list of dict: One report per desired pair containing the action
+                         (create, update, unchanged or error), the changes and the result or error
+        """
+        if matrix is None:
+            matrix = self.get_compute_attribute_matrix(concurrency=concurrency)
+        reports = self._plan_compute_attributes(desired=desired, matrix=matrix, dry_run=dry_run)
+
+        def apply_change(report):
+            try:
+                report['result'] = self._apply_compute_attribute(report)
+            except ForemanError as e:
+                report['error'] = e.message
+            return report
+
+        for _ in map_concurrent(apply_change, [report for report in reports if 'data' in report],
+                                concurrency=concurrency, ordered=False):
+            pass
+        return reports
+
+    def resolve_host_references(self, hosts, concurrency=FOREMAN_CONCURRENCY):
+        """ Resolve the names of the references of many hosts into ids
+
+        Every distinct name of FOREMAN_HOST_REFERENCES passed as <reference>_name
+        (e.g. hostgroup_name, domain_name, subnet_name) is resolved once by
+        search_resources. Hostgroups, locations, organizations and operating
+        systems are searched by their title (e.g. 'Base/Web', 'CentOS 7.9').
+
+        Args:
+           hosts (list): Dicts describing the hosts
+           concurrency (int): Number of searches executed at the same time
+        Returns:
+           dict: (reference, name) -> id. Names which were not found are missing.
+        """
+        names = self._get_host_reference_names(hosts)
+
+        def resolve(search):
+            (resource_type, key), values = search
+            return search[0], self.search_resources(resource_type=resource_type, key=key, values=values,
+                                                    concurrency=concurrency)
+
+        found = dict(map_concurrent(resolve, names.items(), concurrency=concurrency, ordered=False))
+        return self._get_host_reference_ids(hosts=hosts, found=found)
+
+    def create_hosts(self, hosts, concurrency=FOREMAN_CONCURRENCY):
+        """ Create many hosts at the same time
+
+        References can be passed by name as <reference>_name instead of
+        <reference>_id (see resolve_host_references). All names are resolved in
+        batches before the hosts are created, so creating n hosts costs n POST
+        requests plus one search per referenced resource type.
+
+        A host with a name which could not be resolved is not created. A failing
+        host, also one whose connection failed, does not stop the other hosts.
+
+        Args:
+           hosts (list): Dicts describing the hosts
+           concurrency (int): Number of requests executed at the same time
+        Returns:
+           list of dict: One report per host in the order of hosts containing the name,
+                         the result (created host) or the error
+        """
+        ids = self.resolve_host_references(hosts=hosts, concurrency=concurrency)
+        reports = self._plan_hosts(hosts=hosts, ids=ids)
+
+        def create(report):
+            try:
+                report['result'] = self.create_host(data=report.pop('data'))
+            except ForemanError as e:
+                report['error'] = e.message
+            except requests.exceptions.RequestException as e:
+                report['error'] = str(e)
+            return report
+
+        for _ in map_concurrent(create, [report for report in reports if 'data' in report],
+                                concurrency=concurrency, ordered=False):
+            pass
+        return reports
+
+    def _get_host_ids(self, host_ids=None, search=None):
+        """ Return the ids of hosts either passed directly or found by a search query
+
+        Args:
+           host_ids (list): List of host ids
+           search (str): Search query to find hosts
+        Returns:
+           list
+        """
+        if host_ids is not None:
+            return list(host_ids)
+        if not search:
+            raise ValueError('Either host_ids or search must be specified')
+        return [host.get('id') for host in self.iter_resources(resource_type='hosts', search=search)]
+
+    def set_hosts_power(self, action, host_ids=None, search=None, concurrency=FOREMAN_CONCURRENCY):
+        """ Execute a power action on many hosts at the same time
+
+        The hosts are either passed as a list of ids or found by a search query.
+        A failing host does not stop the other hosts, its ForemanError or the
+        requests exception of a failed connection is returned instead of the result.
+
+        Args:
+           action (str): Power action (e.g. start, stop, reboot, state)
+           host_ids (list): List of host ids
+           search (str): Search query to find hosts
+           concurrency (int): Maximum number of power actions executed at the same time
+        Returns:
+           dict: Result of the power action, ForemanError or RequestException per host id
+        """
+        def set_power(host_id):
+            try:
+                return host_id, self.set_host_power(host_id=host_id, action=action)
+            except (ForemanError, requests.exceptions.RequestException) as e:
+                return host_id, e
+
+        return dict(map_concurrent(set_power,
+                                   self._get_host_ids(host_ids=host_ids, search=search),
+                                   concurrency=concurrency,
+                                   ordered=False))
@@ -0,0 +1,215 @@
+'''
+Collect request metrics of Foreman clients
+'''
+
+import threading
+
+FOREMAN_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+FOREMAN_METRICS_PREFIX = 'foreman_client'
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    return '{' + ','.join('%s="%s"' % (key, _escape_label(value)) for key, value in labels) + '}'
+
+
+def _format_bound(bound):
+    return '%g' % bound
+
+
+class MetricsCollector(object):
+    """MetricsCollector Class
+
+    Count requests, latency, payload sizes, retries and errors per resource
+    type and HTTP verb. The collector is fed by the hooks of one or several
+    Foreman objects:
+
+        metrics = MetricsCollector()
+        foreman = Foreman(hostname, port, username, password)
+        metrics.register(foreman)
+        ...
+        print(metrics.to_prometheus())
+
+    Latency is recorded in a histogram with cumulative buckets like a
+    Prometheus histogram. Every attempt of a retried request is counted.
+    """
+    def __init__(self, buckets=None, prefix=FOREMAN_METRICS_PREFIX):
+        """Init
+
+        Args:
+          buckets (list): Upper bounds of the latency buckets in seconds
+          prefix (str): Prefix of the metric names in the Prometheus export
+        """
+        self.buckets = sorted(buckets or FOREMAN_LATENCY_BUCKETS)
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def register(self, foreman):
+        """Add the hooks feeding this collector to a Foreman object
+
+        Args:
+          foreman (Foreman): Client to collect metrics of
+        """
+        foreman.add_hook('after_response', self.on_response)
+        foreman.add_hook('on_error', self.on_error)
+        foreman.add_hook('on_retry', self.on_retry)
+
+    def unregister(self, foreman):
+        """Remove the hooks added by register
+
+        Args:
+          foreman (Foreman): Client to stop collecting metrics of
+        """
+        foreman.remove_hook('after_response', self.on_response)
+        foreman.remove_hook('on_error', self.on_error)
+        foreman.remove_hook('on_retry', self.on_retry)
+
+    def _get_series(self, info):
+        """Return the counters of the resource type and verb of a request, must hold the lock
+        """
+        key = (info.get('resource_type') or '', info.get('method') or '')
+        series = self._series.get(key)
+        if series is None:
+            series = {'requests': 0,
+                      'status': {},
+                      'latency_sum': 0.0,
+                      'latency_max': 0.0,
+                      'buckets': [0] * len(self.buckets),
+                      'bytes_sent': 0,
+                      'bytes_received': 0,
+                      'retries': 0,
+                      'errors': {}}
+            self._series[key] = series
+        return series
+
+    def _observe(self, series, info):
+        """Count a finished attempt, must hold the lock
+        """
+        elapsed = info.get('elapsed') or 0.0
+        series['requests'] += 1
+        series['latency_sum'] += elapsed
+        series['latency_max'] = max(series['latency_max'], elapsed)
+        for index, bound in enumerate(self.buckets):
+            if elapsed <= bound:
+                series['buckets'][index] += 1
+                break
+        series['bytes_sent'] += info.get('bytes_sent') or 0
+        series['bytes_received'] += info.get('bytes_received') or 0
+
+    def on_response(self, info):
+        """Hook called after every response"""
+        with self._lock:
+            series = self._get_series(info)
+            self._observe(series, info)
+            status = str(info.get('status_code'))
+            series['status'][status] = series['status'].get(status, 0) + 1
+
+    def on_error(self, info):
+        """Hook called after a connection error or an error response"""
+        error = info.get('error')
+        with self._lock:
+            series = self._get_series(info)
+            if error is not None:
+                # Connection errors do not reach after_response
+                self._observe(series, info)
+                reason = type(error).__name__
+            else:
+                reason = str(info.get('status_code'))
+            series['errors'][reason] = series['errors'].get(reason, 0) + 1
+
+    def on_retry(self, info):
+        """Hook called before a request is retried"""
+        with self._lock:
+            self._get_series(info)['retries'] += 1
+
+    def reset(self):
+        """Drop all collected metrics
+        """
+        with self._lock:
+            self._series = {}
+
+    def to_dict(self):
+        """Return the collected metrics
+
+        Returns:
+          dict: resource type -> HTTP verb -> dict with requests, status (status
+                code -> count), latency (sum, mean, max and cumulative buckets),
+                bytes_sent, bytes_received, retries and errors (status code or
+                exception name -> count)
+        """
+        result = {}
+        with self._lock:
+            for (resource_type, method), series in sorted(self._series.items()):
+                cumulative = 0
+                buckets = []
+                for bound, count in zip(self.buckets, series['buckets']):
+                    cumulative += count
+                    buckets.append((bound, cumulative))
+                requests = series['requests']
+                result.setdefault(resource_type, {})[method] = {
+                    'requests': requests,
+                    'status': dict(series['status']),
+                    'latency': {'sum': series['latency_sum'],
+                                'mean': series['latency_sum'] / requests if requests else 0.0,
+                                'max': series['latency_max'],
+                                'buckets': buckets},
+                    'bytes_sent': series['bytes_sent'],
+                    'bytes_received': series['bytes_received'],
+                    'retries': series['retries'],
+                    'errors': dict(series['errors'])}
+        return result
+
+    def to_prometheus(self):
+        """Return the collected metrics in the Prometheus text exposition format
+
+        Returns:
+          str
+        """
+        metrics = self.to_dict()
+        prefix = self.prefix
+        lines = []
+
+        def add_header(name, metric_type, description):
+            lines.append('# HELP %s_%s %s' % (prefix, name, description))
+            lines.append('# TYPE %s_%s %s' % (prefix, name, metric_type))
+
+        def series():
+            for resource_type in sorted(metrics):
+                for method in sorted(metrics[resource_type]):
+                    yield [('resource', resource_type), ('method', method)], metrics[resource_type][method]
+
+        add_header('request_duration_seconds', 'histogram', 'Duration of requests to the Foreman API')
+        for labels, values in series():
+            latency = values['latency']
+            for bound, count in latency['buckets']:
+                lines.append('%s_request_duration_seconds_bucket%s %d'
+                             % (prefix, _format_labels(labels + [('le', _format_bound(bound))]), count))
+            lines.append('%s_request_duration_seconds_bucket%s %d'
+                         % (prefix, _format_labels(labels + [('le', '+Inf')]), values['requests']))
+            lines.append('%s_request_duration_seconds_sum%s %r' % (prefix, _format_labels(labels), latency['sum']))
+            lines.append('%s_request_duration_seconds_count%s %d' % (prefix, _format_labels(labels), values['requests']))
+
+        add_header('requests_total', 'counter', 'Responses received from the Foreman API')
+        for labels, values in series():
+            for status in sorted(values['status']):
+                lines.append('%s_requests_total%s %d'
+                             % (prefix, _format_labels(labels + [('status', status)]), values['status'][status]))
+
+        for name, key, description in [('request_bytes_total', 'bytes_sent', 'Bytes sent in request bodies'),
+                                       ('response_bytes_total', 'bytes_received', 'Bytes received in response bodies'),
+                                       ('retries_total', 'retries', 'Requests sent again after a transient failure')]:
+            add_header(name, 'counter', description)
+            for labels, values in series():
+                lines.append('%s_%s%s %d' % (prefix, name, _format_labels(labels), values[key]))
+
+        add_header('errors_total', 'counter', 'Connection errors and error responses')
+        for labels, values in series():
+            for error in sorted(values['errors']):
+                lines.append('%s_errors_total%s %d'
+                             % (prefix, _format_labels(labels + [('error', error)]), values['errors'][error]))
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,370 @@
+'''
+Mirror Foreman resources into a local SQLite database
+'''
+
+import json
+import re
+import sqlite3
+import time
+
+from .foreman import ForemanError, FOREMAN_PER_PAGE
+from .search import Condition
+
+FOREMAN_MIRROR_RESOURCES = ['architectures', 'domains', 'environments', 'hostgroups', 'hosts', 'locations',
+                            'media', 'operatingsystems', 'organizations', 'ptables', 'smart_proxies', 'subnets']
+
+# Fields stored in own indexed columns besides id, name and updated_at
+FOREMAN_MIRROR_INDEX_FIELDS = {'hosts': ['hostgroup_id', 'domain_id', 'subnet_id', 'operatingsystem_id',
+                                         'environment_id', 'location_id', 'organization_id', 'ip', 'mac'],
+                               'hostgroups': ['parent_id', 'title'],
+                               'subnets': ['network', 'domain_ids'],
+                               'operatingsystems': ['family']}
+
+FOREMAN_MIRROR_FULL_SYNC_INTERVAL = 24 * 60 * 60
+
+# Items per page of the id listings used to find deleted items
+FOREMAN_MIRROR_ID_PER_PAGE = 1000
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def _check_identifier(name):
+    if not _IDENTIFIER.match(name):
+        raise ValueError('Invalid name: ' + name)
+    return name
+
+
+def _column_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True)
+    return value
+
+
+class ForemanMirror:
+    """ForemanMirror Class
+
+    Local copy of Foreman resources in a SQLite database.
+
+    Every resource type is stored in an own table with the id, name,
+    updated_at, the fields of FOREMAN_MIRROR_INDEX_FIELDS in indexed columns
+    and the whole item as JSON. Queries on these columns are answered by
+    SQLite, queries on other fields filter the decoded items.
+
+    sync first copies all items of a resource type. Later syncs only request
+    items whose updated_at is newer than the newest mirrored item. Deleted
+    items do not show up in this search, so every incremental sync also
+    lists the ids Foreman holds (thin listing, only id and name) and removes
+    the mirrored items which are missing. After full_sync_interval seconds
+    all items are copied again.
+
+    The mirror can be queried without a Foreman object, e.g. by offline
+    tools working on a database synced by another process. A ForemanMirror
+    object must only be used by the thread which created it.
+    """
+    def __init__(self, database, foreman=None, resources=None, index_fields=None,
+                 concurrency=1, per_page=FOREMAN_PER_PAGE, full_sync_interval=FOREMAN_MIRROR_FULL_SYNC_INTERVAL):
+        """Init
+
+        Args:
+          database (str): Path of the SQLite database, created if it does not exist
+          foreman (Foreman): Client to sync from, None for a read-only mirror
+          resources (list): Resource types to sync, defaults to FOREMAN_MIRROR_RESOURCES
+          index_fields (dict): Resource type -> fields to index, defaults to FOREMAN_MIRROR_INDEX_FIELDS
+          concurrency (int): Number of pages fetched at the same time
+          per_page (int): Number of items requested per page
+          full_sync_interval (int): Seconds after which all items are copied again, None to never
+                                    force a full sync
+        """
+        self.foreman = foreman
+        self.resources = resources or FOREMAN_MIRROR_RESOURCES
+        self.index_fields = index_fields if index_fields is not None else FOREMAN_MIRROR_INDEX_FIELDS
+        self.concurrency = concurrency
+        self.per_page = per_page
+        self.full_sync_interval = full_sync_interval
+        self._connection = sqlite3.connect(database)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS sync_state ('
+                                 'resource_type TEXT PRIMARY KEY, '
+                                 'last_updated_at TEXT, '
+                                 'last_full_sync REAL, '
+                                 'last_sync REAL, '
+                                 'count INTEGER)')
+        self._connection.commit()
+        self._columns = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close the database
+        """
+        self._connection.close()
+
+    def _get_columns(self, resource_type):
+        """Create the table of a resource type if needed and return its columns
+
+        Index fields added after the table was created are added as columns and
+        a full sync is forced to fill them.
+
+        Args:
+          resource_type (str): Resource type
+        Returns:
+          list of column names
+        """
+        if resource_type in self._columns:
+            return self._columns[resource_type]
+
+        table = _check_identifier(resource_type)
+        fields = [_check_identifier(field) for field in self.index_fields.get(resource_type, [])
+                  if field not in ['id', 'name', 'updated_at', 'data']]
+        connection = self._connection
+        connection.execute('CREATE TABLE IF NOT EXISTS %s ('
+                           'id INTEGER PRIMARY KEY, name TEXT, updated_at TEXT, data TEXT)' % table)
+        existing = [row[1] for row in connection.execute('PRAGMA table_info(%s)' % table)]
+        missing = [field for field in fields if field not in existing]
+        for field in missing:
+            connection.execute('ALTER TABLE %s ADD COLUMN %s' % (table, field))
+        if missing and connection.execute('SELECT COUNT(*) FROM %s' % table).fetchone()[0]:
+            connection.execute('UPDATE sync_state SET last_full_sync = NULL WHERE resource_type = ?',
+                               (resource_type,))
+        for field in ['name', 'updated_at'] + fields:
+            connection.execute('CREATE INDEX IF NOT EXISTS %s_%s ON %s (%s)' % (table, field, table, field))
+        connection.commit()
+        self._columns[resource_type] = ['id', 'name', 'updated_at', 'data'] + fields
+        return self._columns[resource_type]
+
+    def _get_state(self, resource_type):
+        row = self._connection.execute('SELECT last_updated_at, last_full_sync, last_sync, count '
+                                       'FROM sync_state WHERE resource_type = ?', (resource_type,)).fetchone()
+        if row is None:
+            return {}
+        return {'last_updated_at': row[0], 'last_full_sync': row[1], 'last_sync': row[2], 'count': row[3]}
+
+    def _store(self, resource_type, items):
+        """Insert or replace items
+
+        Args:
+          resource_type (str): Resource type
+          items (iterable): Items to store
+        Returns:
+          tuple of the set of stored ids and the newest updated_at
+        """
+        columns = self._get_columns(resource_type)
+        statement = 'INSERT OR REPLACE INTO %s (%s) VALUES (%s)' % (resource_type, ', '.join(columns),
+                                                                    ', '.join('?' * len(columns)))
+        ids = set()
+        newest = [None]
+
+        def rows():
+            for item in items:
+                ids.add(item.get('id'))
+                updated_at = item.get('updated_at')
+                if updated_at and (newest[0] is None or updated_at > newest[0]):
+                    newest[0] = updated_at
+                yield tuple([item.get('id'), item.get('name'), updated_at, json.dumps(item, sort_keys=True)] +
+                            [_column_value(item.get(field)) for field in columns[4:]])
+
+        self._connection.executemany(statement, rows())
+        return ids, newest[0]
+
+    def _get_remote_ids(self, resource_type):
+        """Return the ids of all items Foreman holds
+
+        The pages are requested with thin, so Foreman only returns id and name.
+
+        Args:
+          resource_type (str): Resource type
+        Returns:
+          set of ids
+        """
+        items = self.foreman.iter_resources(resource_type=resource_type, per_page=FOREMAN_MIRROR_ID_PER_PAGE,
+                                            concurrency=self.concurrency, ordered=False, thin=True)
+        return set(item.get('id') for item in items)
+
+    def _delete_stale(self, resource_type, ids):
+        """Remove the mirrored items whose id is not in ids
+
+        Args:
+          resource_type (str): Resource type
+          ids (set): Ids of the items which still exist
+        Returns:
+          int: Number of removed items
+        """
+        stale = [(row[0],) for row in self._connection.execute('SELECT id FROM %s' % resource_type)
+                 if row[0] not in ids]
+        self._connection.executemany('DELETE FROM %s WHERE id = ?' % resource_type, stale)
+        return len(stale)
+
+    def sync_resource(self, resource_type, full=False):
+        """Update the mirror of one resource type
+
+        Args:
+          resource_type (str): Resource type
+          full (bool): Copy all items even if an incremental sync is possible
+        Returns:
+          dict with mode (full or incremental), updated, deleted, count and seconds
+        """
+        if self.foreman is None:
+            raise ValueError('A Foreman object is required to sync')
+        start = time.time()
+        self._get_columns(resource_type)
+        state = self._get_state(resource_type)
+        now = time.time()
+        if (state.get('last_updated_at') is None or state.get('last_full_sync') is None or
+                (self.full_sync_interval is not None and now - state['last_full_sync'] > self.full_sync_interval)):
+            full = True
+
+        deleted = 0
+        last_updated_at = state.get('last_updated_at')
+        if not full:
+            try:
+                # >= because several items can share the second of the newest item
+                items = self.foreman.iter_resources(resource_type=resource_type, per_page=self.per_page,
+                                                    search=Condition('updated_at', '>=', last_updated_at),
+                                                    concurrency=self.concurrency)
+                ids, newest = self._store(resource_type, items)
+                deleted = self._delete_stale(resource_type, self._get_remote_ids(resource_type))
+            except ForemanError as e:
+                self._connection.rollback()
+                if e.status_code not in [400, 422]:
+                    raise
+                # updated_at cannot be searched for this resource type
+                full = True
+
+        if full:
+            items = self.foreman.iter_resources(resource_type=resource_type, per_page=self.per_page,
+                                                concurrency=self.concurrency)
+            ids, newest = self._store(resource_type, items)
+            deleted = self._delete_stale(resource_type, ids)
+            state['last_full_sync'] = now
+
+        if newest and (last_updated_at is None or newest > last_updated_at or full):
+            last_updated_at = newest
+        count = self.count(resource_type)
+        self._connection.execute('INSERT OR REPLACE INTO sync_state '
+                                 '(resource_type, last_updated_at, last_full_sync, last_sync, count) '
+                                 'VALUES (?, ?, ?, ?, ?)',
+                                 (resource_type, last_updated_at, state.get('last_full_sync'), now, count))
+        self._connection.commit()
+        return {'mode': 'full' if full else 'incremental',
+                'updated': len(ids),
+                'deleted': deleted,
+                'count': count,
+                'seconds': time.time() - start}
+
+    def sync(self, resources=None, full=False):
+        """Update the mirror of several resource types
+
+        Args:
+          resources (list): Resource types, defaults to the resources of the mirror
+          full (bool): Copy all items even if an incremental sync is possible
+        Returns:
+          dict: resource type -> result of sync_resource
+        """
+        return dict((resource_type, self.sync_resource(resource_type=resource_type, full=full))
+                    for resource_type in resources or self.resources)
+
+    def sync_status(self):
+        """Return the state of the last sync of every resource type
+
+        Returns:
+          dict: resource type -> dict with last_updated_at, last_full_sync, last_sync and count
+        """
+        rows = self._connection.execute('SELECT resource_type FROM sync_state ORDER BY resource_type')
+        return dict((row[0], self._get_state(row[0])) for row in rows.fetchall())
+
+    def _build_where(self, resource_type, filters):
+        """Split filters into a SQL condition on columns and the remaining filters
+
+        Returns:
+          tuple of SQL condition, parameters and remaining filters
+        """
+        columns = self._get_columns(resource_type)
+        conditions = []
+        parameters = []
+        remaining = {}
+        for key, value in sorted(filters.items()):
+            if key not in columns or key == 'data':
+                remaining[key] = value
+            elif value is None:
+                conditions.append('%s IS NULL' % key)
+            elif isinstance(value, (list, tuple, set)):
+                conditions.append('%s IN (%s)' % (key, ', '.join('?' * len(value))))
+                parameters.extend(_column_value(item) for item in value)
+            else:
+                conditions.append('%s = ?' % key)
+                parameters.append(_column_value(value))
+        where = (' WHERE ' + ' AND '.join(conditions)) if conditions else ''
+        return where, parameters, remaining
+
+    def query(self, resource_type, order_by=None, limit=None, **filters):
+        """Return mirrored items matching all filters
+
+        A filter value matches if it is equal to the field, list values match
+        any of their items. Filters on id, name, updated_at and index fields
+        are answered by SQLite, other fields are compared after decoding.
+
+        Args:
+          resource_type (str): Resource type
+          order_by (str): Field to order by, optionally followed by ASC or DESC.
+                          Only id, name, updated_at and index fields.
+          limit (int): Maximum number of items to return
+          filters: Field -> value
+        Returns:
+          list of dict
+        """
+        where, parameters, remaining = self._build_where(resource_type, filters)
+        statement = 'SELECT data FROM %s%s' % (resource_type, where)
+        if order_by:
+            field, _, direction = order_by.partition(' ')
+            if field not in self._get_columns(resource_type) or direction.upper() not in ['', 'ASC', 'DESC']:
+                raise ValueError('Cannot order by: ' + order_by)
+            statement += ' ORDER BY %s %s' % (field, direction.upper() or 'ASC')
+        if limit is not None and not remaining:
+            statement += ' LIMIT %d' % int(limit)
+
+        results = []
+        for row in self._connection.execute(statement, parameters):
+            item = json.loads(row[0])
+            if all(item.get(key) in value if isinstance(value, (list, tuple, set)) else item.get(key) == value
+                   for key, value in remaining.items()):
+                results.append(item)
+                if limit is not None and len(results) >= limit:
+                    break
+        return results
+
+    def get(self, resource_type, resource_id=None, name=None):
+        """Return one mirrored item by id or name
+
+        Args:
+          resource_type (str): Resource type
+          resource_id (int): Id of the item
+          name (str): Name of the item
+        Returns:
+          dict or None
+        """
+        if resource_id is not None:
+            results = self.query(resource_type, id=resource_id, limit=1)
+        elif name is not None:
+            results = self.query(resource_type, name=name, limit=1)
+        else:
+            raise ValueError('Either resource_id or name must be specified')
+        return results[0] if results else None
+
+    def count(self, resource_type, **filters):
+        """Return the number of mirrored items matching all filters
+
+        Args:
+          resource_type (str): Resource type
+          filters: Field -> value, see query
+        Returns:
+          int
+        """
+        where, parameters, remaining = self._build_where(resource_type, filters)
+        if remaining:
+            return len(self.query(resource_type, **filters))
+        return self._connection.execute('SELECT COUNT(*) FROM %s%s' % (resource_type, where),
+                                        parameters).fetchone()[0]
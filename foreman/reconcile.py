@@ -0,0 +1,522 @@
+'''
+Reconcile Foreman with a declarative configuration
+'''
+
+import sys
+import threading
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+from .compute import is_same_value
+from .foreman import ForemanError, map_concurrent, FOREMAN_CONCURRENCY, FOREMAN_RESOURCES
+from .restore import FOREMAN_RESTORE_LEVELS, FOREMAN_ASSOCIATION_FIELDS, FOREMAN_NESTED_RESOURCES, \
+    FOREMAN_READ_ONLY_FIELDS, get_depth, get_reference_type
+
+# Configuration keys which differ from the resource type
+FOREMAN_CONFIG_ALIASES = {'medias': 'media',
+                          'partition_tables': 'ptables'}
+
+# Fields Foreman never returns, they are only sent when a resource is created
+FOREMAN_WRITE_ONLY_FIELDS = ['password', 'root_pass']
+
+FOREMAN_STATE_PRESENT = 'present'
+FOREMAN_STATE_ABSENT = 'absent'
+
+
+class Pending(object):
+    """Reference to a resource which is created by the same run"""
+    def __init__(self, resource_type, name):
+        self.resource_type = resource_type
+        self.name = name
+
+    def __repr__(self):
+        return '(%s %s after apply)' % (FOREMAN_RESOURCES.get(self.resource_type, self.resource_type), self.name)
+
+
+def is_pending(value):
+    """Return True if a value of a desired item refers to a resource which is not created yet"""
+    if isinstance(value, list):
+        return any(isinstance(entry, Pending) for entry in value)
+    return isinstance(value, Pending)
+
+
+def load_config(config_file):
+    """Load a configuration file
+
+    Args:
+      config_file (str): Path of a YAML file mapping resource types to lists of items
+    Returns:
+      dict: resource type -> list of items
+    """
+    with open(config_file, 'r') as config:
+        return normalize_config(yaml.load(config, Loader=SafeLoader) or {})
+
+
+def normalize_config(config):
+    """Map configuration keys to resource types
+
+    Args:
+      config (dict): Configuration key -> list of items
+    Returns:
+      dict: resource type -> list of items
+    """
+    resources = {}
+    for key, items in config.items():
+        resource_type = FOREMAN_CONFIG_ALIASES.get(key, key)
+        if resource_type not in FOREMAN_RESOURCES:
+            raise ValueError('Unknown resource type: ' + key)
+        resources.setdefault(resource_type, []).extend(items or [])
+    return resources
+
+
+def get_identity(resource_type, item):
+    """Return the key a desired or existing item is matched by
+
+    Nested resources (see FOREMAN_NESTED_RESOURCES) are matched by their title
+    (parent titles and name separated by /), all other resource types by name.
+    """
+    if resource_type in FOREMAN_NESTED_RESOURCES:
+        if item.get('title'):
+            return item.get('title')
+        parent = item.get('parent')
+        if parent:
+            return parent + '/' + item.get('name')
+    return item.get('name')
+
+
+class ForemanReconciler:
+    """ForemanReconciler Class
+
+    Bring Foreman in line with a configuration of desired resources.
+
+    The current items of all configured and referenced resource types are
+    fetched in bulk and compared with the configuration. Only the needed
+    creates, updates and deletes are planned (see plan) and sent (see apply).
+    Configurations without changes cost one listing per resource type.
+    Fields which are missing from the listings are compared with the detail
+    records, fields Foreman does not return at all are not compared.
+
+    Items are matched by name (nested resources by title). References to other
+    resources are given by name, e.g. domain: example.com for domain_id or
+    domains: [example.com] for domain_ids. Items with state: absent are
+    deleted.
+
+    Resource types are applied level by level (see FOREMAN_RESTORE_LEVELS),
+    all changes of one level are sent at the same time. References to
+    resources which are created at a later level are left out and set by an
+    update once all levels are applied. Deletes are sent after all other
+    changes, highest level and deepest nested resources first.
+    """
+    def __init__(self, foreman, concurrency=FOREMAN_CONCURRENCY, output=None):
+        """Init
+
+        Args:
+          foreman (Foreman): Client to reconcile
+          concurrency (int): Number of requests sent at the same time
+          output (file): Stream to write the plan and the results to, defaults to sys.stdout
+        """
+        self.foreman = foreman
+        self.concurrency = concurrency
+        self.output = output
+        self._lock = threading.Lock()
+        self._current = {}
+        self._ids = {}
+        self._planned = {}
+        self._details = {}
+        self._warned = set()
+
+    def _report(self, message):
+        output = self.output if self.output is not None else sys.stdout
+        with self._lock:
+            output.write(message + '\n')
+            output.flush()
+
+    def _parse_item(self, resource_type, item):
+        """Split a desired item into plain fields, references and associations
+
+        Args:
+          resource_type (str): Resource type of the item
+          item (dict): Desired item
+        Returns:
+          tuple of dicts: field -> value, field -> (resource type, name) and
+                          field -> (resource type, list of names)
+        """
+        fields = {}
+        references = {}
+        associations = {}
+        for key, value in item.items():
+            if key == 'state' or key in FOREMAN_READ_ONLY_FIELDS:
+                continue
+            reference_type = get_reference_type(resource_type, key + '_id')
+            if reference_type and not isinstance(value, (dict, list)):
+                references[key + '_id'] = (reference_type, value)
+            elif key in FOREMAN_ASSOCIATION_FIELDS and isinstance(value, list):
+                associations[FOREMAN_ASSOCIATION_FIELDS[key]] = (key, value)
+            else:
+                fields[key] = value
+        return fields, references, associations
+
+    def _get_referenced_types(self, desired):
+        referenced = set()
+        for resource_type, items in desired.items():
+            for item in items:
+                _, references, associations = self._parse_item(resource_type, item)
+                referenced.update(resource_type for resource_type, _ in references.values())
+                referenced.update(resource_type for resource_type, _ in associations.values())
+        return referenced
+
+    def _fetch_current(self, resource_types):
+        """Fetch all items of several resource types at the same time
+
+        The resource types and their pages share concurrency, so no more
+        requests than concurrency are sent at the same time.
+        """
+        type_concurrency = max(min(len(resource_types), self.concurrency), 1)
+        page_concurrency = max(self.concurrency // type_concurrency, 1)
+
+        def fetch(resource_type):
+            return resource_type, self.foreman.get_resources(resource_type=resource_type,
+                                                             concurrency=page_concurrency)
+
+        for resource_type, items in map_concurrent(fetch, sorted(resource_types),
+                                                   concurrency=type_concurrency, ordered=False):
+            self._current[resource_type] = dict((get_identity(resource_type, item), item) for item in items)
+            ids = self._ids.setdefault(resource_type, {})
+            for item in items:
+                ids[item.get('name')] = item.get('id')
+                if item.get('title'):
+                    ids[item.get('title')] = item.get('id')
+
+    def _resolve(self, resource_type, name):
+        """Return the id of a resource given by name
+
+        Returns:
+          id, Pending if the resource is created by this run or None if it is unknown
+        """
+        if name is None or isinstance(name, int):
+            return name
+        with self._lock:
+            resource_id = self._ids.get(resource_type, {}).get(name)
+        if resource_id is not None:
+            return resource_id
+        if name in self._planned.get(resource_type, set()):
+            return Pending(resource_type, name)
+        return None
+
+    def _build_data(self, resource_type, item, allow_pending=True):
+        """Return the data to send for a desired item and the unresolved references
+
+        Args:
+          resource_type (str): Resource type of the item
+          item (dict): Desired item
+          allow_pending (bool): Accept references to resources created by this run
+        Returns:
+          tuple of dict and list of missing references
+        """
+        fields, references, associations = self._parse_item(resource_type, item)
+        data = dict(fields)
+        missing = []
+        for field, (resource_type, name) in references.items():
+            resource_id = self._resolve(resource_type, name)
+            if (resource_id is None and name is not None) or \
+                    (isinstance(resource_id, Pending) and not allow_pending):
+                missing.append('%s %s' % (FOREMAN_RESOURCES[resource_type], name))
+            data[field] = resource_id
+        for field, (resource_type, names) in associations.items():
+            ids = []
+            for name in names:
+                resource_id = self._resolve(resource_type, name)
+                if resource_id is None or (isinstance(resource_id, Pending) and not allow_pending):
+                    missing.append('%s %s' % (FOREMAN_RESOURCES[resource_type], name))
+                else:
+                    ids.append(resource_id)
+            data[field] = ids
+        return data, missing
+
+    def _current_value(self, current, field):
+        """Return the current value of a field, the second value is False if Foreman did not return it"""
+        if field in current:
+            return current.get(field), True
+        if field.endswith('_ids'):
+            for association, ids_field in FOREMAN_ASSOCIATION_FIELDS.items():
+                if ids_field == field and isinstance(current.get(association), list):
+                    return [entry.get('id') for entry in current.get(association) if isinstance(entry, dict)], True
+        return None, False
+
+    def _diff(self, current, data):
+        """Compare current and desired data
+
+        Returns:
+          tuple of changes (field -> (current, desired)) and the fields which
+          could not be compared
+        """
+        changes = {}
+        unknown = []
+        for field, value in data.items():
+            if field in FOREMAN_WRITE_ONLY_FIELDS:
+                continue
+            current_value, known = self._current_value(current, field)
+            if not known:
+                unknown.append(field)
+            elif field.endswith('_ids') and isinstance(value, list):
+                if any(isinstance(entry, Pending) for entry in value) or \
+                        sorted(current_value or []) != sorted(value):
+                    changes[field] = (current_value, value)
+            elif isinstance(value, Pending) or not is_same_value(current_value, value):
+                changes[field] = (current_value, value)
+        return changes, unknown
+
+    def plan(self, desired):
+        """Compare the desired configuration with Foreman
+
+        Args:
+          desired (dict): Resource type -> list of desired items (see normalize_config)
+        Returns:
+          list of dict: One action per desired item containing resource_type, name,
+                        action (create, update, delete, unchanged or error), id,
+                        changes and error
+        """
+        self._current = {}
+        self._ids = {}
+        self._planned = {}
+        self._details = {}
+        self._fetch_current(set(desired) | self._get_referenced_types(desired))
+
+        for resource_type, items in desired.items():
+            for item in items:
+                if item.get('state', FOREMAN_STATE_PRESENT) != FOREMAN_STATE_ABSENT and \
+                        get_identity(resource_type, item) not in self._current[resource_type]:
+                    self._planned.setdefault(resource_type, set()).add(get_identity(resource_type, item))
+                    self._planned[resource_type].add(item.get('name'))
+
+        actions = []
+        incomplete = []
+        for level, resource_types in enumerate(FOREMAN_RESTORE_LEVELS):
+            for resource_type in resource_types:
+                for item in desired.get(resource_type, []):
+                    name = get_identity(resource_type, item)
+                    current = self._current[resource_type].get(name)
+                    action = {'resource_type': resource_type, 'name': name, 'level': level, 'item': item,
+                              'id': current.get('id') if current else None, 'changes': {}}
+                    actions.append(action)
+                    state = item.get('state', FOREMAN_STATE_PRESENT)
+                    if state not in [FOREMAN_STATE_PRESENT, FOREMAN_STATE_ABSENT]:
+                        action['action'] = 'error'
+                        action['error'] = 'Unknown state: ' + str(state)
+                        continue
+                    if state == FOREMAN_STATE_ABSENT:
+                        action['action'] = 'delete' if current else 'unchanged'
+                        continue
+
+                    data, missing = self._build_data(resource_type, item)
+                    if missing:
+                        action['action'] = 'error'
+                        action['error'] = 'Unknown ' + ', '.join(sorted(missing))
+                    elif current is None:
+                        action['action'] = 'create'
+                        action['changes'] = dict((field, (None, value)) for field, value in data.items())
+                    else:
+                        action['changes'], unknown = self._diff(current, data)
+                        action['action'] = 'update' if action['changes'] else 'unchanged'
+                        if unknown:
+                            incomplete.append((action, unknown))
+
+        # The listings do not contain all fields. The details of the first item of each resource type
+        # show which fields the detail records contain, the others are only fetched if they help.
+        first = {}
+        for action, _ in incomplete:
+            first.setdefault(action['resource_type'], action)
+        for _ in map_concurrent(self._fetch_details, list(first.values()), concurrency=self.concurrency,
+                                ordered=False):
+            pass
+
+        remaining = []
+        for action, unknown in incomplete:
+            resource_type = action['resource_type']
+            if action is first[resource_type]:
+                continue
+            details = self._details.get(resource_type)
+            if details is None or [field for field in unknown if self._current_value(details, field)[1]]:
+                remaining.append(action)
+            else:
+                self._warn_unknown(resource_type, unknown)
+        for _ in map_concurrent(self._fetch_details, remaining, concurrency=self.concurrency, ordered=False):
+            pass
+        return actions
+
+    def _fetch_details(self, action):
+        """Compare an existing item including the fields only its detail record contains"""
+        resource_type = action['resource_type']
+        try:
+            details = self.foreman.get_resource(resource_type=resource_type, data={'id': action['id']}) or {}
+        except ForemanError as e:
+            action['action'] = 'error'
+            action['error'] = '%s (%s)' % (e.message, e.status_code)
+            return action
+        with self._lock:
+            self._details.setdefault(resource_type, details)
+        current = dict(self._current[resource_type][action['name']])
+        current.update(details)
+        data, _ = self._build_data(resource_type, action['item'])
+        action['changes'], unknown = self._diff(current, data)
+        self._warn_unknown(resource_type, unknown)
+        action['action'] = 'update' if action['changes'] else 'unchanged'
+        return action
+
+    def _warn_unknown(self, resource_type, fields):
+        """Warn once per resource type about fields Foreman does not return, they are not compared"""
+        with self._lock:
+            fields = [field for field in sorted(fields) if (resource_type, field) not in self._warned]
+            self._warned.update((resource_type, field) for field in fields)
+        for field in fields:
+            self._report('Warning: Foreman does not return %s of %s, it is not compared' % (field, resource_type))
+
+    def _get_batches(self, actions):
+        """Split the actions of one level into batches which can be sent at the same time
+
+        Batches are ordered by nesting depth, parents first. Nested resources
+        are created in this order and deleted in reverse order.
+        """
+        depths = {}
+        for action in actions:
+            depth = 0
+            if action['resource_type'] in FOREMAN_NESTED_RESOURCES:
+                depth = get_depth(action['name'])
+            depths.setdefault(depth, []).append(action)
+        return [depths[depth] for depth in sorted(depths)]
+
+    def _apply_action(self, action):
+        """Send the change of one action"""
+        resource_type = action['resource_type']
+        try:
+            if action['action'] == 'delete':
+                action['result'] = self.foreman.delete_resource(resource_type=resource_type,
+                                                                data={'id': action['id']})
+                return action
+
+            data, missing = self._build_data(resource_type, action['item'])
+            if missing:
+                action['error'] = 'Unknown ' + ', '.join(sorted(missing))
+                return action
+            deferred = [field for field, value in data.items() if is_pending(value)]
+            for field in deferred:
+                del data[field]
+            if deferred:
+                action['deferred'] = deferred
+            if action['action'] == 'create':
+                action['result'] = self.foreman.post_resource(resource_type=resource_type,
+                                                              resource=FOREMAN_RESOURCES[resource_type],
+                                                              data=data)
+                with self._lock:
+                    ids = self._ids.setdefault(resource_type, {})
+                    ids[action['name']] = action['result'].get('id')
+                    ids[action['item'].get('name')] = action['result'].get('id')
+                action['id'] = action['result'].get('id')
+            else:
+                changed = dict((field, data[field]) for field in action['changes'] if field in data)
+                if changed:
+                    action['result'] = self.foreman.put_resource(resource_type=resource_type,
+                                                                 resource_id=action['id'],
+                                                                 data={FOREMAN_RESOURCES[resource_type]: changed})
+        except ForemanError as e:
+            action['error'] = '%s (%s)' % (e.message, e.status_code)
+        return action
+
+    def _apply_deferred(self, action):
+        """Set the references left out by _apply_action once all levels are applied"""
+        resource_type = action['resource_type']
+        data, missing = self._build_data(resource_type, action['item'], allow_pending=False)
+        if missing:
+            action['error'] = 'Unknown ' + ', '.join(sorted(missing))
+            return action
+        deferred = dict((field, data[field]) for field in action['deferred'])
+        try:
+            action['result'] = self.foreman.put_resource(resource_type=resource_type,
+                                                         resource_id=action['id'],
+                                                         data={FOREMAN_RESOURCES[resource_type]: deferred})
+        except ForemanError as e:
+            action['error'] = '%s (%s)' % (e.message, e.status_code)
+        return action
+
+    def apply(self, actions):
+        """Send the changes of planned actions
+
+        Args:
+          actions (list): Actions returned by plan
+        Returns:
+          list of dict: The actions, changed ones contain the result or error
+        """
+        for level in range(len(FOREMAN_RESTORE_LEVELS)):
+            level_actions = [action for action in actions
+                             if action['level'] == level and action['action'] in ['create', 'update']]
+            for batch in self._get_batches(level_actions):
+                for action in map_concurrent(self._apply_action, batch, concurrency=self.concurrency,
+                                             ordered=False):
+                    if not action.get('deferred') or action.get('error'):
+                        self._report_result(action)
+
+        batch = [action for action in actions if action.get('deferred') and not action.get('error')]
+        for action in map_concurrent(self._apply_deferred, batch, concurrency=self.concurrency, ordered=False):
+            self._report_result(action)
+
+        for level in reversed(range(len(FOREMAN_RESTORE_LEVELS))):
+            level_actions = [action for action in actions
+                             if action['level'] == level and action['action'] == 'delete']
+            for batch in reversed(self._get_batches(level_actions)):
+                for action in map_concurrent(self._apply_action, batch, concurrency=self.concurrency,
+                                             ordered=False):
+                    self._report_result(action)
+        return actions
+
+    def _report_result(self, action):
+        if action.get('error'):
+            self._report('Error: %s %s %s: %s' % (action['action'], action['resource_type'], action['name'],
+                                                  action['error']))
+        else:
+            self._report('Done: %s %s %s' % (action['action'], action['resource_type'], action['name']))
+
+    def print_plan(self, actions):
+        """Print the planned changes and a summary
+        """
+        symbols = {'create': '+', 'update': '~', 'delete': '-', 'error': '!'}
+        for action in actions:
+            if action['action'] == 'unchanged':
+                continue
+            self._report('%s %s %s %s' % (symbols[action['action']], action['action'], action['resource_type'],
+                                          action['name']))
+            if action['action'] == 'error':
+                self._report('    ' + action['error'])
+            for field in sorted(action['changes']):
+                current, desired = action['changes'][field]
+                if field in FOREMAN_WRITE_ONLY_FIELDS:
+                    desired = '(sensitive)'
+                if action['action'] == 'create':
+                    self._report('    %s: %r' % (field, desired))
+                else:
+                    self._report('    %s: %r -> %r' % (field, current, desired))
+        counts = dict((name, len([action for action in actions if action['action'] == name]))
+                      for name in ['create', 'update', 'delete', 'unchanged', 'error'])
+        if not counts['create'] and not counts['update'] and not counts['delete'] and not counts['error']:
+            self._report('No changes. %d items up to date.' % counts['unchanged'])
+        else:
+            self._report('Plan: %(create)d to create, %(update)d to update, %(delete)d to delete, '
+                         '%(unchanged)d unchanged, %(error)d errors.' % counts)
+
+    def run(self, desired, dry_run=False):
+        """Plan and apply a configuration
+
+        Args:
+          desired (dict): Resource type -> list of desired items (see normalize_config)
+          dry_run (bool): Only print the plan
+        Returns:
+          list of actions, see plan and apply
+        """
+        actions = self.plan(desired)
+        self.print_plan(actions)
+        if dry_run or not [action for action in actions if action['action'] in ['create', 'update', 'delete']]:
+            return actions
+        return self.apply(actions)
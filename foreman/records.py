@@ -0,0 +1,173 @@
+'''
+Compact records for large result sets
+'''
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+FOREMAN_RECORD_MAX_INTERNED = 100000
+
+
+class RecordSchema(object):
+    """RecordSchema Class
+
+    Field names shared by all records with the same keys.
+    """
+    __slots__ = ('fields', 'index')
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self.index = dict((field, position) for position, field in enumerate(self.fields))
+
+
+def _restore_record(fields, values):
+    return Record(RecordSchema(fields), values)
+
+
+class Record(object):
+    """Record Class
+
+    Read-only resource stored as a tuple of values and a shared RecordSchema
+    instead of a dict. Values can be read like from a dict (record['name'],
+    record.get('name'), keys(), items(), iteration over the keys) or as
+    attributes (record.name). to_dict() returns a plain dict.
+    """
+    __slots__ = ('_schema', '_values')
+
+    def __init__(self, schema, values):
+        self._schema = schema
+        self._values = values
+
+    def __getitem__(self, key):
+        try:
+            return self._values[self._schema.index[key]]
+        except KeyError:
+            raise KeyError(key)
+
+    def __getattr__(self, name):
+        try:
+            return self._values[self._schema.index[name]]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __contains__(self, key):
+        return key in self._schema.index
+
+    def __iter__(self):
+        return iter(self._schema.fields)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            other = other.to_dict()
+        return isinstance(other, dict) and self.to_dict() == other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Record(%r)' % self.to_dict()
+
+    def __reduce__(self):
+        return _restore_record, (self._schema.fields, self._values)
+
+    def get(self, key, default=None):
+        position = self._schema.index.get(key)
+        if position is None:
+            return default
+        return self._values[position]
+
+    def keys(self):
+        return list(self._schema.fields)
+
+    def values(self):
+        return list(self._values)
+
+    def items(self):
+        return list(zip(self._schema.fields, self._values))
+
+    def to_dict(self):
+        """Return the record as plain dict
+
+        Returns:
+          dict
+        """
+        return dict(zip(self._schema.fields, self._values))
+
+
+class RecordFactory(object):
+    """RecordFactory Class
+
+    Convert dicts into Records. Records with the same keys share one
+    RecordSchema and equal string values (e.g. hostgroup or domain names
+    repeated by thousands of hosts) are stored only once. If fields is set
+    only these keys are kept.
+
+    A factory can be passed to several get_resources calls to share the
+    schemas and values between them.
+    """
+    def __init__(self, fields=None, intern_values=True, max_interned=FOREMAN_RECORD_MAX_INTERNED):
+        """Init
+
+        Args:
+          fields (list): Keys to keep, None keeps all keys
+          intern_values (bool): Store equal string values only once
+          max_interned (int): Maximum number of distinct values to share
+        """
+        self.fields = tuple(fields) if fields is not None else None
+        self.intern_values = intern_values
+        self.max_interned = max_interned
+        self._schemas = {}
+        self._interned = {}
+
+    def _get_schema(self, fields):
+        schema = self._schemas.get(fields)
+        if schema is None:
+            schema = self._schemas.setdefault(fields, RecordSchema(fields))
+        return schema
+
+    def _intern(self, value):
+        if not isinstance(value, string_types):
+            return value
+        interned = self._interned.get(value)
+        if interned is not None:
+            return interned
+        if len(self._interned) < self.max_interned:
+            return self._interned.setdefault(value, value)
+        return value
+
+    def __call__(self, item):
+        """Convert a dict into a Record
+
+        Args:
+          item (dict): Resource
+        Returns:
+          Record
+        """
+        if self.fields is None:
+            fields = tuple(item)
+        else:
+            fields = tuple(field for field in self.fields if field in item)
+        if self.intern_values:
+            values = tuple(self._intern(item[field]) for field in fields)
+        else:
+            values = tuple(item[field] for field in fields)
+        return Record(self._get_schema(fields), values)
+
+
+def project(item, fields):
+    """Return a dict containing only some keys of an item
+
+    Args:
+      item (dict): Resource
+      fields (list): Keys to keep
+    Returns:
+      dict
+    """
+    return dict((field, item[field]) for field in fields if field in item)
@@ -0,0 +1,329 @@
+'''
+Restore Foreman configuration from YAML backup files
+'''
+
+import json
+import os
+import threading
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+from .foreman import Foreman, map_concurrent, FOREMAN_CONCURRENCY, FOREMAN_POOL_MAXSIZE, FOREMAN_RESOURCES
+from .utils import ErrorSummary
+
+# Resource types in the order they have to be created. Resource types on the
+# same level do not depend on each other and are restored at the same time.
+FOREMAN_RESTORE_LEVELS = [['architectures', 'common_parameters', 'compute_profiles', 'compute_resources',
+                           'environments', 'locations', 'organizations', 'smart_proxies'],
+                          ['operatingsystems'],
+                          ['media', 'ptables', 'config_templates'],
+                          ['domains'],
+                          ['subnets'],
+                          ['hostgroups'],
+                          ['hosts']]
+
+# Fields referencing a single resource and the referenced resource type
+FOREMAN_REFERENCE_FIELDS = {'architecture_id': 'architectures',
+                            'compute_profile_id': 'compute_profiles',
+                            'compute_resource_id': 'compute_resources',
+                            'dhcp_id': 'smart_proxies',
+                            'dns_id': 'smart_proxies',
+                            'domain_id': 'domains',
+                            'environment_id': 'environments',
+                            'hostgroup_id': 'hostgroups',
+                            'location_id': 'locations',
+                            'medium_id': 'media',
+                            'operatingsystem_id': 'operatingsystems',
+                            'organization_id': 'organizations',
+                            'ptable_id': 'ptables',
+                            'puppet_ca_proxy_id': 'smart_proxies',
+                            'puppet_proxy_id': 'smart_proxies',
+                            'subnet_id': 'subnets',
+                            'tftp_id': 'smart_proxies'}
+
+# Fields containing a list of associated resources and the field to pass their ids in
+FOREMAN_ASSOCIATION_FIELDS = {'architectures': 'architecture_ids',
+                              'compute_resources': 'compute_resource_ids',
+                              'config_templates': 'config_template_ids',
+                              'domains': 'domain_ids',
+                              'environments': 'environment_ids',
+                              'hostgroups': 'hostgroup_ids',
+                              'locations': 'location_ids',
+                              'media': 'medium_ids',
+                              'operatingsystems': 'operatingsystem_ids',
+                              'organizations': 'organization_ids',
+                              'ptables': 'ptable_ids',
+                              'smart_proxies': 'smart_proxy_ids',
+                              'subnets': 'subnet_ids'}
+
+FOREMAN_READ_ONLY_FIELDS = ['id', 'created_at', 'updated_at', 'title']
+
+# Nested resource types whose names are only unique below their parent, they are matched by title
+FOREMAN_TITLE_RESOURCES = ['hostgroups', 'locations', 'operatingsystems', 'organizations']
+
+# Resource types whose parent_id references a resource of the same type, they are created parents first
+FOREMAN_NESTED_RESOURCES = ['hostgroups', 'locations', 'organizations']
+
+
+def get_reference_type(resource, field):
+    """Return the resource type a reference field points to
+
+    Args:
+      resource (str): Resource type of the item containing the field
+      field (str): Name of the field (e.g. 'domain_id')
+    Returns:
+      str: Referenced resource type or None if the field is no reference
+    """
+    if field == 'parent_id':
+        return resource if resource in FOREMAN_NESTED_RESOURCES else None
+    return FOREMAN_REFERENCE_FIELDS.get(field)
+
+
+def get_depth(title):
+    """Return the nesting depth of a nested resource given by title
+
+    Args:
+      title (str): Parent titles and name separated by /
+    Returns:
+      int: 0 for top level resources
+    """
+    return (title or '').count('/')
+
+
+class ForemanRestore(ErrorSummary):
+    """ForemanRestore Class
+
+    Restore Foreman resources from a backup directory written by ForemanBackup.
+
+    The resource types are restored level by level (see FOREMAN_RESTORE_LEVELS).
+    All items of one level are created or updated by a pool of worker threads.
+    Existing resources are matched by name (nested resources by title) and
+    updated, missing ones are created. The ids of the backup are mapped to the ids of the restored
+    resources, so references between resources point to the new objects.
+    """
+    def __init__(self, hostname, port, username, password,
+                 concurrency=FOREMAN_CONCURRENCY, output=None, **kwargs):
+        """Init
+
+        Args:
+          hostname (str): Foreman host name
+          port (str): Foreman HTTPS port
+          username (str): Username to authenticate with
+          password (str): Password to authenticate with
+          concurrency (int): Number of items restored at the same time per resource type
+          output (file): Stream to write progress and the error summary to, defaults to sys.stdout
+          kwargs: Passed to Foreman (e.g. protocol, retry_policy, governor)
+        """
+        self.concurrency = concurrency
+        self.output = output
+        self.errors = []
+        self.id_map = {}
+        self._lock = threading.Lock()
+        # All resource types of a level are restored at the same time
+        resource_concurrency = max(len(level) for level in FOREMAN_RESTORE_LEVELS)
+        self.foreman = Foreman(hostname, port, username, password,
+                               pool_maxsize=max(FOREMAN_POOL_MAXSIZE, concurrency * resource_concurrency),
+                               **kwargs)
+
+    def load(self, backup_dir, resource):
+        """Load the backup files of a resource type
+
+        Args:
+          backup_dir (str): Directory containing the backup
+          resource (str): Name of the resource (e.g. 'architectures')
+        Returns:
+          list of dict
+        """
+        resource_dir = os.path.join(backup_dir, resource)
+        if not os.path.isdir(resource_dir):
+            return []
+
+        items = []
+        for file_name in sorted(os.listdir(resource_dir)):
+            if not file_name.endswith('.yaml'):
+                continue
+            try:
+                with open(os.path.join(resource_dir, file_name), 'r') as backup_file:
+                    items.append(yaml.load(backup_file, Loader=SafeLoader))
+            except Exception as e:
+                self._add_error(resource=resource, item={'name': file_name}, error=e)
+        return items
+
+    def _map_id(self, resource, resource_id):
+        """Return the id of the restored resource for an id of the backup
+
+        Args:
+          resource (str): Resource type
+          resource_id: Id in the backup
+        Returns:
+          Id of the restored resource or None if unknown
+        """
+        return self.id_map.get(resource, {}).get(str(resource_id))
+
+    def prepare(self, resource, item):
+        """Convert a backup item into data to post or put
+
+        Read-only fields and nested data are removed. References to other
+        resources are mapped to the ids of the restored resources, references
+        which could not be mapped are removed. Associations are only passed if
+        all of their ids could be mapped, so restoring them partially does not
+        remove existing associations.
+
+        Args:
+          resource (str): Resource type
+          item (dict): Item of the backup
+        Returns:
+          dict
+        """
+        data = {}
+        for key, value in item.items():
+            if key in FOREMAN_READ_ONLY_FIELDS:
+                continue
+            reference_type = get_reference_type(resource, key)
+            if reference_type:
+                if value is not None:
+                    value = self._map_id(reference_type, value)
+                    if value is None:
+                        continue
+                data[key] = value
+            elif key in FOREMAN_ASSOCIATION_FIELDS and isinstance(value, list):
+                ids = [self._map_id(key, association.get('id')) for association in value
+                       if isinstance(association, dict)]
+                if None not in ids:
+                    data[FOREMAN_ASSOCIATION_FIELDS[key]] = ids
+            elif not isinstance(value, (dict, list)) and not key.endswith('_name'):
+                data[key] = value
+        return data
+
+    def _get_key(self, resource, item):
+        """Return the key an item is matched with existing resources by
+
+        Args:
+          resource (str): Resource type
+          item (dict): Item of the backup or existing resource
+        Returns:
+          str: Title of nested resources, otherwise the name
+        """
+        if resource in FOREMAN_TITLE_RESOURCES and item.get('title'):
+            return item.get('title')
+        return item.get('name')
+
+    def _get_existing(self, resource):
+        """Return key to id map of the resources which already exist
+
+        Args:
+          resource (str): Resource type
+        Returns:
+          dict: name (title of nested resources) -> id
+        """
+        return dict((self._get_key(resource, item), item.get('id'))
+                    for item in self.foreman.get_resources(resource_type=resource,
+                                                           concurrency=self.concurrency))
+
+    def restore_items(self, resource, items, existing):
+        """Create or update items of one resource type concurrently
+
+        Args:
+          resource (str): Resource type
+          items (list): Items of the backup
+          existing (dict): Name to id map of existing resources
+        Returns:
+          tuple of number of created and updated resources
+        """
+        def restore_item(item):
+            try:
+                data = self.prepare(resource=resource, item=item)
+                resource_id = existing.get(self._get_key(resource, item))
+                if resource_id:
+                    self.foreman.put_resource(resource_type=resource,
+                                              resource_id=resource_id,
+                                              data={FOREMAN_RESOURCES[resource]: data})
+                    return item, resource_id, False
+                result = self.foreman.post_resource(resource_type=resource,
+                                                    resource=FOREMAN_RESOURCES[resource],
+                                                    data=data)
+                return item, result.get('id'), True
+            except Exception as e:
+                self._add_error(resource=resource, item=item, error=e)
+                # A resource which failed to update still exists and can be referenced
+                return item, existing.get(self._get_key(resource, item)), None
+
+        created = 0
+        updated = 0
+        for item, resource_id, create in map_concurrent(restore_item, items,
+                                                        concurrency=self.concurrency, ordered=False):
+            if resource_id is not None:
+                self.id_map.setdefault(resource, {})[str(item.get('id'))] = resource_id
+            if create:
+                created += 1
+            elif create is not None:
+                updated += 1
+        return created, updated
+
+    def restore(self, backup_dir, resource):
+        """Restore all items of a resource type
+
+        Nested resources (see FOREMAN_NESTED_RESOURCES) are restored parents first.
+
+        Args:
+          backup_dir (str): Directory containing the backup
+          resource (str): Resource type
+        """
+        items = self.load(backup_dir=backup_dir, resource=resource)
+        if not items:
+            return
+
+        self._report("Restore: %s (%d)" % (resource, len(items)))
+        try:
+            existing = self._get_existing(resource)
+        except Exception as e:
+            self._add_error(resource=resource, item=None, error=e)
+            return
+
+        if resource in FOREMAN_NESTED_RESOURCES:
+            depths = sorted(set(get_depth(item.get('title')) for item in items))
+            batches = [[item for item in items if get_depth(item.get('title')) == depth]
+                       for depth in depths]
+        else:
+            batches = [items]
+
+        created = 0
+        updated = 0
+        for batch in batches:
+            batch_created, batch_updated = self.restore_items(resource=resource, items=batch, existing=existing)
+            created += batch_created
+            updated += batch_updated
+
+        self._report("Restore: %s %d created, %d updated" % (resource, created, updated))
+
+    def run(self, backup_root='.', resources=None, id_map_file=None):
+        """Restore all resource types level by level
+
+        Args:
+          backup_root (str): Directory containing the backup
+          resources (list): Resource types to restore, defaults to all types found
+          id_map_file (str): Write the mapping of backup ids to restored ids as JSON into this file
+        Returns:
+          list of errors
+        """
+        self.errors = []
+
+        for level in FOREMAN_RESTORE_LEVELS:
+            level = [resource for resource in level if resources is None or resource in resources]
+
+            def restore_resource(resource):
+                self.restore(backup_dir=backup_root, resource=resource)
+
+            for _ in map_concurrent(restore_resource, level, concurrency=len(level), ordered=False):
+                pass
+
+        if id_map_file:
+            with open(id_map_file, 'w') as map_file:
+                json.dump(self.id_map, map_file, indent=1, sort_keys=True)
+
+        self.print_summary()
+        return self.errors
@@ -0,0 +1,101 @@
+'''
+Retry failed requests to the Foreman API
+'''
+
+import calendar
+import email.utils
+import random
+import time
+
+FOREMAN_RETRY_STATUS_CODES = [429, 502, 503, 504]
+FOREMAN_RETRY_METHODS = ['GET', 'HEAD', 'OPTIONS']
+
+
+class RetryPolicy(object):
+    """RetryPolicy Class
+
+    Decide if and when a failed request is sent again.
+
+    Requests failing with a connection error or one of status_codes are
+    retried up to max_retries times. The delay grows exponentially with every
+    attempt (backoff_factor * 2 ** attempt, at most max_backoff seconds) and
+    is randomized with full jitter. A Retry-After header sent by the server is
+    used as delay instead.
+
+    By default only idempotent requests without side effects (GET, HEAD,
+    OPTIONS) are retried. PUT and DELETE can be added to methods. POST
+    requests should not be retried as they could create a resource twice.
+    """
+    def __init__(self, max_retries=3, backoff_factor=0.5, max_backoff=30, jitter=True,
+                 status_codes=None, methods=None, respect_retry_after=True, max_retry_after=300):
+        """Init
+
+        Args:
+          max_retries (int): Maximum number of retries per request, 0 disables retries
+          backoff_factor (float): Delay in seconds before the first retry
+          max_backoff (float): Maximum delay in seconds between two attempts
+          jitter (bool): Randomize the delay to spread retries of concurrent requests
+          status_codes (list): Status codes to retry, defaults to FOREMAN_RETRY_STATUS_CODES
+          methods (list): HTTP verbs to retry, defaults to FOREMAN_RETRY_METHODS
+          respect_retry_after (bool): Wait as long as requested by a Retry-After header
+          max_retry_after (float): Maximum delay in seconds accepted from a Retry-After header
+        """
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.status_codes = status_codes if status_codes is not None else FOREMAN_RETRY_STATUS_CODES
+        self.methods = [method.upper() for method in (methods if methods is not None else FOREMAN_RETRY_METHODS)]
+        self.respect_retry_after = respect_retry_after
+        self.max_retry_after = max_retry_after
+
+    def is_retryable(self, method, attempt, status_code=None):
+        """Check if a request should be sent again
+
+        Args:
+          method (str): HTTP verb of the request
+          attempt (int): Number of retries done so far
+          status_code (int): Status code of the response, None if the connection failed
+        Returns:
+          bool
+        """
+        if attempt >= self.max_retries or method.upper() not in self.methods:
+            return False
+        return status_code is None or status_code in self.status_codes
+
+    def get_delay(self, attempt, retry_after=None):
+        """Return the number of seconds to wait before the next attempt
+
+        Args:
+          attempt (int): Number of retries done so far
+          retry_after (str): Value of the Retry-After header, either seconds or an HTTP date
+        Returns:
+          float
+        """
+        if retry_after and self.respect_retry_after:
+            delay = parse_retry_after(retry_after)
+            if delay is not None:
+                return min(delay, self.max_retry_after)
+
+        delay = min(self.max_backoff, self.backoff_factor * (2 ** attempt))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+
+def parse_retry_after(retry_after):
+    """Parse the value of a Retry-After header
+
+    Args:
+      retry_after (str): Delay in seconds or an HTTP date
+    Returns:
+      float: Seconds to wait or None if the value is invalid
+    """
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    parsed = email.utils.parsedate(retry_after)
+    if parsed is None:
+        return None
+    return max(0.0, calendar.timegm(parsed) - time.time())
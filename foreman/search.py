@@ -0,0 +1,235 @@
+'''
+Build search queries for the Foreman API
+
+Conditions can be combined with & (and), | (or) and ~ (not):
+
+    query = (Condition('name', '~', 'web') | Condition('hostgroup', '=', 'Base')) & ~Condition('build', '=', True)
+    foreman.get_hosts(search=SearchQuery(query, order='name DESC', per_page=500))
+'''
+
+try:
+    text_type = unicode
+except NameError:
+    text_type = str
+
+try:
+    integer_types = (int, long)
+except NameError:
+    integer_types = (int,)
+
+FOREMAN_SEARCH_OPERATORS = ['=', '==', '!=', '~', '!~', '<', '>', '<=', '>=', '^', '!^']
+FOREMAN_SEARCH_UNARY_OPERATORS = ['null?', 'set?']
+
+
+def to_text(value):
+    """Return a value as text, byte strings are decoded as UTF-8
+
+    Returns:
+      text (unicode on Python 2)
+    """
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return text_type(value)
+
+
+def quote_value(value):
+    """Quote a value to be used in a search query
+
+    Strings are put in double quotes, backslashes and double quotes inside are
+    escaped. Byte strings are decoded as UTF-8. Booleans are written as true
+    and false, numbers as they are.
+
+    Args:
+      value: Value to quote
+    Returns:
+      text (unicode on Python 2)
+    """
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, integer_types):
+        return str(value)
+    if isinstance(value, float):
+        return repr(value)
+    if not isinstance(value, text_type):
+        value = to_text(value)
+    return u'"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+class Expression(object):
+    """Expression Class
+
+    Base class of Condition, Group and Not. Expressions are combined with
+    & (and), | (or) and ~ (not).
+    """
+    def __and__(self, other):
+        return Group('and', [self, other])
+
+    def __or__(self, other):
+        return Group('or', [self, other])
+
+    def __invert__(self):
+        return Not(self)
+
+    def __str__(self):
+        # Text on Python 3, UTF-8 encoded on Python 2. Use text_type to get text on both.
+        text = self.__unicode__()
+        return text if isinstance(text, str) else text.encode('utf-8')
+
+    def __unicode__(self):
+        raise NotImplementedError
+
+
+class Condition(Expression):
+    """Condition Class
+
+    Condition of a search query, e.g. Condition('name', '=', 'host01').
+
+    The operator ^ (in) and !^ (not in) expect a list of values. The operators
+    null? and set? do not take a value. Comparing with None using = or != is
+    turned into null? or set?.
+    """
+    def __init__(self, key, operator='=', value=None):
+        """Init
+
+        Args:
+          key (str): Field to search in
+          operator (str): One of FOREMAN_SEARCH_OPERATORS or FOREMAN_SEARCH_UNARY_OPERATORS
+          value: Value to compare with, a list, tuple or set for ^ and !^
+        """
+        if operator not in FOREMAN_SEARCH_OPERATORS and operator not in FOREMAN_SEARCH_UNARY_OPERATORS:
+            raise ValueError('Unknown search operator: ' + operator)
+        if operator in ['^', '!^'] and not isinstance(value, (list, tuple, set, frozenset)):
+            raise ValueError('Search operator %s expects a list of values' % operator)
+        self.key = key
+        self.operator = operator
+        self.value = value
+
+    def __unicode__(self):
+        if self.operator in FOREMAN_SEARCH_UNARY_OPERATORS:
+            return self.operator + ' ' + self.key
+        if self.value is None and self.operator in ['=', '==', '!=']:
+            return ('set? ' if self.operator == '!=' else 'null? ') + self.key
+        if self.operator in ['^', '!^']:
+            return self.key + ' ' + self.operator + ' (' + ', '.join(quote_value(value) for value in self.value) + ')'
+        return self.key + ' ' + self.operator + ' ' + quote_value(self.value)
+
+
+class Group(Expression):
+    """Group Class
+
+    Expressions combined with and or or.
+    """
+    def __init__(self, operator, conditions):
+        self.operator = operator
+        self.conditions = []
+        for condition in conditions:
+            if isinstance(condition, Group) and condition.operator == operator:
+                self.conditions.extend(condition.conditions)
+            else:
+                self.conditions.append(condition)
+
+    def __unicode__(self):
+        parts = []
+        for condition in self.conditions:
+            if isinstance(condition, Group):
+                parts.append('(' + text_type(condition) + ')')
+            else:
+                parts.append(text_type(condition))
+        return (' ' + self.operator + ' ').join(parts)
+
+
+class Not(Expression):
+    """Not Class
+
+    Negated expression.
+    """
+    def __init__(self, condition):
+        self.condition = condition
+
+    def __invert__(self):
+        return self.condition
+
+    def __unicode__(self):
+        return 'not (' + text_type(self.condition) + ')'
+
+
+class SearchQuery(object):
+    """SearchQuery Class
+
+    Search condition together with the order and page size of the results.
+    """
+    def __init__(self, condition=None, order=None, per_page=None):
+        """Init
+
+        Args:
+          condition (Condition or str): Search condition
+          order (str): Field to order by, optionally followed by ASC or DESC
+          per_page (int): Number of results per page
+        """
+        self.condition = condition
+        self.order = order
+        self.per_page = per_page
+
+    def where(self, key, operator='=', value=None):
+        """Add a condition which has to match as well
+
+        Returns:
+          SearchQuery
+        """
+        condition = Condition(key=key, operator=operator, value=value)
+        if self.condition is None:
+            self.condition = condition
+        else:
+            self.condition = Group('and', [self.condition, condition])
+        return self
+
+    def order_by(self, field, descending=False):
+        """Set the order of the results
+
+        Returns:
+          SearchQuery
+        """
+        self.order = field + (' DESC' if descending else ' ASC')
+        return self
+
+    def limit(self, per_page):
+        """Set the number of results per page
+
+        Returns:
+          SearchQuery
+        """
+        self.per_page = per_page
+        return self
+
+    def __str__(self):
+        text = self.__unicode__()
+        return text if isinstance(text, str) else text.encode('utf-8')
+
+    def __unicode__(self):
+        if self.condition is None:
+            return u''
+        return text_type(self.condition)
+
+
+def build_search(search_data):
+    """Build the search string for a search definition
+
+    Args:
+      search_data (dict, Condition, SearchQuery or str): Search definition. All
+          key/value pairs of a dict have to match. List values match any of their items.
+    Returns:
+      text (unicode on Python 2)
+    """
+    if search_data is None:
+        return u''
+    if isinstance(search_data, dict):
+        conditions = []
+        for key in sorted(search_data):
+            if isinstance(search_data[key], (list, tuple, set)):
+                conditions.append(Condition(key, '^', list(search_data[key])))
+            else:
+                conditions.append(Condition(key, '=', search_data[key]))
+        if len(conditions) == 1:
+            return text_type(conditions[0])
+        return text_type(Group('and', conditions))
+    return to_text(search_data)
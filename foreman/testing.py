@@ -0,0 +1,473 @@
+'''
+In-process stub of the Foreman API v2 for tests and benchmarks
+
+The stub serves a synthetic fleet from memory and implements the parts of
+the API used by the client: pagination, search, ordering, CRUD by id or name,
+compute attributes and host power actions. Each request can be delayed to
+simulate the latency of a real server, single paths can be made to fail
+(see add_fault).
+
+    with StubForeman(hosts=10000, latency=0.005) as stub:
+        foreman = Foreman('127.0.0.1', str(stub.port), 'admin', 'secret', protocol='http')
+'''
+
+import json
+import random
+import re
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+    from urllib import unquote
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs, unquote
+
+from .foreman import FOREMAN_RESOURCES
+
+STUB_TIMESTAMP = '2015-03-04 12:00:00 UTC'
+STUB_EPOCH = 1425470400
+
+# Resource type -> number of items in a synthetic fleet besides hosts
+STUB_FLEET_SIZES = {'architectures': 2,
+                    'common_parameters': 10,
+                    'compute_profiles': 3,
+                    'compute_resources': 2,
+                    'config_templates': 20,
+                    'domains': 10,
+                    'environments': 3,
+                    'hostgroups': 50,
+                    'locations': 5,
+                    'media': 3,
+                    'operatingsystems': 5,
+                    'organizations': 2,
+                    'ptables': 3,
+                    'smart_proxies': 3,
+                    'subnets': 20}
+
+STUB_SEARCH_TERM = re.compile(r'\s*(\w+)\s*(==|!=|!\^|\^|!~|~|>=|<=|=|>|<)\s*'
+                              r'(\([^)]*\)|"(?:[^"\\]|\\.)*"|[^\s()]+)\s*(?:and\s+|$)', re.IGNORECASE)
+
+
+def _timestamp(seconds=None):
+    return time.strftime('%Y-%m-%d %H:%M:%S UTC', time.gmtime(seconds))
+
+
+def _now():
+    return _timestamp()
+
+
+def generate_fleet(hosts=10000, seed=0):
+    """Create the resources of a synthetic Foreman installation
+
+    Args:
+      hosts (int): Number of hosts
+      seed (int): Seed of the random generator, the same seed creates the same fleet
+    Returns:
+      dict: resource type -> list of items ordered by id
+    """
+    rnd = random.Random(seed)
+    data = {}
+    for resource_type, size in STUB_FLEET_SIZES.items():
+        data[resource_type] = [{'id': item_id,
+                                'name': '%s%03d' % (FOREMAN_RESOURCES[resource_type], item_id),
+                                'created_at': STUB_TIMESTAMP,
+                                'updated_at': STUB_TIMESTAMP}
+                               for item_id in range(1, size + 1)]
+    for resource_type in ['locations', 'operatingsystems', 'organizations']:
+        for item in data[resource_type]:
+            item['title'] = item['name']
+    for item in data['domains']:
+        item['name'] = 'dom%03d.example.com' % item['id']
+    for item in data['hostgroups']:
+        if item['id'] > 10:
+            item['parent_id'] = (item['id'] - 1) % 10 + 1
+            item['title'] = 'hostgroup%03d/%s' % (item['parent_id'], item['name'])
+        else:
+            item['title'] = item['name']
+    for item in data['subnets']:
+        item['network'] = '10.%d.0.0' % item['id']
+        item['mask'] = '255.255.0.0'
+
+    # Only the first compute resource has attributes, for the first compute profile
+    data['compute_attributes'] = [{'id': 1, 'name': 'compute_resource001/compute_profile001',
+                                   'compute_resource_id': 1, 'compute_profile_id': 1,
+                                   'vm_attrs': {'cpus': '1', 'memory_mb': '1024'},
+                                   'created_at': STUB_TIMESTAMP, 'updated_at': STUB_TIMESTAMP}]
+
+    data['hosts'] = []
+    for host_id in range(1, hosts + 1):
+        domain = rnd.choice(data['domains'])
+        hostgroup = rnd.choice(data['hostgroups'])
+        subnet = rnd.choice(data['subnets'])
+        data['hosts'].append({'id': host_id,
+                              'name': 'host%06d.%s' % (host_id, domain['name']),
+                              'ip': '10.%d.%d.%d' % (subnet['id'], host_id // 256 % 256, host_id % 256),
+                              'mac': '52:54:00:%02x:%02x:%02x' % (host_id >> 16 & 255, host_id >> 8 & 255,
+                                                                 host_id & 255),
+                              'domain_id': domain['id'],
+                              'domain_name': domain['name'],
+                              'hostgroup_id': hostgroup['id'],
+                              'hostgroup_name': hostgroup['title'],
+                              'subnet_id': subnet['id'],
+                              'architecture_id': rnd.choice(data['architectures'])['id'],
+                              'operatingsystem_id': rnd.choice(data['operatingsystems'])['id'],
+                              'environment_id': rnd.choice(data['environments'])['id'],
+                              'location_id': rnd.choice(data['locations'])['id'],
+                              'organization_id': rnd.choice(data['organizations'])['id'],
+                              'build': rnd.random() < 0.05,
+                              'enabled': True,
+                              'managed': True,
+                              'comment': None,
+                              'created_at': STUB_TIMESTAMP,
+                              'updated_at': _timestamp(STUB_EPOCH + host_id * 60)})
+    return data
+
+
+def _parse_value(value):
+    if value.startswith('"'):
+        return value[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+    return value
+
+
+def _compare(current, operator, value):
+    """Evaluate one search condition for a field value"""
+    if operator in ['^', '!^']:
+        values = [_parse_value(item.strip()) for item in value.strip('()').split(',')]
+        found = str(current) in values
+        return found if operator == '^' else not found
+    value = _parse_value(value)
+    if isinstance(current, bool):
+        current = 'true' if current else 'false'
+    if operator in ['=', '==']:
+        return str(current) == value
+    if operator == '!=':
+        return str(current) != value
+    if operator in ['~', '!~']:
+        found = value.lower() in str(current).lower()
+        return found if operator == '~' else not found
+    if current is None:
+        return False
+    try:
+        current, value = float(current), float(value)
+    except (TypeError, ValueError):
+        current = str(current)
+    return {'>': current > value, '<': current < value,
+            '>=': current >= value, '<=': current <= value}[operator]
+
+
+def parse_search(search):
+    """Parse a search query into conditions
+
+    Only conditions combined with and are supported.
+
+    Args:
+      search (str): Search query
+    Returns:
+      list of tuples (key, operator, value)
+    """
+    conditions = []
+    position = 0
+    search = search.strip()
+    while position < len(search):
+        match = STUB_SEARCH_TERM.match(search, position)
+        if not match:
+            raise ValueError('Unsupported search query: ' + search)
+        conditions.append(match.groups())
+        position = match.end()
+    return conditions
+
+
+class StubForemanHandler(BaseHTTPRequestHandler):
+    """StubForemanHandler Class
+
+    Answer one connection to the stub. Connections are kept alive.
+    """
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, avoid waiting for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status_code, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def _handle(self, method):
+        stub = self.server.stub
+        stub.count_request()
+        url = urlparse(self.path)
+        parts = [unquote(part) for part in url.path.split('/')[3:] if part]
+        fault = stub.take_fault('/'.join(parts))
+        if fault == 'drop':
+            # Close the connection without an answer
+            self.close_connection = True
+            return
+        if fault is not None:
+            self._read_body()
+            return self._send(fault, {'error': {'message': 'Injected fault'}})
+        params = dict((key, values[0]) for key, values in parse_qs(url.query).items())
+        try:
+            body = self._read_body()
+        except ValueError:
+            return self._send(400, {'error': {'message': 'Invalid JSON'}})
+        if method != 'GET':
+            stub.record_write(method, '/'.join(parts), body)
+        stub.delay()
+        if not parts or parts[0] not in stub.data:
+            return self._send(404, {'error': {'message': 'Resource not found'}})
+        status_code, data = stub.dispatch(method=method, parts=parts, params=params, body=body)
+        self._send(status_code, data)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+
+class StubHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class StubForeman(object):
+    """StubForeman Class
+
+    Stub Foreman API v2 server running in a background thread.
+    """
+    def __init__(self, hosts=10000, latency=0.0, jitter=0.0, seed=0, host='127.0.0.1', port=0):
+        """Init
+
+        Args:
+          hosts (int): Number of hosts of the synthetic fleet
+          latency (float): Seconds every request is delayed
+          jitter (float): Maximum random seconds added to latency
+          seed (int): Seed of the random generator creating the fleet
+          host (str): Address to listen on
+          port (int): Port to listen on, 0 picks a free port
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.data = generate_fleet(hosts=hosts, seed=seed)
+        self.power = {}
+        self.requests = 0
+        self.writes = []
+        self.faults = {}
+        self._lock = threading.Lock()
+        self._by_id = {}
+        self._by_name = {}
+        for resource_type in self.data:
+            self._index(resource_type)
+        self._server = StubHTTPServer((host, port), StubForemanHandler)
+        self._server.stub = self
+        self.host = host
+        self.port = self._server.server_address[1]
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """Start serving in a background thread
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving and close the socket
+        """
+        self._server.shutdown()
+        self._server.server_close()
+
+    def add_fault(self, path, fault, count=1):
+        """Let the next requests of a path fail
+
+        Args:
+          path (str): Path below /api/v2, e.g. hosts/3/power
+          fault (int or str): Status code to answer with or 'drop' to close the
+                              connection without an answer
+          count (int): Number of requests which fail
+        """
+        with self._lock:
+            self.faults.setdefault(path, []).extend([fault] * count)
+
+    def take_fault(self, path):
+        """Return the next fault of a path or None"""
+        with self._lock:
+            faults = self.faults.get(path)
+            if faults:
+                return faults.pop(0)
+        return None
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_write(self, method, path, body):
+        """Remember method, path and body of a changing request in writes"""
+        with self._lock:
+            self.writes.append((method, path, body))
+
+    def delay(self):
+        """Sleep for the configured latency
+        """
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _index(self, resource_type):
+        items = self.data[resource_type]
+        self._by_id[resource_type] = dict((item['id'], item) for item in items)
+        self._by_name[resource_type] = dict((item['name'], item) for item in items)
+
+    def _find(self, resource_type, key):
+        """Return an item by id or name"""
+        if key.isdigit() and int(key) in self._by_id[resource_type]:
+            return self._by_id[resource_type][int(key)]
+        return self._by_name[resource_type].get(key)
+
+    def _search(self, resource_type, search):
+        """Return the items matching a search query"""
+        conditions = parse_search(search)
+        if conditions and conditions[0][0] in ['name', 'id'] and conditions[0][1] in ['=', '==']:
+            # Use the index for the common lookup by name or id
+            item = self._find(resource_type, _parse_value(conditions[0][2]))
+            candidates = [item] if item is not None else []
+            conditions = conditions[1:]
+        else:
+            candidates = self.data[resource_type]
+        return [item for item in candidates
+                if all(_compare(item.get(key), operator, value) for key, operator, value in conditions)]
+
+    def _list(self, resource_type, params):
+        """Answer a paginated index request"""
+        items = self.data[resource_type]
+        search = params.get('search')
+        if search:
+            try:
+                items = self._search(resource_type, search)
+            except ValueError as e:
+                return 422, {'error': {'message': str(e)}}
+        order = params.get('order')
+        if order:
+            field, _, direction = order.partition(' ')
+            items = sorted(items, key=lambda item: (item.get(field) is None, item.get(field)),
+                           reverse=direction.strip().upper() == 'DESC')
+        page = max(int(params.get('page') or 1), 1)
+        per_page = max(int(params.get('per_page') or 20), 1)
+        results = items[(page - 1) * per_page:page * per_page]
+        if params.get('thin') == 'true':
+            results = [{'id': item['id'], 'name': item['name']} for item in results]
+        return 200, {'total': len(self.data[resource_type]),
+                     'subtotal': len(items),
+                     'page': page,
+                     'per_page': per_page,
+                     'search': search,
+                     'sort': {'by': order, 'order': None},
+                     'results': results}
+
+    def dispatch(self, method, parts, params, body):
+        """Answer an API request
+
+        Args:
+          method (str): HTTP verb
+          parts (list): URL path below /api/v2
+          params (dict): Query parameters
+          body (dict): Decoded request body
+        Returns:
+          tuple of status code and response data
+        """
+        resource_type = parts[0]
+        singular = FOREMAN_RESOURCES.get(resource_type, resource_type)
+        with self._lock:
+            if len(parts) == 1:
+                if method == 'GET':
+                    return self._list(resource_type, params)
+                if method == 'POST':
+                    if resource_type == 'compute_attributes':
+                        # Named after compute resource and profile, which are passed next to the attribute
+                        resource = self._by_id['compute_resources'].get(body.get('compute_resource_id'))
+                        profile = self._by_id['compute_profiles'].get(body.get('compute_profile_id'))
+                        if resource is None or profile is None:
+                            return 422, {'error': {'full_messages': ['Unknown compute resource or profile']}}
+                        item = dict(body.get('compute_attribute') or {})
+                        item.update(name=resource['name'] + '/' + profile['name'],
+                                    compute_resource_id=resource['id'], compute_profile_id=profile['id'])
+                    else:
+                        item = dict(body.get(singular, body))
+                    if not item.get('name'):
+                        return 422, {'error': {'full_messages': ["Name can't be blank"]}}
+                    if item['name'] in self._by_name[resource_type]:
+                        return 422, {'error': {'full_messages': ['Name has already been taken']}}
+                    item['id'] = max(self._by_id[resource_type] or [0]) + 1
+                    item['created_at'] = item['updated_at'] = _now()
+                    if resource_type in ['hostgroups', 'locations', 'operatingsystems', 'organizations']:
+                        parent = self._by_id[resource_type].get(item.get('parent_id'))
+                        item['title'] = parent['title'] + '/' + item['name'] if parent else item['name']
+                    self.data[resource_type].append(item)
+                    self._by_id[resource_type][item['id']] = item
+                    self._by_name[resource_type][item['name']] = item
+                    return 201, item
+                return 405, {'error': {'message': 'Method not allowed'}}
+
+            item = self._find(resource_type, parts[1])
+            if item is None:
+                return 404, {'error': {'message': 'Resource %s not found by id \'%s\'' % (singular, parts[1])}}
+            if len(parts) == 3 and parts[2] == 'power' and method == 'PUT':
+                action = body.get('power_action')
+                if action in ['start', 'on']:
+                    self.power[item['id']] = 'on'
+                elif action in ['stop', 'off']:
+                    self.power[item['id']] = 'off'
+                return 200, {'power': self.power.get(item['id'], 'on')}
+            if len(parts) > 2:
+                return 404, {'error': {'message': 'Unsupported component ' + parts[2]}}
+            if method == 'GET':
+                if resource_type == 'compute_resources':
+                    return 200, dict(item, compute_attributes=[attribute for attribute in self.data['compute_attributes']
+                                                               if attribute['compute_resource_id'] == item['id']])
+                return 200, item
+            if method == 'PUT':
+                changes = body.get(singular, body)
+                if 'name' in changes and changes['name'] != item['name']:
+                    del self._by_name[resource_type][item['name']]
+                    self._by_name[resource_type][changes['name']] = item
+                item.update(changes)
+                item['updated_at'] = _now()
+                return 200, item
+            if method == 'DELETE':
+                # Like Foreman, nested resources can only be deleted without children
+                if any(child.get('parent_id') == item['id'] for child in self.data[resource_type]):
+                    return 422, {'error': {'full_messages': ['Cannot delete record because of dependent children']}}
+                self.data[resource_type].remove(item)
+                del self._by_id[resource_type][item['id']]
+                del self._by_name[resource_type][item['name']]
+                return 200, item
+        return 405, {'error': {'message': 'Method not allowed'}}
@@ -0,0 +1,235 @@
+'''
+Limit the request rate and the number of requests in flight
+'''
+
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    clock = time.monotonic
+except AttributeError:
+    clock = time.time
+
+FOREMAN_WRITE_METHODS = ['POST', 'PUT', 'PATCH', 'DELETE']
+
+
+class TokenBucket(object):
+    """TokenBucket Class
+
+    Token bucket refilled with rate tokens per second up to burst tokens.
+    Requests which find the bucket empty reserve their tokens in advance and
+    wait until they are refilled, so waiting requests are served in order.
+    """
+    def __init__(self, rate, burst=None):
+        """Init
+
+        Args:
+          rate (float): Tokens added per second
+          burst (float): Maximum number of tokens, defaults to rate (at least 1)
+        """
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """Take tokens from the bucket without waiting
+
+        Args:
+          tokens (float): Number of tokens to take
+        Returns:
+          float: Seconds to wait until the tokens are available
+        """
+        with self._lock:
+            now = clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, tokens=1):
+        """Take tokens from the bucket, wait until they are available
+
+        Args:
+          tokens (float): Number of tokens to take
+        Returns:
+          float: Seconds waited
+        """
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+class RequestGovernor(object):
+    """RequestGovernor Class
+
+    Throttle the requests of one or several Foreman or AsyncForeman objects
+    sharing it.
+
+    rate and max_in_flight limit all requests together. verb_limits adds
+    limits for single HTTP verbs, the key 'write' applies one shared limit to
+    all of POST, PUT, PATCH and DELETE:
+
+        RequestGovernor(rate=50, max_in_flight=16,
+                        verb_limits={'GET': {'rate': 40},
+                                     'write': {'rate': 5, 'max_in_flight': 2}})
+
+    weights sets the number of tokens a request of a verb takes, e.g.
+    {'POST': 3} makes a POST count as much as three GETs. Without any limit
+    requests pass through unchanged.
+    """
+    def __init__(self, rate=None, burst=None, max_in_flight=None, weights=None, verb_limits=None):
+        """Init
+
+        Args:
+          rate (float): Requests per second of all verbs, None for no limit
+          burst (float): Number of requests allowed at once above rate
+          max_in_flight (int): Maximum number of requests of all verbs in flight
+          weights (dict): HTTP verb -> tokens taken per request, defaults to 1
+          verb_limits (dict): HTTP verb or 'write' -> dict with rate, burst and max_in_flight
+        """
+        self.weights = dict((verb.upper(), weight) for verb, weight in (weights or {}).items())
+        self._bucket = TokenBucket(rate=rate, burst=burst) if rate else None
+        self._semaphore = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+        self._verb_buckets = {}
+        self._verb_semaphores = {}
+        for verb, limits in (verb_limits or {}).items():
+            if verb.lower() == 'write':
+                verbs = FOREMAN_WRITE_METHODS
+            else:
+                verbs = [verb.upper()]
+            bucket = None
+            if limits.get('rate'):
+                bucket = TokenBucket(rate=limits.get('rate'), burst=limits.get('burst'))
+            semaphore = None
+            if limits.get('max_in_flight'):
+                semaphore = threading.BoundedSemaphore(limits.get('max_in_flight'))
+            for method in verbs:
+                if bucket is not None:
+                    self._verb_buckets[method] = bucket
+                if semaphore is not None:
+                    self._verb_semaphores[method] = semaphore
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'throttled': 0, 'wait_time': 0.0, 'in_flight': 0}
+        self._listeners = []
+
+    def reserve(self, method):
+        """Take the rate tokens of a request without waiting
+
+        Args:
+          method (str): HTTP verb of the request
+        Returns:
+          float: Seconds to wait before the request may be sent
+        """
+        method = method.upper()
+        weight = self.weights.get(method, 1)
+        delay = 0.0
+        for bucket in [self._bucket, self._verb_buckets.get(method)]:
+            if bucket is not None:
+                delay = max(delay, bucket.reserve(weight))
+        return delay
+
+    def _get_semaphores(self, method):
+        # The verb slot is taken first, so a request waiting for it does not block other verbs
+        return [semaphore for semaphore in [self._verb_semaphores.get(method.upper()), self._semaphore]
+                if semaphore is not None]
+
+    def acquire(self, method, start, blocking=True):
+        """Take the in flight slots of a request
+
+        Args:
+          method (str): HTTP verb of the request
+          start (float): clock() when the request started waiting
+          blocking (bool): Wait for free slots, otherwise give up if one is taken
+        Returns:
+          bool: True if the slots were taken, release them with release
+        """
+        acquired = []
+        for semaphore in self._get_semaphores(method):
+            if not semaphore.acquire(blocking):
+                for taken in reversed(acquired):
+                    taken.release()
+                return False
+            acquired.append(semaphore)
+        waited = clock() - start
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['in_flight'] += 1
+            if waited > 0.001:
+                self._stats['throttled'] += 1
+                self._stats['wait_time'] += waited
+        return True
+
+    def release(self, method):
+        """Free the in flight slots taken by acquire
+
+        Args:
+          method (str): HTTP verb of the request
+        """
+        with self._lock:
+            self._stats['in_flight'] -= 1
+        for semaphore in reversed(self._get_semaphores(method)):
+            semaphore.release()
+        for listener in list(self._listeners):
+            listener()
+
+    def add_listener(self, listener):
+        """Call a function each time in flight slots are freed
+
+        Lets callers which must not block on acquire wait for free slots.
+        The function is called from the thread calling release.
+
+        Args:
+          listener (function): Function without arguments
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """Stop calling a function added with add_listener
+
+        Args:
+          listener (function): Function passed to add_listener
+        """
+        with self._lock:
+            self._listeners.remove(listener)
+
+    def wait(self, method):
+        """Wait until a request may be sent and take its slot, free it with release
+
+        Args:
+          method (str): HTTP verb of the request
+        """
+        start = clock()
+        delay = self.reserve(method)
+        if delay > 0:
+            time.sleep(delay)
+        self.acquire(method, start=start)
+
+    @contextmanager
+    def limit(self, method):
+        """Wait until a request may be sent and hold its slot while it is in flight
+
+        Args:
+          method (str): HTTP verb of the request
+        """
+        self.wait(method)
+        try:
+            yield
+        finally:
+            self.release(method)
+
+    def stats(self):
+        """Return throttle counters
+
+        Returns:
+          dict: requests, throttled (requests which had to wait), wait_time
+                (seconds waited in total) and in_flight
+        """
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,70 @@
+'''
+Helpers shared by backups, restores and the response cache
+'''
+
+import os
+import sys
+
+
+def replace_file(source, destination):
+    """Move a file to its final path, replacing an existing file
+
+    The replacement is atomic on Python 3. Python 2 has no atomic replace on
+    all platforms, there the existing file is removed first.
+
+    Args:
+      source (str): Path of the new file, usually a temporary file next to destination
+      destination (str): Final path
+    """
+    if hasattr(os, 'replace'):
+        os.replace(source, destination)
+    else:
+        if os.path.exists(destination):
+            os.remove(destination)
+        os.rename(source, destination)
+
+
+class ErrorSummary(object):
+    """ErrorSummary Class
+
+    Mixin collecting the items a backup or restore failed on. The class using
+    it sets output (stream to report to, None for sys.stdout), errors (list)
+    and _lock.
+    """
+    def _report(self, message):
+        # sys.stdout is looked up on every call, it may be replaced after the object was created
+        output = self.output if self.output is not None else sys.stdout
+        with self._lock:
+            output.write(message + '\n')
+            output.flush()
+
+    def _add_error(self, resource, item, error):
+        """Remember an item which failed
+
+        Args:
+          resource (str): Name of the resource
+          item (dict): Item which failed, None if the whole resource failed
+          error (Exception): Error raised
+        """
+        # foreman.foreman imports the cache, which imports this module
+        from .foreman import ForemanError
+        if isinstance(error, ForemanError):
+            message = '%s (%s)' % (error.message, error.status_code)
+        else:
+            message = str(error)
+        item = item or {}
+        with self._lock:
+            self.errors.append({'resource': resource,
+                                'id': item.get('id'),
+                                'name': item.get('name'),
+                                'error': message})
+
+    def print_summary(self):
+        """Print the items which failed
+        """
+        if not self.errors:
+            return
+        self._report("Errors: %d" % len(self.errors))
+        for error in self.errors:
+            self._report("  %s %s (id %s): %s" % (error.get('resource'), error.get('name'),
+                                                  error.get('id'), error.get('error')))
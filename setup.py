@@ -32,4 +32,10 @@ setup(name='python-foreman',
       url='https://github.com/Nosmoht/python-foreman',
       packages=['foreman'],
       install_requires=requirements(),
+      extras_require={
+        'async': ['aiohttp'],
+        'backup': ['PyYAML'],
+        'fast': ['orjson'],
+        'zstd': ['zstandard'],
+      },
       )
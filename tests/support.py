@@ -0,0 +1,48 @@
+'''
+Helpers shared by the tests running against the stub Foreman
+'''
+
+import io
+import sys
+import unittest
+
+from foreman.foreman import Foreman
+from foreman.testing import StubForeman
+
+
+def find(stub, resource_type, **fields):
+    """Return the items of a stub whose fields have the given values"""
+    return [item for item in stub.data[resource_type]
+            if all(item.get(key) == value for key, value in fields.items())]
+
+
+def text_output():
+    """Return an in-memory stream for the reports of backups, restores and reconciles"""
+    return io.StringIO() if sys.version_info[0] > 2 else io.BytesIO()
+
+
+class StubTestCase(unittest.TestCase):
+    """StubTestCase Class
+
+    Runs a stub Foreman with hosts hosts as self.stub during every test.
+    """
+    hosts = 30
+
+    def setUp(self):
+        self.stub = self.start_stub(hosts=self.hosts)
+
+    def start_stub(self, hosts):
+        """Start another stub Foreman which is stopped after the test"""
+        stub = StubForeman(hosts=hosts)
+        stub.start()
+        self.addCleanup(stub.stop)
+        return stub
+
+    def connection(self, stub=None):
+        """Return hostname, port, username and password of a stub"""
+        stub = stub or self.stub
+        return stub.host, str(stub.port), 'admin', 'secret'
+
+    def create_foreman(self, stub=None, **kwargs):
+        """Return a Foreman client of a stub"""
+        return Foreman(*self.connection(stub), protocol='http', **kwargs)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+
+try:
+    import asyncio
+    from foreman.async_foreman import AsyncForeman, aiohttp
+except (ImportError, SyntaxError):
+    # Python 2 has neither asyncio nor asynchronous generators
+    AsyncForeman = aiohttp = None
+from foreman.retry import RetryPolicy
+from foreman.throttle import RequestGovernor, clock
+from support import StubTestCase, find
+
+
+@unittest.skipIf(aiohttp is None, 'AsyncForeman requires Python 3.6+ and aiohttp')
+class TestAsyncForeman(StubTestCase):
+
+    def setUp(self):
+        StubTestCase.setUp(self)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(self.loop.close)
+        self.addCleanup(asyncio.set_event_loop, None)
+
+    def run_loop(self, awaitable):
+        """Run an awaitable in the event loop of the test and return its result"""
+        return self.loop.run_until_complete(awaitable)
+
+    def create_async_foreman(self, **kwargs):
+        """Return an AsyncForeman of the stub which is closed after the test"""
+        foreman = AsyncForeman(*self.connection(), protocol='http', **kwargs)
+        self.addCleanup(lambda: self.run_loop(foreman.close()))
+        return foreman
+
+    def test_pagination(self):
+        foreman = self.create_async_foreman()
+        hosts = self.run_loop(foreman.get_resources(resource_type='hosts', per_page=7))
+        self.assertEqual([host['id'] for host in hosts], list(range(1, 31)))
+
+    def test_concurrent_pages(self):
+        foreman = self.create_async_foreman()
+        hosts = self.run_loop(foreman.get_resources(resource_type='hosts', per_page=4, concurrency=3, ordered=False))
+        self.assertEqual(sorted(host['id'] for host in hosts), list(range(1, 31)))
+        # One request for the first page, one per remaining page
+        self.assertEqual(self.stub.requests, 8)
+
+    def test_stream(self):
+        foreman = self.create_async_foreman()
+        resources = foreman.get_resources(resource_type='domains', stream=True, per_page=3, fields=['name'])
+        domains = []
+        while True:
+            try:
+                domains.append(self.run_loop(resources.__anext__()))
+            except StopAsyncIteration:
+                break
+        self.assertEqual(domains, [{'name': item['name']} for item in self.stub.data['domains']])
+
+    def test_governor(self):
+        governor = RequestGovernor(max_in_flight=2)
+        self.stub.latency = 0.01
+        foreman = self.create_async_foreman(governor=governor)
+        hosts = self.run_loop(asyncio.gather(*[foreman.get_resource(resource_type='hosts', data={'id': host_id})
+                                          for host_id in range(1, 11)]))
+        self.assertEqual([host['id'] for host in hosts], list(range(1, 11)))
+        stats = governor.stats()
+        self.assertEqual(stats['requests'], 10)
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertTrue(stats['throttled'] > 0, stats)
+
+    def test_governor_shared_with_thread(self):
+        governor = RequestGovernor(max_in_flight=1)
+        foreman = self.create_async_foreman(governor=governor)
+        governor.wait('GET')
+        # The slot is freed by another thread while the request waits for it
+        timer = threading.Timer(0.05, governor.release, args=['GET'])
+        timer.start()
+        self.addCleanup(timer.cancel)
+        start = clock()
+        host = self.run_loop(foreman.get_resource(resource_type='hosts', data={'id': 1}))
+        self.assertEqual(host['id'], 1)
+        self.assertTrue(clock() - start >= 0.04)
+        self.assertEqual(governor.stats()['in_flight'], 0)
+
+    def test_retry(self):
+        self.stub.add_fault('hosts/3', 503, count=2)
+        foreman = self.create_async_foreman(retry_policy=RetryPolicy(backoff_factor=0.01, jitter=False))
+        host = self.run_loop(foreman.get_resource(resource_type='hosts', data={'id': 3}))
+        self.assertEqual(host['id'], 3)
+        self.assertEqual(foreman.retry_stats(), {'retries': 2, 'retried_requests': 1, 'failed_requests': 0})
+        self.assertEqual(self.stub.requests, 3)
+
+    def test_name_cache(self):
+        name = self.stub.data['domains'][2]['name']
+        foreman = self.create_async_foreman(name_cache_size=10)
+        first = self.run_loop(foreman.get_domain(data={'name': name}))
+        second = self.run_loop(foreman.get_domain(data={'name': name}))
+        self.assertEqual(first, second)
+        self.assertEqual(foreman.name_cache_stats()['hits'], 1)
+        # The cached id saves the search of the second lookup
+        self.assertEqual(self.stub.requests, 3)
+
+    def test_name_cache_renamed(self):
+        name = self.stub.data['domains'][2]['name']
+        foreman = self.create_async_foreman(name_cache_size=10)
+        self.run_loop(foreman.get_domain(data={'name': name}))
+        self.stub.dispatch('PUT', ['domains', '3'], {}, {'domain': {'name': 'renamed.example.com'}})
+        _, created = self.stub.dispatch('POST', ['domains'], {}, {'domain': {'name': name}})
+        self.assertEqual(self.run_loop(foreman.get_domain(data={'name': name}))['id'], created['id'])
+
+    def test_search_resources(self):
+        names = [host['name'] for host in self.stub.data['hosts'][:12]] + ['missing.example.com']
+        foreman = self.create_async_foreman()
+        found = self.run_loop(foreman.search_resources(resource_type='hosts', key='name', values=names,
+                                                  max_search_length=300))
+        self.assertEqual(sorted(found), sorted(names[:12]))
+        self.assertEqual(found[names[0]]['id'], 1)
+        self.assertTrue(1 < self.stub.requests < 12, self.stub.requests)
+
+    def test_create_hosts(self):
+        hostgroup = self.stub.data['hostgroups'][15]
+        hosts = [{'name': 'new%02d.example.com' % index, 'domain_name': 'dom001.example.com',
+                  'hostgroup_name': hostgroup['title']} for index in range(5)]
+        hosts.append({'name': 'bad.example.com', 'domain_name': 'missing.example.com'})
+        foreman = self.create_async_foreman()
+        reports = self.run_loop(foreman.create_hosts(hosts=hosts, concurrency=3))
+        self.assertEqual([report['name'] for report in reports], [host['name'] for host in hosts])
+        for report in reports[:5]:
+            self.assertEqual(report['result']['domain_id'], 1)
+            self.assertEqual(report['result']['hostgroup_id'], hostgroup['id'])
+        self.assertEqual(reports[5]['error'], 'Unknown domain missing.example.com')
+        self.assertEqual(find(self.stub, 'hosts', name='bad.example.com'), [])
+
+    def test_create_hosts_failed_connection(self):
+        self.stub.add_fault('hosts', 'drop')
+        foreman = self.create_async_foreman()
+        reports = self.run_loop(foreman.create_hosts(hosts=[{'name': 'new.example.com', 'domain_id': 1}]))
+        self.assertTrue(reports[0]['error'], reports[0])
+        self.assertFalse('result' in reports[0])
+
+    def test_reconcile_compute_attributes(self):
+        desired = [{'compute_resource': 'compute_resource001', 'compute_profile': 'compute_profile001',
+                    'vm_attrs': {'cpus': '2'}},
+                   {'compute_resource': 'compute_resource002', 'compute_profile': 'compute_profile001',
+                    'vm_attrs': {'cpus': '4'}}]
+        foreman = self.create_async_foreman()
+        reports = self.run_loop(foreman.reconcile_compute_attributes(desired=desired))
+        self.assertEqual([(report['action'], report.get('error')) for report in reports],
+                         [('update', None), ('create', None)])
+        attributes = dict((item['name'], item['vm_attrs']) for item in self.stub.data['compute_attributes'])
+        self.assertEqual(attributes['compute_resource001/compute_profile001'], {'cpus': '2', 'memory_mb': '1024'})
+        self.assertEqual(attributes['compute_resource002/compute_profile001'], {'cpus': '4'})
+
+        # Nothing changes the second time
+        reports = self.run_loop(foreman.reconcile_compute_attributes(desired=desired))
+        self.assertEqual([report['action'] for report in reports], ['unchanged', 'unchanged'])
+
+    def test_set_hosts_power(self):
+        # aiohttp sends an idempotent request again if a reused connection was closed
+        self.stub.add_fault('hosts/2/power', 'drop', count=2)
+        foreman = self.create_async_foreman()
+        result = self.run_loop(foreman.set_hosts_power('stop', host_ids=[1, 2, 3]))
+        self.assertEqual(result[1], {'power': 'off'})
+        self.assertEqual(result[3], {'power': 'off'})
+        self.assertTrue(isinstance(result[2], aiohttp.ClientError), result[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from foreman.backup import ForemanBackup
+from support import StubTestCase, text_output
+
+RESOURCES = ['domains', 'hostgroups', 'hosts', 'locations', 'organizations']
+
+
+class TestBackup(StubTestCase):
+
+    def setUp(self):
+        StubTestCase.setUp(self)
+        self.backup_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.backup_dir)
+
+    def backup(self, backup_dir=None, concurrency=4, resource_concurrency=2, **kwargs):
+        output = text_output()
+        backup = ForemanBackup(*self.connection(), protocol='http', concurrency=concurrency,
+                               resource_concurrency=resource_concurrency, output=output, **kwargs)
+        return backup.run(backup_root=backup_dir or self.backup_dir, resources=RESOURCES), output.getvalue()
+
+    def read_tree(self, backup_dir):
+        """Return relative path -> content of all files below a directory"""
+        files = {}
+        for root, _, names in os.walk(backup_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                with open(path, 'rb') as backup_file:
+                    files[os.path.relpath(path, backup_dir)] = backup_file.read()
+        return files
+
+    def test_incremental_backup(self):
+        errors, output = self.backup(incremental=True)
+        self.assertEqual(errors, [])
+        self.assertIn('Backup: hosts 30 done (0 unchanged, 0 removed)', output)
+
+        self.stub.dispatch('DELETE', ['hosts', '3'], {}, {})
+        self.stub.dispatch('PUT', ['hosts', '4'], {}, {'host': {'comment': 'changed'}})
+        errors, output = self.backup(incremental=True)
+        self.assertEqual(errors, [])
+        self.assertIn('Backup: hosts 1 done (28 unchanged, 1 removed)', output)
+        host_files = [name for name in os.listdir(os.path.join(self.backup_dir, 'hosts')) if name.endswith('.yaml')]
+        self.assertEqual(len(host_files), 29)
+
+    def test_ndjson(self):
+        errors, _ = self.backup(output_format='ndjson')
+        self.assertEqual(errors, [])
+        with open(os.path.join(self.backup_dir, 'hosts.ndjson')) as hosts_file:
+            self.assertEqual(len(hosts_file.readlines()), 30)
+
+    def test_parallel_matches_serial(self):
+        for output_format in ['files', 'ndjson']:
+            serial_dir = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, serial_dir)
+            errors, _ = self.backup(backup_dir=serial_dir, concurrency=1, resource_concurrency=1,
+                                    output_format=output_format)
+            self.assertEqual(errors, [])
+            parallel_dir = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, parallel_dir)
+            errors, _ = self.backup(backup_dir=parallel_dir, concurrency=8, resource_concurrency=5,
+                                    output_format=output_format)
+            self.assertEqual(errors, [])
+            serial = self.read_tree(serial_dir)
+            self.assertTrue(any(name.startswith('hosts') for name in serial), sorted(serial))
+            self.assertEqual(self.read_tree(parallel_dir), serial)
+
+    def test_default_output(self):
+        # The default output is sys.stdout at the time of reporting, not when the module was imported
+        stdout = sys.stdout
+        sys.stdout = output = text_output()
+        try:
+            ForemanBackup(*self.connection(), protocol='http').run(backup_root=self.backup_dir,
+                                                                    resources=['domains'])
+        finally:
+            sys.stdout = stdout
+        self.assertIn('Backup: domains 10 done', output.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from foreman.cache import NameCache, ResponseCache
+from support import StubTestCase
+
+
+class TestNameCache(unittest.TestCase):
+
+    def test_get_set(self):
+        cache = NameCache(max_size=10)
+        cache.set('hosts', 'host01', 1)
+        self.assertEqual(cache.get('hosts', 'host01'), 1)
+        self.assertIsNone(cache.get('domains', 'host01'))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_lru(self):
+        cache = NameCache(max_size=2)
+        cache.set('hosts', 'a', 1)
+        cache.set('hosts', 'b', 2)
+        cache.get('hosts', 'a')
+        cache.set('hosts', 'c', 3)
+        self.assertEqual(cache.get('hosts', 'a'), 1)
+        self.assertIsNone(cache.get('hosts', 'b'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['size'], 2)
+
+    def test_ttl(self):
+        cache = NameCache(max_size=10, ttl=0.05)
+        cache.set('hosts', 'a', 1)
+        self.assertEqual(cache.get('hosts', 'a'), 1)
+        time.sleep(0.06)
+        self.assertIsNone(cache.get('hosts', 'a'))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_invalidate_by_name(self):
+        cache = NameCache(max_size=10)
+        cache.set('hosts', 'a', 1)
+        cache.invalidate('hosts', name='a')
+        self.assertIsNone(cache.get('hosts', 'a'))
+
+    def test_invalidate_by_id(self):
+        cache = NameCache(max_size=10)
+        cache.set('hosts', 'a', 1)
+        cache.set('hosts', 'a.example.com', 1)
+        cache.set('hosts', 'b', 2)
+        cache.set('domains', 'a', 1)
+        cache.invalidate('hosts', resource_id='1')
+        self.assertIsNone(cache.get('hosts', 'a'))
+        self.assertIsNone(cache.get('hosts', 'a.example.com'))
+        self.assertEqual(cache.get('hosts', 'b'), 2)
+        self.assertEqual(cache.get('domains', 'a'), 1)
+
+    def test_invalidate_after_rename(self):
+        cache = NameCache(max_size=10)
+        cache.set('hosts', 'a', 1)
+        cache.set('hosts', 'a', 2)
+        cache.invalidate('hosts', resource_id=1)
+        self.assertEqual(cache.get('hosts', 'a'), 2)
+        cache.invalidate('hosts', resource_id=2)
+        self.assertIsNone(cache.get('hosts', 'a'))
+
+    def test_clear(self):
+        cache = NameCache(max_size=10)
+        cache.set('hosts', 'a', 1)
+        cache.clear()
+        self.assertIsNone(cache.get('hosts', 'a'))
+        cache.invalidate('hosts', resource_id=1)
+
+
+class TestNameCacheLookup(StubTestCase):
+
+    def setUp(self):
+        StubTestCase.setUp(self)
+        self.foreman = self.create_foreman(name_cache_size=10)
+        self.name = self.stub.data['domains'][2]['name']
+
+    def test_get_helper(self):
+        first = self.foreman.get_domain(data={'name': self.name})
+        requests = self.stub.requests
+        second = self.foreman.get_domain(data={'name': self.name})
+        self.assertEqual(first['id'], 3)
+        self.assertEqual(first, second)
+        # The cached id replaces the search
+        self.assertEqual(self.stub.requests, requests + 1)
+        self.assertEqual(self.foreman.name_cache_stats()['hits'], 1)
+
+    def test_other_searches(self):
+        # Only searches by name only use the cache
+        result = self.foreman.get_domain(data={'name': self.name, 'id': 3})
+        self.assertEqual(result['id'], 3)
+        self.assertEqual(self.foreman.name_cache_stats()['misses'], 0)
+
+    def test_renamed(self):
+        self.foreman.get_domain(data={'name': self.name})
+        self.stub.dispatch('PUT', ['domains', '3'], {}, {'domain': {'name': 'renamed.example.com'}})
+        _, created = self.stub.dispatch('POST', ['domains'], {}, {'domain': {'name': self.name}})
+        # The cached id now belongs to another name, the name is searched again
+        self.assertEqual(self.foreman.get_domain(data={'name': self.name})['id'], created['id'])
+        self.assertEqual(self.foreman.get_domain(data={'name': self.name})['id'], created['id'])
+        self.assertEqual(self.foreman.name_cache_stats()['hits'], 2)
+
+    def test_deleted(self):
+        self.foreman.get_domain(data={'name': self.name})
+        self.stub.dispatch('DELETE', ['domains', '3'], {}, {})
+        self.assertIsNone(self.foreman.get_domain(data={'name': self.name}))
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        cache = ResponseCache(self.directory, max_size=10000)
+        cache.set('http://foreman/api/v2/hosts', {'page': 1}, '{"results": []}', etag='"abc"')
+        cached = cache.get('http://foreman/api/v2/hosts', {'page': 1})
+        self.assertEqual(cached['etag'], '"abc"')
+        self.assertEqual(cached['body'], '{"results": []}')
+        self.assertIsNone(cache.get('http://foreman/api/v2/hosts', {'page': 2}))
+
+    def test_namespace(self):
+        ResponseCache(self.directory, max_size=10000, namespace='a').set('url', None, 'body', etag='1')
+        self.assertIsNone(ResponseCache(self.directory, max_size=10000, namespace='b').get('url'))
+
+    def test_size_of_replaced_entry(self):
+        cache = ResponseCache(self.directory, max_size=10000)
+        for length in range(1, 50):
+            cache.set('url', None, 'x' * length, etag='1')
+        self.assertEqual(cache.stats()['size'], cache._get_size())
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+    def test_evict(self):
+        cache = ResponseCache(self.directory, max_size=1000)
+        for number in range(20):
+            cache.set('url%d' % number, None, 'x' * 200, etag='1')
+        self.assertTrue(cache.stats()['size'] <= 1000)
+        self.assertEqual(cache.stats()['size'], cache._get_size())
+        self.assertIsNotNone(cache.get('url19'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from foreman.compute import ComputeAttributeMatrix, diff_vm_attrs, is_same_value
+from foreman.foreman import ForemanBase
+
+COMPUTE_RESOURCES = [{'id': 1, 'name': 'vsphere'}, {'id': 2, 'name': 'libvirt'}]
+COMPUTE_PROFILES = [{'id': 1, 'name': '1-Small'}, {'id': 2, 'name': '2-Medium'}]
+COMPUTE_ATTRIBUTES = [{'id': 10, 'compute_resource_id': 1, 'compute_profile_id': 1,
+                       'vm_attrs': {'cpus': '1', 'memory_mb': '1024', 'start': '1',
+                                    'volumes_attributes': {'0': {'size_gb': '10', 'thin': 'true', 'name': 'Hard disk',
+                                                                 'mode': 'persistent'}}}},
+                      {'id': 11, 'compute_resource_id': 2, 'compute_profile_id': 1,
+                       'vm_attrs': {'cpus': '1'}}]
+
+
+class TestIsSameValue(unittest.TestCase):
+
+    def test_strings_and_numbers(self):
+        self.assertTrue(is_same_value('1', 1))
+        self.assertTrue(is_same_value(2048, '2048'))
+        self.assertFalse(is_same_value('1', 2))
+
+    def test_bool(self):
+        self.assertTrue(is_same_value('1', True))
+        self.assertTrue(is_same_value('true', True))
+        self.assertTrue(is_same_value('0', False))
+        self.assertTrue(is_same_value('', False))
+        self.assertTrue(is_same_value(None, False))
+        self.assertFalse(is_same_value(None, True))
+        self.assertFalse(is_same_value('false', True))
+
+    def test_none(self):
+        self.assertTrue(is_same_value('', None))
+        self.assertTrue(is_same_value(None, None))
+        self.assertFalse(is_same_value('a', None))
+        self.assertFalse(is_same_value(None, 'a'))
+
+    def test_nested_dict_compares_desired_keys(self):
+        current = {'0': {'size_gb': '10', 'thin': 'true', 'name': 'Hard disk'}}
+        self.assertTrue(is_same_value(current, {'0': {'size_gb': 10, 'thin': True}}))
+        self.assertFalse(is_same_value(current, {'0': {'size_gb': 20}}))
+        self.assertFalse(is_same_value(current, {'1': {'size_gb': 10}}))
+        self.assertFalse(is_same_value('10', {'size_gb': 10}))
+
+    def test_list(self):
+        self.assertTrue(is_same_value(['1', '2'], [1, 2]))
+        self.assertFalse(is_same_value(['1'], [1, 2]))
+        self.assertFalse(is_same_value(None, [1]))
+
+
+class TestDiffVmAttrs(unittest.TestCase):
+
+    def test_only_desired_keys(self):
+        current = COMPUTE_ATTRIBUTES[0]['vm_attrs']
+        self.assertEqual(diff_vm_attrs(current, {'cpus': 1, 'volumes_attributes': {'0': {'size_gb': 10}}}), {})
+        self.assertEqual(diff_vm_attrs(current, {'cpus': 2, 'memory_mb': 1024}), {'cpus': ('1', 2)})
+
+    def test_missing_current(self):
+        self.assertEqual(diff_vm_attrs(None, {'cpus': 2}), {'cpus': (None, 2)})
+
+
+class TestComputeAttributeMatrix(unittest.TestCase):
+
+    def setUp(self):
+        self.matrix = ComputeAttributeMatrix(COMPUTE_RESOURCES, COMPUTE_PROFILES, COMPUTE_ATTRIBUTES)
+
+    def test_get(self):
+        self.assertEqual(len(self.matrix), 2)
+        self.assertEqual(self.matrix.get('vsphere', '1-Small')['id'], 10)
+        self.assertEqual(self.matrix.get(2, 1)['id'], 11)
+        self.assertIsNone(self.matrix.get('vsphere', '2-Medium'))
+        self.assertIsNone(self.matrix.get('unknown', '1-Small'))
+
+    def test_filter(self):
+        self.assertEqual([attribute['id'] for attribute in self.matrix.get_compute_attributes(compute_profile=1)],
+                         [10, 11])
+        self.assertEqual([attribute['id'] for attribute in self.matrix.get_compute_attributes('libvirt')], [11])
+
+    def test_missing(self):
+        self.assertEqual([(resource['name'], profile['name']) for resource, profile in self.matrix.missing()],
+                         [('vsphere', '2-Medium'), ('libvirt', '2-Medium')])
+
+
+class TestPlanComputeAttributes(unittest.TestCase):
+
+    def setUp(self):
+        self.foreman = ForemanBase('foreman.example.com', '443')
+        self.matrix = ComputeAttributeMatrix(COMPUTE_RESOURCES, COMPUTE_PROFILES, COMPUTE_ATTRIBUTES)
+
+    def test_plan(self):
+        desired = [{'compute_resource': 'vsphere', 'compute_profile': '1-Small',
+                    'vm_attrs': {'cpus': 1, 'volumes_attributes': {'0': {'size_gb': 10}}}},
+                   {'compute_resource': 'vsphere', 'compute_profile': '2-Medium', 'vm_attrs': {'cpus': 2}},
+                   {'compute_resource': 'libvirt', 'compute_profile': '1-Small', 'vm_attrs': {'cpus': 4}},
+                   {'compute_resource': 'unknown', 'compute_profile': '1-Small', 'vm_attrs': {}}]
+        reports = self.foreman._plan_compute_attributes(desired=desired, matrix=self.matrix)
+        self.assertEqual([report['action'] for report in reports], ['unchanged', 'create', 'update', 'error'])
+        self.assertEqual(reports[1]['data'], {'compute_resource_id': 1, 'compute_profile_id': 2,
+                                              'vm_attrs': {'cpus': 2}})
+        self.assertEqual(reports[2]['data'], {'id': 11, 'vm_attrs': {'cpus': 4}})
+
+    def test_dry_run(self):
+        desired = [{'compute_resource': 'libvirt', 'compute_profile': '1-Small', 'vm_attrs': {'cpus': 4}}]
+        reports = self.foreman._plan_compute_attributes(desired=desired, matrix=self.matrix, dry_run=True)
+        self.assertEqual(reports[0]['changes'], {'cpus': ('1', 4)})
+        self.assertNotIn('data', reports[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import unittest
+
+from foreman.foreman import map_concurrent
+
+
+def square(number):
+    time.sleep(0.001 * (number % 3))
+    return number * number
+
+
+def fail_on_seven(number):
+    if number == 7:
+        raise KeyError(number)
+    return number
+
+
+class CountingItems(object):
+    """Iterable remembering how many items were taken"""
+    def __init__(self, count):
+        self.count = count
+        self.taken = 0
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        for number in range(self.count):
+            with self._lock:
+                self.taken += 1
+            yield number
+
+
+class TestMapConcurrent(unittest.TestCase):
+
+    def test_ordered(self):
+        self.assertEqual(list(map_concurrent(square, range(50), concurrency=8)),
+                         [number * number for number in range(50)])
+
+    def test_unordered(self):
+        self.assertEqual(sorted(map_concurrent(square, range(50), concurrency=8, ordered=False)),
+                         [number * number for number in range(50)])
+
+    def test_sequential(self):
+        self.assertEqual(list(map_concurrent(square, range(5), concurrency=1)), [0, 1, 4, 9, 16])
+
+    def test_empty_and_single(self):
+        self.assertEqual(list(map_concurrent(square, [], concurrency=4)), [])
+        self.assertEqual(list(map_concurrent(square, [3], concurrency=4)), [9])
+
+    def test_exception(self):
+        for ordered in [True, False]:
+            self.assertRaises(KeyError, list, map_concurrent(fail_on_seven, range(20), concurrency=4,
+                                                             ordered=ordered))
+
+    def test_exception_sequential(self):
+        self.assertRaises(KeyError, list, map_concurrent(fail_on_seven, range(20), concurrency=1))
+
+    def test_bounded_window(self):
+        for ordered in [True, False]:
+            items = CountingItems(1000)
+            results = map_concurrent(square, items, concurrency=4, ordered=ordered)
+            for _ in range(3):
+                next(results)
+            time.sleep(0.05)
+            # The workers only take new items when the consumer takes results
+            self.assertTrue(items.taken <= 4 + 3, items.taken)
+            results.close()
+
+    def test_generator_input(self):
+        self.assertEqual(list(map_concurrent(square, (number for number in range(20)), concurrency=3)),
+                         [number * number for number in range(20)])
+
+
+if __name__ == '__main__':
+    unittest.main()
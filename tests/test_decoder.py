@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import unittest
+
+from foreman.decoder import JSONStreamDecoder
+from foreman.foreman import Foreman
+from foreman.throttle import RequestGovernor
+
+DOCUMENT = {'total': 1.5, 'subtotal': 3, 'page': 1, 'per_page': -20, 'search': None,
+            'results': [1.25, 2e10, -7, True, False, None, u'höst "01"',
+                        {'id': 1, 'name': 'host01', 'facts': {'load': 0.5, 'tags': [1, 2.0e-3]}}, []],
+            'sort': {'by': None, 'order': None}}
+
+
+def decode(chunks):
+    decoder = JSONStreamDecoder()
+    items = []
+    for chunk in chunks:
+        items.extend(decoder.feed(chunk))
+    items.extend(decoder.close())
+    return items, decoder
+
+
+class TestJSONStreamDecoder(unittest.TestCase):
+
+    def setUp(self):
+        self.body = json.dumps(DOCUMENT, ensure_ascii=False).encode('utf-8')
+
+    def check(self, chunks):
+        items, decoder = decode(chunks)
+        self.assertEqual(items, DOCUMENT['results'])
+        self.assertEqual(decoder.meta, dict((key, value) for key, value in DOCUMENT.items() if key != 'results'))
+        self.assertTrue(decoder.done)
+
+    def test_single_chunk(self):
+        self.check([self.body])
+
+    def test_split_at_every_position(self):
+        for position in range(len(self.body) + 1):
+            self.check([self.body[:position], self.body[position:]])
+
+    def test_byte_chunks(self):
+        self.check([self.body[position:position + 1] for position in range(len(self.body))])
+
+    def test_number_split_after_dot(self):
+        items, decoder = decode([b'{"total": 1.', b'5, "results": [2.', b'25, 3e', b'2]}'])
+        self.assertEqual(decoder.meta['total'], 1.5)
+        self.assertEqual(items, [2.25, 300.0])
+
+    def test_number_at_end_of_object(self):
+        items, decoder = decode([b'{"results": [], "total": 12', b'3}'])
+        self.assertEqual(decoder.meta['total'], 123)
+
+    def test_empty_object(self):
+        items, decoder = decode([b' {', b'} '])
+        self.assertEqual(items, [])
+        self.assertTrue(decoder.done)
+
+    def test_incomplete_document(self):
+        decoder = JSONStreamDecoder()
+        decoder.feed(b'{"results": [1, 2')
+        self.assertRaises(ValueError, decoder.close)
+
+    def test_invalid_document(self):
+        decoder = JSONStreamDecoder()
+        self.assertRaises(ValueError, decoder.feed, b'[1, 2]')
+
+
+class ChunkedResponse(object):
+    """Streamed response which records how many chunks were read"""
+    status_code = 200
+    headers = {}
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.read = 0
+        self.closed = False
+
+    def iter_content(self, chunk_size=None):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class TestStreamedPage(unittest.TestCase):
+
+    def test_results_are_yielded_while_received(self):
+        body = json.dumps({'total': 2, 'per_page': 100, 'results': [{'id': 1}, {'id': 2}]}).encode('utf-8')
+        split = body.index(b'{"id": 2}')
+        response = ChunkedResponse([body[:split], body[split:]])
+        governor = RequestGovernor(max_in_flight=1)
+        foreman = Foreman('foreman.example.com', '443', 'admin', 'secret', governor=governor, stream_decode=True)
+        foreman._session.request = lambda **kwargs: response
+        meta = {}
+        results = foreman._iter_page(url=foreman.url + '/hosts', page=1, meta=meta)
+        self.assertEqual(next(results), {'id': 1})
+        self.assertEqual(response.read, 1)
+        self.assertEqual(governor.stats()['in_flight'], 0)
+        self.assertEqual(list(results), [{'id': 2}])
+        self.assertTrue(response.closed)
+        self.assertEqual(meta['total'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import requests
+
+from foreman.foreman import ForemanError
+from support import StubTestCase, find
+
+
+class TestSetHostsPower(StubTestCase):
+
+    def test_host_ids(self):
+        foreman = self.create_foreman()
+        result = foreman.set_hosts_power('stop', host_ids=[1, 2, 3], concurrency=2)
+        self.assertEqual(result, {1: {'power': 'off'}, 2: {'power': 'off'}, 3: {'power': 'off'}})
+
+    def test_failing_hosts(self):
+        self.stub.add_fault('hosts/2/power', 'drop')
+        self.stub.add_fault('hosts/3/power', 500)
+        foreman = self.create_foreman()
+        result = foreman.set_hosts_power('start', host_ids=[1, 2, 3, 4], concurrency=4)
+        # The other hosts are not affected by the failed ones
+        self.assertEqual(result[1], {'power': 'on'})
+        self.assertEqual(result[4], {'power': 'on'})
+        self.assertTrue(isinstance(result[2], requests.exceptions.ConnectionError), result[2])
+        self.assertTrue(isinstance(result[3], ForemanError), result[3])
+        self.assertEqual(result[3].status_code, 500)
+
+
+class TestCreateHosts(StubTestCase):
+
+    def new_hosts(self, count):
+        """Return hosts referencing their domain and hostgroup by name"""
+        return [{'name': 'new%03d' % index,
+                 'domain_name': self.stub.data['domains'][index % 10]['name'],
+                 'hostgroup_name': self.stub.data['hostgroups'][index % 50]['title']}
+                for index in range(count)]
+
+    def test_batched_lookups(self):
+        hosts = self.new_hosts(30)
+        foreman = self.create_foreman()
+        reports = foreman.create_hosts(hosts=hosts, concurrency=4)
+        self.assertEqual([report['name'] for report in reports], [host['name'] for host in hosts])
+        for host, report in zip(hosts, reports):
+            self.assertEqual(find(self.stub, 'domains', id=report['result']['domain_id'])[0]['name'],
+                             host['domain_name'])
+            self.assertEqual(find(self.stub, 'hostgroups', id=report['result']['hostgroup_id'])[0]['title'],
+                             host['hostgroup_name'])
+        # One search per referenced resource type and one POST per host
+        self.assertEqual(self.stub.requests, 32)
+
+    def test_resolve_host_references(self):
+        hosts = self.new_hosts(3)
+        hosts[2]['domain_name'] = 'missing.example.com'
+        foreman = self.create_foreman()
+        ids = foreman.resolve_host_references(hosts=hosts)
+        self.assertEqual(ids[('domain', hosts[0]['domain_name'])], 1)
+        self.assertEqual(ids[('hostgroup', hosts[1]['hostgroup_name'])], 2)
+        self.assertFalse(('domain', 'missing.example.com') in ids)
+
+    def test_failing_hosts(self):
+        hosts = self.new_hosts(4)
+        hosts[1]['hostgroup_name'] = 'missing/hostgroup'
+        hosts[2]['name'] = self.stub.data['hosts'][0]['name']
+        foreman = self.create_foreman()
+        reports = foreman.create_hosts(hosts=hosts, concurrency=1)
+        self.assertTrue('result' in reports[0])
+        self.assertEqual(reports[1], {'name': 'new001', 'error': 'Unknown hostgroup missing/hostgroup'})
+        self.assertTrue('error' in reports[2] and 'result' not in reports[2], reports[2])
+        self.assertTrue('result' in reports[3])
+        self.assertEqual(find(self.stub, 'hosts', name='new001'), [])
+
+    def test_failed_connection(self):
+        self.stub.add_fault('hosts', 'drop')
+        foreman = self.create_foreman()
+        reports = foreman.create_hosts(hosts=self.new_hosts(3), concurrency=1)
+        # Only the first POST fails, its connection error is reported
+        self.assertTrue('error' in reports[0] and 'result' not in reports[0], reports[0])
+        self.assertEqual([report['result']['name'] for report in reports[1:]], ['new001', 'new002'])
+
+
+if __name__ == '__main__':
+    unittest.main()
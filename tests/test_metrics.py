@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import requests
+
+from foreman.foreman import ForemanError
+from foreman.metrics import MetricsCollector
+from foreman.retry import RetryPolicy
+from support import StubTestCase
+
+
+class TestHooks(StubTestCase):
+
+    def setUp(self):
+        StubTestCase.setUp(self)
+        self.events = []
+
+    def record(self, event):
+        """Return a hook which records a copy of the dict it is called with"""
+        return lambda info: self.events.append((event, dict(info)))
+
+    def create_recording_foreman(self, events=('before_request', 'after_response', 'on_error', 'on_retry'),
+                                 **kwargs):
+        hooks = dict((event, self.record(event)) for event in events)
+        return self.create_foreman(hooks=hooks, **kwargs)
+
+    def test_request(self):
+        foreman = self.create_recording_foreman()
+        foreman.get_resource(resource_type='domains', data={'id': 2})
+        self.assertEqual([event for event, _ in self.events], ['before_request', 'after_response'])
+        before, after = [info for _, info in self.events]
+        self.assertEqual(before['method'], 'GET')
+        self.assertEqual(before['resource_type'], 'domains')
+        self.assertEqual(before['attempt'], 0)
+        self.assertTrue(before['url'].endswith('/api/v2/domains/2'), before['url'])
+        self.assertEqual(before['status_code'], None)
+        self.assertEqual(after['status_code'], 200)
+        self.assertTrue(after['elapsed'] >= 0)
+        self.assertTrue(after['bytes_received'] > 0)
+        self.assertEqual(after['error'], None)
+
+    def test_bytes_sent(self):
+        foreman = self.create_recording_foreman(events=['before_request'])
+        foreman.post_resource(resource_type='domains', resource='domain', data={'name': 'new.example.com'})
+        self.assertEqual(self.events[0][1]['method'], 'POST')
+        self.assertEqual(self.events[0][1]['bytes_sent'], len('{"domain": {"name": "new.example.com"}}'))
+
+    def test_error_response(self):
+        foreman = self.create_recording_foreman()
+        self.assertRaises(ForemanError, foreman.get_resource, resource_type='domains', data={'id': 999})
+        self.assertEqual([event for event, _ in self.events], ['before_request', 'after_response', 'on_error'])
+        self.assertEqual(self.events[2][1]['status_code'], 404)
+        self.assertEqual(self.events[2][1]['error'], None)
+
+    def test_connection_error(self):
+        self.stub.add_fault('domains/2', 'drop')
+        foreman = self.create_recording_foreman(retry_policy=RetryPolicy(max_retries=0))
+        self.assertRaises(requests.exceptions.ConnectionError,
+                          foreman.get_resource, resource_type='domains', data={'id': 2})
+        self.assertEqual([event for event, _ in self.events], ['before_request', 'on_error'])
+        info = self.events[1][1]
+        self.assertEqual(info['status_code'], None)
+        self.assertTrue(isinstance(info['error'], requests.exceptions.ConnectionError), info['error'])
+
+    def test_retry(self):
+        self.stub.add_fault('domains/2', 503)
+        foreman = self.create_recording_foreman(retry_policy=RetryPolicy(backoff_factor=0.01, jitter=False))
+        foreman.get_resource(resource_type='domains', data={'id': 2})
+        self.assertEqual([event for event, _ in self.events],
+                         ['before_request', 'after_response', 'on_error', 'on_retry',
+                          'before_request', 'after_response'])
+        retry = self.events[3][1]
+        self.assertEqual(retry['status_code'], 503)
+        self.assertEqual(retry['delay'], 0.01)
+        self.assertEqual(self.events[4][1]['attempt'], 1)
+
+    def test_add_and_remove_hook(self):
+        foreman = self.create_foreman()
+        hook = self.record('after_response')
+        foreman.add_hook('after_response', hook)
+        foreman.get_resource(resource_type='domains', data={'id': 1})
+        foreman.remove_hook('after_response', hook)
+        foreman.get_resource(resource_type='domains', data={'id': 1})
+        self.assertEqual(len(self.events), 1)
+        self.assertRaises(ValueError, foreman.add_hook, 'after_request', hook)
+
+
+class TestMetricsCollector(unittest.TestCase):
+
+    def response(self, elapsed, status_code=200, resource_type='hosts', method='GET', **kwargs):
+        info = {'method': method, 'resource_type': resource_type, 'elapsed': elapsed,
+                'status_code': status_code, 'bytes_sent': 0, 'bytes_received': 100, 'error': None}
+        info.update(kwargs)
+        return info
+
+    def test_counters(self):
+        metrics = MetricsCollector()
+        metrics.on_response(self.response(0.1))
+        metrics.on_response(self.response(0.3, status_code=404))
+        metrics.on_error(self.response(0.3, status_code=404))
+        metrics.on_retry(self.response(0.3))
+        metrics.on_response(self.response(0.2, method='POST', bytes_sent=40))
+        result = metrics.to_dict()
+        self.assertEqual(sorted(result['hosts']), ['GET', 'POST'])
+        get = result['hosts']['GET']
+        self.assertEqual(get['requests'], 2)
+        self.assertEqual(get['status'], {'200': 1, '404': 1})
+        self.assertEqual(get['errors'], {'404': 1})
+        self.assertEqual(get['retries'], 1)
+        self.assertEqual(get['bytes_received'], 200)
+        self.assertAlmostEqual(get['latency']['sum'], 0.4)
+        self.assertAlmostEqual(get['latency']['mean'], 0.2)
+        self.assertEqual(get['latency']['max'], 0.3)
+        self.assertEqual(result['hosts']['POST']['bytes_sent'], 40)
+
+    def test_connection_error(self):
+        metrics = MetricsCollector()
+        metrics.on_error(self.response(1.5, status_code=None, error=requests.exceptions.ConnectionError()))
+        get = metrics.to_dict()['hosts']['GET']
+        # The failed attempt is counted, but has no status
+        self.assertEqual(get['requests'], 1)
+        self.assertEqual(get['status'], {})
+        self.assertEqual(get['errors'], {'ConnectionError': 1})
+
+    def test_histogram_buckets(self):
+        metrics = MetricsCollector(buckets=[1.0, 0.1, 0.5])
+        for elapsed in [0.05, 0.1, 0.2, 0.7, 3.0]:
+            metrics.on_response(self.response(elapsed))
+        buckets = metrics.to_dict()['hosts']['GET']['latency']['buckets']
+        # Cumulative, upper bounds inclusive
+        self.assertEqual(buckets, [(0.1, 2), (0.5, 3), (1.0, 4)])
+
+    def test_prometheus(self):
+        metrics = MetricsCollector(buckets=[0.1, 1.0], prefix='test')
+        metrics.on_response(self.response(0.05))
+        metrics.on_response(self.response(0.5, status_code=500))
+        metrics.on_error(self.response(0.5, status_code=500))
+        lines = metrics.to_prometheus().splitlines()
+        for line in ['# TYPE test_request_duration_seconds histogram',
+                     'test_request_duration_seconds_bucket{resource="hosts",method="GET",le="0.1"} 1',
+                     'test_request_duration_seconds_bucket{resource="hosts",method="GET",le="1"} 2',
+                     'test_request_duration_seconds_bucket{resource="hosts",method="GET",le="+Inf"} 2',
+                     'test_request_duration_seconds_count{resource="hosts",method="GET"} 2',
+                     '# TYPE test_requests_total counter',
+                     'test_requests_total{resource="hosts",method="GET",status="200"} 1',
+                     'test_requests_total{resource="hosts",method="GET",status="500"} 1',
+                     'test_response_bytes_total{resource="hosts",method="GET"} 200',
+                     'test_retries_total{resource="hosts",method="GET"} 0',
+                     'test_errors_total{resource="hosts",method="GET",error="500"} 1']:
+            self.assertIn(line, lines)
+
+    def test_label_escaping(self):
+        metrics = MetricsCollector()
+        metrics.on_response(self.response(0.1, resource_type='a"b\\c'))
+        self.assertIn('resource="a\\"b\\\\c"', metrics.to_prometheus())
+
+    def test_reset(self):
+        metrics = MetricsCollector()
+        metrics.on_response(self.response(0.1))
+        metrics.reset()
+        self.assertEqual(metrics.to_dict(), {})
+
+
+class TestMetricsCollectorHooks(StubTestCase):
+
+    def test_register(self):
+        metrics = MetricsCollector()
+        foreman = self.create_foreman()
+        metrics.register(foreman)
+        foreman.get_resources(resource_type='hosts', per_page=10)
+        self.assertRaises(ForemanError, foreman.get_resource, resource_type='domains', data={'id': 999})
+        metrics.unregister(foreman)
+        foreman.get_resource(resource_type='domains', data={'id': 1})
+        result = metrics.to_dict()
+        self.assertEqual(result['hosts']['GET']['requests'], 3)
+        self.assertEqual(result['hosts']['GET']['status'], {'200': 3})
+        self.assertEqual(result['domains']['GET']['errors'], {'404': 1})
+        self.assertEqual(result['domains']['GET']['requests'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from foreman.mirror import ForemanMirror
+from support import StubTestCase
+
+
+class TestMirror(StubTestCase):
+    hosts = 250
+
+    def setUp(self):
+        StubTestCase.setUp(self)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.mirror = ForemanMirror(os.path.join(self.directory, 'mirror.db'), foreman=self.create_foreman(),
+                                    concurrency=4)
+        self.addCleanup(self.mirror.close)
+
+    def test_remote_ids(self):
+        self.assertEqual(self.mirror._get_remote_ids('hosts'), set(range(1, 251)))
+
+    def test_incremental_sync(self):
+        self.assertEqual(self.mirror.sync(resources=['hosts'])['hosts']['mode'], 'full')
+        self.stub.dispatch('DELETE', ['hosts', '5'], {}, {})
+        self.stub.dispatch('PUT', ['hosts', '6'], {}, {'host': {'comment': 'changed'}})
+        stats = self.mirror.sync(resources=['hosts'])['hosts']
+        self.assertEqual((stats['mode'], stats['deleted'], stats['count']), ('incremental', 1, 249))
+        self.assertIsNone(self.mirror.get('hosts', resource_id=5))
+        self.assertEqual(self.mirror.get('hosts', resource_id=6)['comment'], 'changed')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from foreman.foreman import ForemanBase, ForemanError
+from support import StubTestCase, find
+
+
+class TestChangedData(unittest.TestCase):
+
+    def setUp(self):
+        self.foreman = ForemanBase('foreman.example.com', '443')
+        self.current = {'id': 1, 'name': 'host01', 'build': False, 'comment': None, 'hostgroup_id': 3}
+
+    def test_wrapped(self):
+        data = {'host': {'name': 'host01', 'build': True, 'comment': ''}, 'other': 1}
+        self.assertEqual(self.foreman._get_changed_data('hosts', 1, data, self.current),
+                         {'host': {'build': True}, 'other': 1})
+
+    def test_plain(self):
+        self.assertEqual(self.foreman._get_changed_data('hosts', 1, {'hostgroup_id': '4'}, self.current),
+                         {'hostgroup_id': '4'})
+
+    def test_unchanged(self):
+        self.assertIsNone(self.foreman._get_changed_data('hosts', 1, {'host': {'hostgroup_id': '3'}}, self.current))
+
+    def test_missing_field_is_kept(self):
+        self.assertEqual(self.foreman._get_changed_data('hosts', 1, {'host': {'root_pass': 'x'}}, self.current),
+                         {'host': {'root_pass': 'x'}})
+
+    def test_missing_current(self):
+        try:
+            self.foreman._get_changed_data('hosts', None, {'host': {'build': True}}, None)
+        except ForemanError as e:
+            self.assertEqual(e.status_code, 404)
+        else:
+            self.fail('ForemanError not raised')
+
+
+
+class TestMinimalPut(StubTestCase):
+
+    def setUp(self):
+        StubTestCase.setUp(self)
+        self.foreman = self.create_foreman()
+        self.host = find(self.stub, 'hosts', id=1)[0]
+
+    def test_unchanged(self):
+        data = {'host': {'name': self.host['name'], 'build': self.host['build'],
+                         'domain_id': str(self.host['domain_id'])}}
+        result = self.foreman.put_resource(resource_type='hosts', resource_id=1, data=data, minimal=True)
+        self.assertEqual(result['id'], 1)
+        # Only the current host is fetched
+        self.assertEqual(self.stub.writes, [])
+        self.assertEqual(self.stub.requests, 1)
+
+    def test_changed(self):
+        data = {'host': {'name': self.host['name'], 'comment': 'rebuilt', 'build': True}}
+        result = self.foreman.put_resource(resource_type='hosts', resource_id=1, data=data, minimal=True)
+        self.assertEqual((result['comment'], result['build']), ('rebuilt', True))
+        self.assertEqual(self.stub.writes, [('PUT', 'hosts/1', {'host': {'comment': 'rebuilt', 'build': True}})])
+
+    def test_current(self):
+        data = {'host': {'comment': 'rebuilt'}}
+        self.foreman.put_resource(resource_type='hosts', resource_id=1, data=data, minimal=True,
+                                  current=dict(self.host))
+        # The passed resource saves the GET
+        self.assertEqual(self.stub.requests, 1)
+        self.assertEqual(self.stub.writes, [('PUT', 'hosts/1', data)])
+
+    def test_without_minimal(self):
+        data = {'host': {'name': self.host['name']}}
+        self.foreman.put_resource(resource_type='hosts', resource_id=1, data=data)
+        self.assertEqual(self.stub.writes, [('PUT', 'hosts/1', data)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from foreman.reconcile import ForemanReconciler, get_identity, normalize_config
+from support import StubTestCase, find, text_output
+
+CONFIG = {'locations': [{'name': 'fra', 'parent': 'eu'}, {'name': 'eu'}, {'name': 'dc1', 'parent': 'eu/fra'}],
+          'organizations': [{'name': 'ops', 'parent': 'organization001'}],
+          'domains': [{'name': 'dom001.example.com', 'fullname': 'First domain'},
+                      {'name': 'new.example.com', 'fullname': 'New domain'}],
+          'hostgroups': [{'name': 'web', 'parent': 'hostgroup001', 'domain': 'new.example.com'}],
+          'hosts': [{'name': 'host000002.dom001.example.com', 'comment': 'reconciled', 'root_pass': 'secret'},
+                    {'name': 'host000003.dom001.example.com', 'state': 'absent'}]}
+
+
+class TestGetIdentity(unittest.TestCase):
+
+    def test_identity(self):
+        self.assertEqual(get_identity('domains', {'name': 'example.com'}), 'example.com')
+        self.assertEqual(get_identity('locations', {'name': 'fra', 'parent': 'eu'}), 'eu/fra')
+        self.assertEqual(get_identity('locations', {'name': 'fra', 'title': 'eu/fra'}), 'eu/fra')
+        self.assertEqual(get_identity('organizations', {'name': 'ops'}), 'ops')
+
+
+class TestReconcile(StubTestCase):
+    hosts = 5
+
+    def setUp(self):
+        StubTestCase.setUp(self)
+        # Keep the hosts the configuration refers to in the domain dom001.example.com
+        for host in self.stub.data['hosts']:
+            self.stub.dispatch('PUT', ['hosts', str(host['id'])], {},
+                               {'host': {'name': 'host%06d.dom001.example.com' % host['id']}})
+        self.foreman = self.create_foreman()
+
+    def run_config(self, config, dry_run=False):
+        output = text_output()
+        reconciler = ForemanReconciler(self.foreman, concurrency=4, output=output)
+        return reconciler.run(normalize_config(config), dry_run=dry_run), output.getvalue()
+
+    def test_round_trip(self):
+        actions, output = self.run_config(CONFIG, dry_run=True)
+        self.assertEqual(dict((action['name'], action['action']) for action in actions),
+                         {'eu': 'create', 'eu/fra': 'create', 'eu/fra/dc1': 'create',
+                          'organization001/ops': 'create', 'dom001.example.com': 'unchanged',
+                          'new.example.com': 'create', 'hostgroup001/web': 'create',
+                          'host000002.dom001.example.com': 'update', 'host000003.dom001.example.com': 'delete'})
+        self.assertEqual(len(find(self.stub, 'locations', name='eu')), 0)
+        # The stub does not return fullname of domains, it is not compared
+        self.assertEqual(output.count('Warning: Foreman does not return fullname of domains'), 1)
+
+        actions, output = self.run_config(CONFIG)
+        self.assertNotIn('Error', output)
+        eu = find(self.stub, 'locations', name='eu')[0]
+        fra = find(self.stub, 'locations', name='fra')[0]
+        self.assertEqual(fra['parent_id'], eu['id'])
+        self.assertEqual(find(self.stub, 'locations', name='dc1')[0]['title'], 'eu/fra/dc1')
+        self.assertEqual(find(self.stub, 'hostgroups', name='web')[0]['domain_id'],
+                         find(self.stub, 'domains', name='new.example.com')[0]['id'])
+        self.assertEqual(find(self.stub, 'domains', name='new.example.com')[0]['fullname'], 'New domain')
+        self.assertEqual(find(self.stub, 'hosts', id=2)[0]['comment'], 'reconciled')
+        self.assertEqual(find(self.stub, 'hosts', id=3), [])
+
+        # Write only and not returned fields do not count as changes
+        requests = self.stub.requests
+        actions, output = self.run_config(CONFIG)
+        self.assertEqual(set(action['action'] for action in actions), set(['unchanged']))
+        self.assertIn('No changes.', output)
+        self.assertNotIn('root_pass', output)
+        self.assertEqual(output.count('Warning: Foreman does not return fullname of domains'), 1)
+        self.assertEqual(len(find(self.stub, 'locations', name='fra')), 1)
+        self.assertTrue(self.stub.requests > requests)
+
+    def test_reference_to_later_level(self):
+        # Media are created at a later level than operating systems
+        config = {'operatingsystems': [{'name': 'CoreOS', 'media': ['m1']}],
+                  'media': [{'name': 'm1', 'path': 'http://mirror.example.com/coreos'}]}
+        actions, output = self.run_config(config, dry_run=True)
+        self.assertIn('(medium m1 after apply)', output)
+
+        actions, output = self.run_config(config)
+        self.assertNotIn('Error', output)
+        self.assertEqual(find(self.stub, 'operatingsystems', name='CoreOS')[0]['medium_ids'],
+                         [find(self.stub, 'media', name='m1')[0]['id']])
+
+        actions, output = self.run_config(config)
+        self.assertIn('No changes.', output)
+
+    def test_delete_nested(self):
+        self.run_config({'hostgroups': [{'name': 'web', 'parent': 'hostgroup001'},
+                                        {'name': 'app', 'parent': 'hostgroup001/web'}]})
+        # Children are deleted before their parents, also when listed first
+        actions, output = self.run_config({'hostgroups': [{'name': 'web', 'parent': 'hostgroup001',
+                                                           'state': 'absent'},
+                                                          {'name': 'app', 'parent': 'hostgroup001/web',
+                                                           'state': 'absent'}]})
+        self.assertEqual([action['action'] for action in actions], ['delete', 'delete'])
+        self.assertNotIn('Error', output)
+        self.assertEqual(find(self.stub, 'hostgroups', name='web'), [])
+        self.assertEqual(find(self.stub, 'hostgroups', name='app'), [])
+
+    def test_unknown_reference(self):
+        actions, output = self.run_config({'hostgroups': [{'name': 'web', 'domain': 'missing.example.com'}]})
+        self.assertEqual(actions[0]['action'], 'error')
+        self.assertIn('missing.example.com', actions[0]['error'])
+        self.assertEqual(find(self.stub, 'hostgroups', name='web'), [])
+
+    def test_unknown_state(self):
+        actions, _ = self.run_config({'domains': [{'name': 'dom001.example.com', 'state': 'gone'}]})
+        self.assertEqual(actions[0]['action'], 'error')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pickle
+import unittest
+
+from foreman.records import Record, RecordFactory, project
+from support import StubTestCase
+
+
+class TestRecord(unittest.TestCase):
+
+    def setUp(self):
+        self.record = RecordFactory()({'id': 1, 'name': 'web01', 'comment': None})
+
+    def test_dict_access(self):
+        self.assertEqual(self.record['name'], 'web01')
+        self.assertEqual(self.record.get('comment', 'x'), None)
+        self.assertEqual(self.record.get('missing', 'x'), 'x')
+        self.assertRaises(KeyError, lambda: self.record['missing'])
+        self.assertTrue('id' in self.record)
+        self.assertFalse('missing' in self.record)
+        self.assertEqual(sorted(self.record), ['comment', 'id', 'name'])
+        self.assertEqual(sorted(self.record.keys()), ['comment', 'id', 'name'])
+        self.assertEqual(sorted(self.record.items()), [('comment', None), ('id', 1), ('name', 'web01')])
+        self.assertEqual(len(self.record), 3)
+
+    def test_attribute_access(self):
+        self.assertEqual(self.record.id, 1)
+        self.assertEqual(self.record.comment, None)
+        self.assertRaises(AttributeError, getattr, self.record, 'missing')
+
+    def test_to_dict(self):
+        self.assertEqual(self.record.to_dict(), {'id': 1, 'name': 'web01', 'comment': None})
+        self.assertEqual(self.record, {'id': 1, 'name': 'web01', 'comment': None})
+        self.assertNotEqual(self.record, {'id': 1})
+
+    def test_read_only(self):
+        self.assertRaises(AttributeError, setattr, self.record, 'name', 'web02')
+        self.assertRaises(TypeError, hash, self.record)
+
+    def test_pickle(self):
+        record = pickle.loads(pickle.dumps(self.record))
+        self.assertTrue(isinstance(record, Record))
+        self.assertEqual(record, self.record)
+
+
+class TestRecordFactory(unittest.TestCase):
+
+    def test_shared_schema_and_values(self):
+        factory = RecordFactory()
+        first = factory({'id': 1, 'domain': ''.join(['example', '.com'])})
+        second = factory({'id': 2, 'domain': ''.join(['example', '.com'])})
+        self.assertTrue(first._schema is second._schema)
+        self.assertTrue(first.domain is second.domain)
+
+    def test_max_interned(self):
+        factory = RecordFactory(max_interned=1)
+        factory({'name': 'a'})
+        record = factory({'name': ''.join(['b', 'c'])})
+        self.assertEqual(record.name, 'bc')
+        self.assertEqual(len(factory._interned), 1)
+
+    def test_fields(self):
+        factory = RecordFactory(fields=['name', 'id', 'missing'])
+        record = factory({'id': 1, 'name': 'web01', 'comment': None})
+        self.assertEqual(record.keys(), ['name', 'id'])
+        self.assertEqual(record.to_dict(), {'id': 1, 'name': 'web01'})
+
+    def test_project(self):
+        self.assertEqual(project({'id': 1, 'name': 'web01'}, ['name', 'missing']), {'name': 'web01'})
+
+
+class TestResourceRecords(StubTestCase):
+
+    def setUp(self):
+        StubTestCase.setUp(self)
+        self.foreman = self.create_foreman()
+
+    def test_records(self):
+        hosts = self.foreman.get_resources(resource_type='hosts', records=True, fields=['id', 'name'])
+        self.assertEqual(len(hosts), 30)
+        self.assertTrue(all(isinstance(host, Record) for host in hosts))
+        self.assertEqual(hosts[0].to_dict(), {'id': 1, 'name': self.stub.data['hosts'][0]['name']})
+
+    def test_fields(self):
+        hosts = self.foreman.get_resources(resource_type='hosts', fields=['id', 'domain_id'])
+        self.assertEqual(hosts[1], {'id': 2, 'domain_id': self.stub.data['hosts'][1]['domain_id']})
+
+    def test_factory(self):
+        factory = RecordFactory()
+        hosts = self.foreman.get_resources(resource_type='hosts', records=factory)
+        domains = self.foreman.get_resources(resource_type='domains', records=factory)
+        self.assertEqual(hosts[0], self.stub.data['hosts'][0])
+        # Values are shared between the calls using one factory
+        self.assertTrue(hosts[0].domain_name is [domain for domain in domains
+                                                 if domain.id == hosts[0].domain_id][0].name)
+
+    def test_factory_with_fields(self):
+        factory = RecordFactory()
+        hosts = self.foreman.get_resources(resource_type='hosts', records=factory, fields=['id', 'name'])
+        self.assertEqual(sorted(hosts[0].keys()), ['id', 'name'])
+        factory = RecordFactory(fields=['id', 'name', 'ip'])
+        hosts = self.foreman.get_resources(resource_type='hosts', records=factory, fields=['name', 'ip', 'mac'])
+        self.assertEqual(sorted(hosts[0].keys()), ['ip', 'name'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import shutil
+import tempfile
+import unittest
+
+from foreman.backup import ForemanBackup
+from foreman.foreman import FOREMAN_RESOURCES
+from foreman.restore import ForemanRestore
+from support import StubTestCase, find, text_output
+
+RESOURCES = ['domains', 'hostgroups', 'hosts', 'locations', 'organizations']
+
+
+class TestRestore(StubTestCase):
+
+    def setUp(self):
+        StubTestCase.setUp(self)
+        self.target = self.start_stub(hosts=0)
+        self.backup_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.backup_dir)
+
+    def backup(self):
+        backup = ForemanBackup(*self.connection(), protocol='http', concurrency=4, resource_concurrency=2,
+                               output=text_output())
+        return backup.run(backup_root=self.backup_dir, resources=RESOURCES)
+
+    def restore(self):
+        restore = ForemanRestore(*self.connection(self.target), protocol='http', concurrency=4,
+                                 output=text_output())
+        return restore.run(backup_root=self.backup_dir, resources=RESOURCES), restore
+
+    def add_nested(self, stub, resource_type, parent_name, name):
+        parent = find(stub, resource_type, name=parent_name)
+        item = {'name': name}
+        if parent:
+            item['parent_id'] = parent[0]['id']
+        stub.dispatch('POST', [resource_type], {}, {FOREMAN_RESOURCES[resource_type]: item})
+
+    def test_round_trip(self):
+        self.add_nested(self.stub, 'locations', None, 'eu')
+        self.add_nested(self.stub, 'locations', 'eu', 'fra')
+        self.add_nested(self.stub, 'organizations', 'organization001', 'ops')
+        # The target lacks domain 1, it is created with another id
+        self.target.dispatch('DELETE', ['domains', '1'], {}, {})
+
+        errors = self.backup()
+        self.assertEqual(errors, [])
+        errors, restore = self.restore()
+        self.assertEqual(errors, [])
+
+        fra = find(self.target, 'locations', name='fra')[0]
+        self.assertEqual(fra['title'], 'eu/fra')
+        self.assertEqual(fra['parent_id'], find(self.target, 'locations', name='eu')[0]['id'])
+        self.assertEqual(find(self.target, 'organizations', name='ops')[0]['title'], 'organization001/ops')
+
+        domain_id = find(self.target, 'domains', name='dom001.example.com')[0]['id']
+        self.assertNotEqual(domain_id, 1)
+        self.assertEqual(restore.id_map['domains']['1'], domain_id)
+        self.assertEqual(len(self.target.data['hosts']), 30)
+        for host in find(self.stub, 'hosts', domain_id=1):
+            self.assertEqual(find(self.target, 'hosts', name=host['name'])[0]['domain_id'], domain_id)
+
+        # Restoring again updates the existing resources
+        requests = self.target.requests
+        errors, restore = self.restore()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(find(self.target, 'locations', name='fra')), 1)
+        self.assertEqual(len(self.target.data['hosts']), 30)
+        self.assertTrue(self.target.requests > requests)
+
+
+if __name__ == '__main__':
+    unittest.main()
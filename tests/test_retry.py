@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import email.utils
+import time
+import unittest
+
+from foreman.retry import RetryPolicy, parse_retry_after
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_retryable(self):
+        policy = RetryPolicy(max_retries=2)
+        self.assertTrue(policy.is_retryable('GET', attempt=0))
+        self.assertTrue(policy.is_retryable('get', attempt=1, status_code=503))
+        self.assertFalse(policy.is_retryable('GET', attempt=2, status_code=503))
+        self.assertFalse(policy.is_retryable('GET', attempt=0, status_code=404))
+        self.assertFalse(policy.is_retryable('POST', attempt=0, status_code=503))
+
+    def test_methods(self):
+        policy = RetryPolicy(methods=['GET', 'put'])
+        self.assertTrue(policy.is_retryable('PUT', attempt=0, status_code=502))
+        self.assertFalse(policy.is_retryable('DELETE', attempt=0, status_code=502))
+
+    def test_disabled(self):
+        self.assertFalse(RetryPolicy(max_retries=0).is_retryable('GET', attempt=0))
+
+    def test_backoff(self):
+        policy = RetryPolicy(backoff_factor=0.5, max_backoff=3, jitter=False)
+        self.assertEqual([policy.get_delay(attempt) for attempt in range(5)], [0.5, 1.0, 2.0, 3, 3])
+
+    def test_jitter(self):
+        policy = RetryPolicy(backoff_factor=1, max_backoff=30)
+        for _ in range(100):
+            delay = policy.get_delay(3)
+            self.assertTrue(0 <= delay <= 8)
+
+    def test_retry_after(self):
+        policy = RetryPolicy(jitter=False, max_retry_after=60)
+        self.assertEqual(policy.get_delay(0, retry_after='7'), 7.0)
+        self.assertEqual(policy.get_delay(0, retry_after='600'), 60)
+        self.assertEqual(policy.get_delay(1, retry_after='soon'), 1.0)
+
+    def test_ignore_retry_after(self):
+        policy = RetryPolicy(jitter=False, respect_retry_after=False)
+        self.assertEqual(policy.get_delay(0, retry_after='7'), 0.5)
+
+
+class TestParseRetryAfter(unittest.TestCase):
+
+    def test_seconds(self):
+        self.assertEqual(parse_retry_after('3'), 3.0)
+        self.assertEqual(parse_retry_after('-3'), 0.0)
+
+    def test_date(self):
+        delay = parse_retry_after(email.utils.formatdate(time.time() + 30, usegmt=True))
+        self.assertTrue(28 <= delay <= 30, delay)
+        self.assertEqual(parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0.0)
+
+    def test_invalid(self):
+        self.assertIsNone(parse_retry_after('soon'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import unittest
+
+try:
+    from urllib import quote
+except ImportError:
+    from urllib.parse import quote
+
+from foreman.foreman import ForemanBase
+from foreman.search import Condition, Expression, SearchQuery, build_search, quote_value
+
+
+class TestQuoteValue(unittest.TestCase):
+
+    def test_string(self):
+        self.assertEqual(quote_value('host01'), '"host01"')
+
+    def test_escape(self):
+        self.assertEqual(quote_value('a "b" \\c'), '"a \\"b\\" \\\\c"')
+
+    def test_bool(self):
+        self.assertEqual(quote_value(True), 'true')
+        self.assertEqual(quote_value(False), 'false')
+
+    def test_integer(self):
+        self.assertEqual(quote_value(5), '5')
+        self.assertEqual(quote_value(2 ** 70), '1180591620717411303424')
+
+    def test_float(self):
+        self.assertEqual(quote_value(0.1), '0.1')
+
+    def test_other(self):
+        self.assertEqual(quote_value(None), '"None"')
+
+    def test_non_ascii(self):
+        self.assertEqual(quote_value(u'caf\xe9'), u'"caf\xe9"')
+        self.assertEqual(quote_value(u'caf\xe9'.encode('utf-8')), u'"caf\xe9"')
+
+
+class TestCondition(unittest.TestCase):
+
+    def test_compare(self):
+        self.assertEqual(str(Condition('name', '=', 'host01')), 'name = "host01"')
+        self.assertEqual(str(Condition('id', '>', 10)), 'id > 10')
+
+    def test_none(self):
+        self.assertEqual(str(Condition('comment', '=', None)), 'null? comment')
+        self.assertEqual(str(Condition('comment', '!=', None)), 'set? comment')
+        self.assertEqual(str(Condition('comment', 'set?')), 'set? comment')
+
+    def test_in(self):
+        self.assertEqual(str(Condition('id', '^', [1, 2])), 'id ^ (1, 2)')
+        self.assertEqual(str(Condition('name', '!^', ['a'])), 'name !^ ("a")')
+
+    def test_unknown_operator(self):
+        self.assertRaises(ValueError, Condition, 'name', 'like', 'a')
+
+    def test_in_without_list(self):
+        self.assertRaises(ValueError, Condition, 'id', '^')
+        self.assertRaises(ValueError, Condition, 'name', '!^', 'web01')
+        self.assertEqual(str(Condition('id', '^', set([3]))), 'id ^ (3)')
+
+    def test_expressions(self):
+        group = Condition('a', '=', 1) | Condition('b', '=', 2)
+        self.assertTrue(isinstance(group, Expression))
+        self.assertFalse(isinstance(group, Condition))
+        self.assertFalse(isinstance(~group, Condition))
+        self.assertEqual(str(~group & Condition('c', '=', 3)), 'not (a = 1 or b = 2) and c = 3')
+
+    def test_combine(self):
+        query = (Condition('name', '~', 'web') | Condition('hostgroup', '=', 'Base')) & ~Condition('build', '=', True)
+        self.assertEqual(str(query), '(name ~ "web" or hostgroup = "Base") and not (build = true)')
+
+    def test_flatten(self):
+        query = Condition('a', '=', 1) & Condition('b', '=', 2) & Condition('c', '=', 3)
+        self.assertEqual(str(query), 'a = 1 and b = 2 and c = 3')
+
+    def test_double_negation(self):
+        condition = Condition('a', '=', 1)
+        self.assertIs(~~condition, condition)
+
+
+class TestSearchQuery(unittest.TestCase):
+
+    def test_where(self):
+        query = SearchQuery().where('name', '~', 'web').where('build', '=', False).order_by('name', descending=True)
+        self.assertEqual(str(query), 'name ~ "web" and build = false')
+        self.assertEqual(query.order, 'name DESC')
+
+    def test_empty(self):
+        self.assertEqual(str(SearchQuery()), '')
+
+    def test_page_settings(self):
+        foreman = ForemanBase('foreman.example.com', '443')
+        query = SearchQuery(Condition('name', '=', 'a'), order='id ASC').limit(500)
+        self.assertEqual(foreman._get_search(query, per_page=20, order='name'), ('name = "a"', 500, 'id ASC'))
+        self.assertEqual(foreman._get_search(None, per_page=20, order='name'), (None, 20, 'name'))
+
+
+class TestBuildSearch(unittest.TestCase):
+
+    def test_dict(self):
+        self.assertEqual(build_search({'name': 'a'}), 'name = "a"')
+        self.assertEqual(build_search({'name': 'a', 'domain_id': 3}), 'domain_id = 3 and name = "a"')
+
+    def test_list(self):
+        self.assertEqual(build_search({'id': [1, 2]}), 'id ^ (1, 2)')
+
+    def test_string(self):
+        self.assertEqual(build_search('name ~ web'), 'name ~ web')
+        self.assertEqual(build_search(None), '')
+
+    def test_non_ascii(self):
+        self.assertEqual(build_search({'name': u'caf\xe9'}), u'name = "caf\xe9"')
+        self.assertEqual(build_search({'name': [u'caf\xe9', 'a'], 'id': 1}), u'id = 1 and name ^ ("caf\xe9", "a")')
+        query = SearchQuery(Condition('name', '=', u'caf\xe9') | Condition('name', '=', 'a'))
+        self.assertEqual(build_search(query), u'name = "caf\xe9" or name = "a"')
+        self.assertEqual(str(query), u'name = "caf\xe9" or name = "a"'.encode('utf-8')
+                         if sys.version_info[0] == 2 else u'name = "caf\xe9" or name = "a"')
+
+
+class TestBatchSearches(unittest.TestCase):
+
+    def setUp(self):
+        self.foreman = ForemanBase('foreman.example.com', '443')
+
+    def test_single(self):
+        self.assertEqual(self.foreman._get_batch_searches('name', ['a', 'b']), [('name ^ ("a", "b")', 2)])
+
+    def test_split(self):
+        values = ['host%04d.example.com' % number for number in range(500)]
+        searches = self.foreman._get_batch_searches('name', values, max_search_length=1000)
+        self.assertTrue(len(searches) > 1)
+        self.assertEqual(sum(count for _, count in searches), len(values))
+        for search, _ in searches:
+            self.assertTrue(len(quote(search)) <= 1000)
+        self.assertEqual(searches[0][0].split(', ')[0], 'name ^ ("host0000.example.com"')
+
+    def test_value_longer_than_limit(self):
+        searches = self.foreman._get_batch_searches('name', ['a' * 50, 'b'], max_search_length=20)
+        self.assertEqual([count for _, count in searches], [1, 1])
+
+    def test_empty(self):
+        self.assertEqual(self.foreman._get_batch_searches('name', []), [])
+
+    def test_non_ascii(self):
+        searches = self.foreman._get_batch_searches('name', [u'caf\xe9', u'na\xefve'], max_search_length=40)
+        self.assertEqual(searches, [(u'name ^ ("caf\xe9")', 1), (u'name ^ ("na\xefve")', 1)])
+
+    def test_add_search_results(self):
+        values = [u'caf\xe9', 5]
+        resources = {}
+        self.foreman._add_search_results('domains', 'name', self.foreman._get_value_map(values),
+                                         [{'id': 1, 'name': u'caf\xe9'}, {'id': 2, 'name': 5},
+                                          {'id': 3, 'name': 'other'}], resources)
+        self.assertEqual(resources, {u'caf\xe9': {'id': 1, 'name': u'caf\xe9'}, 5: {'id': 2, 'name': 5}})
+
+
+if __name__ == '__main__':
+    unittest.main()
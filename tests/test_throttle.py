@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+
+from foreman.throttle import RequestGovernor, TokenBucket, clock
+from support import StubTestCase
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_burst(self):
+        bucket = TokenBucket(rate=10, burst=3)
+        self.assertEqual([bucket.reserve() for _ in range(3)], [0.0, 0.0, 0.0])
+        delay = bucket.reserve()
+        self.assertTrue(0.05 < delay <= 0.1, delay)
+
+    def test_waiting_requests_queue_up(self):
+        bucket = TokenBucket(rate=10, burst=1)
+        bucket.reserve()
+        first = bucket.reserve()
+        second = bucket.reserve()
+        self.assertTrue(second - first > 0.09, (first, second))
+
+    def test_default_burst(self):
+        self.assertEqual(TokenBucket(rate=0.5).burst, 1.0)
+        self.assertEqual(TokenBucket(rate=20).burst, 20.0)
+
+    def test_acquire(self):
+        bucket = TokenBucket(rate=100, burst=1)
+        bucket.acquire()
+        start = clock()
+        bucket.acquire()
+        self.assertTrue(clock() - start >= 0.005)
+
+
+class TestRequestGovernor(unittest.TestCase):
+
+    def test_no_limits(self):
+        governor = RequestGovernor()
+        for _ in range(100):
+            with governor.limit('GET'):
+                pass
+        self.assertEqual(governor.stats()['requests'], 100)
+        self.assertEqual(governor.stats()['throttled'], 0)
+
+    def test_max_in_flight(self):
+        governor = RequestGovernor(max_in_flight=2)
+        self.assertTrue(governor.acquire('GET', start=clock(), blocking=False))
+        self.assertTrue(governor.acquire('PUT', start=clock(), blocking=False))
+        self.assertFalse(governor.acquire('GET', start=clock(), blocking=False))
+        self.assertEqual(governor.stats()['in_flight'], 2)
+        governor.release('GET')
+        self.assertTrue(governor.acquire('GET', start=clock(), blocking=False))
+
+    def test_write_limit(self):
+        governor = RequestGovernor(verb_limits={'write': {'max_in_flight': 1}})
+        self.assertTrue(governor.acquire('POST', start=clock(), blocking=False))
+        # All write verbs share one slot, reads are not limited
+        self.assertFalse(governor.acquire('DELETE', start=clock(), blocking=False))
+        self.assertTrue(governor.acquire('GET', start=clock(), blocking=False))
+        governor.release('POST')
+        self.assertTrue(governor.acquire('put', start=clock(), blocking=False))
+
+    def test_listener(self):
+        governor = RequestGovernor(max_in_flight=1)
+        released = []
+        governor.add_listener(lambda: released.append(governor.acquire('GET', start=clock(), blocking=False)))
+        governor.wait('GET')
+        governor.release('GET')
+        # The slot is free again when the listener is called
+        self.assertEqual(released, [True])
+
+    def test_remove_listener(self):
+        governor = RequestGovernor()
+        released = []
+        governor.add_listener(released.append)
+        governor.remove_listener(released.append)
+        with governor.limit('GET'):
+            pass
+        self.assertEqual(released, [])
+
+    def test_failed_acquire_keeps_other_slots(self):
+        governor = RequestGovernor(max_in_flight=1, verb_limits={'write': {'max_in_flight': 2}})
+        self.assertTrue(governor.acquire('GET', start=clock(), blocking=False))
+        self.assertFalse(governor.acquire('POST', start=clock(), blocking=False))
+        governor.release('GET')
+        self.assertTrue(governor.acquire('POST', start=clock(), blocking=False))
+        self.assertFalse(governor.acquire('POST', start=clock(), blocking=False))
+
+    def test_rate_and_weights(self):
+        governor = RequestGovernor(rate=10, burst=3, weights={'POST': 3})
+        self.assertEqual(governor.reserve('POST'), 0.0)
+        self.assertTrue(governor.reserve('GET') > 0.05)
+
+    def test_throttled_stats(self):
+        governor = RequestGovernor(rate=50, burst=1)
+        for _ in range(3):
+            with governor.limit('GET'):
+                pass
+        stats = governor.stats()
+        self.assertEqual(stats['requests'], 3)
+        self.assertEqual(stats['throttled'], 2)
+        self.assertTrue(stats['wait_time'] > 0.02)
+        self.assertEqual(stats['in_flight'], 0)
+
+
+class TestGovernedForeman(StubTestCase):
+    hosts = 50
+
+    def test_request_while_iterating_stream(self):
+        governor = RequestGovernor(max_in_flight=1)
+        foreman = self.create_foreman(stream_decode=True, governor=governor)
+        names = []
+
+        def run():
+            for host in foreman.get_hosts(stream=True, per_page=20):
+                names.append(foreman.get_resource('hosts', data={'id': host['id']})['name'])
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive(), 'nested request blocked by the streamed page')
+        self.assertEqual(len(names), 50)
+        self.assertEqual(governor.stats()['in_flight'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
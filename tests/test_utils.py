@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from foreman.foreman import ForemanError
+from foreman.utils import ErrorSummary, replace_file
+from support import text_output
+
+
+class TestReplaceFile(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as target:
+            target.write(content)
+        return path
+
+    def test_replace(self):
+        path = self.write('data.json', 'old')
+        replace_file(self.write('data.json.tmp', 'new'), path)
+        with open(path) as source:
+            self.assertEqual(source.read(), 'new')
+        self.assertEqual(os.listdir(self.directory), ['data.json'])
+
+    def test_new_file(self):
+        path = os.path.join(self.directory, 'data.json')
+        replace_file(self.write('data.json.tmp', 'new'), path)
+        self.assertTrue(os.path.exists(path))
+
+
+class Summary(ErrorSummary):
+
+    def __init__(self):
+        self.output = text_output()
+        self.errors = []
+        self._lock = threading.Lock()
+
+
+class TestErrorSummary(unittest.TestCase):
+
+    def test_errors(self):
+        summary = Summary()
+        summary._add_error('hosts', {'id': 3, 'name': 'web01'},
+                           ForemanError(url='/api/v2/hosts/3', request=None, status_code=422, message='Invalid'))
+        summary._add_error('domains', None, ValueError('Broken file'))
+        self.assertEqual(summary.errors, [{'resource': 'hosts', 'id': 3, 'name': 'web01', 'error': 'Invalid (422)'},
+                                          {'resource': 'domains', 'id': None, 'name': None, 'error': 'Broken file'}])
+        summary.print_summary()
+        self.assertEqual(summary.output.getvalue(), 'Errors: 2\n'
+                                                    '  hosts web01 (id 3): Invalid (422)\n'
+                                                    '  domains None (id None): Broken file\n')
+
+    def test_no_errors(self):
+        summary = Summary()
+        summary.print_summary()
+        self.assertEqual(summary.output.getvalue(), '')
+
+
+if __name__ == '__main__':
+    unittest.main()